@@ -0,0 +1,101 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# bench_commands.py - Microbenchmark of GameState.handle_command throughput
+#
+# Feeds a noisy channel mix (plain chatter, unknown !verbs, out-of-turn
+# commands and a real roll/robber/pass cycle) through one GameState and
+# reports commands/sec, overall and per message kind.
+#
+#   python benchmarks/bench_commands.py --messages 200000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from game import new_game
+
+PLAYERS = ["alice", "bob", "carol", "dave"]
+
+CHATTER = [
+    "hi all", "anyone got wood?", "gg", "brb", "lol that robber",
+    "!lol", "!help", "!hostinfo", "!wave everyone",
+]
+
+
+def started_game(seed):
+    game = new_game(seed=seed)
+    for nick in PLAYERS:
+        game.add_player(nick)
+    for nick in PLAYERS:
+        game.handle_command(nick, "!ready")
+    return game
+
+
+def game_message(game, rng):
+    """Next message a well-behaved current player would send."""
+    player = game.current_player()
+    if game.state == 'awaiting_roll':
+        return player, "!roll"
+    if game.state == 'awaiting_robber_move':
+        return player, "!robber 0,0,0"
+    if rng.random() < 0.3:
+        return player, "!build road {}".format(rng.randint(0, 71))
+    return player, "!pass"
+
+
+def run(messages, noise=0.8, seed=1):
+    rng = random.Random(seed)
+    game = started_game(seed)
+    kinds = {"chatter": [0, 0.0], "out-of-turn": [0, 0.0], "game": [0, 0.0]}
+    clock = time.time
+    handle = game.handle_command
+
+    for _ in range(messages):
+        roll = rng.random()
+        if roll < noise * 0.75:
+            kind = "chatter"
+            sender, msg = rng.choice(PLAYERS), rng.choice(CHATTER)
+        elif roll < noise:
+            kind = "out-of-turn"
+            sender = rng.choice([p for p in PLAYERS if p != game.current_player()])
+            msg = rng.choice(["!roll", "!pass", "!build road 3"])
+        else:
+            kind = "game"
+            sender, msg = game_message(game, rng)
+        start = clock()
+        handle(sender, msg)
+        elapsed = clock() - start
+        bucket = kinds[kind]
+        bucket[0] += 1
+        bucket[1] += elapsed
+
+    return kinds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GameState.handle_command.")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--noise", type=float, default=0.8,
+                        help="fraction of messages that are chatter or out-of-turn")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    kinds = run(args.messages, args.noise, args.seed)
+    total_n = sum(k[0] for k in kinds.values())
+    total_t = sum(k[1] for k in kinds.values())
+    print("handle_command: {} messages in {:.3f}s -> {:,.0f} commands/sec".format(
+        total_n, total_t, total_n / total_t if total_t else 0))
+    for name in sorted(kinds):
+        n, t = kinds[name]
+        if n:
+            print("  {:<12} {:>8} msgs  {:>12,.0f} /sec  {:.2f} us/msg".format(name, n, n / t, 1e6 * t / n))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# bench_hoststart.py - Time from "!start" to the first !host broadcast
+#
+# Compares the cold path (a fresh "python host.py"-style process that
+# imports, connects and registers) with assigning an idle host from
+# hostpool.HostPool, both against the in-process fake IRC server. The clock
+# starts when the client would act on !start and stops when an observer in
+# the lobby sees "!host <owner>".
+#
+#   python benchmarks/bench_hoststart.py --repeat 5
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import shutil
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from ircserver import FakeIRCServer
+from loadtest import LOBBY_CHANNEL, make_config
+
+# What host.py's main() does, pointed at the fake server
+COLD_HOST = """
+import sys, threading
+sys.path.insert(0, {root!r})
+sys.path.insert(0, {bench!r})
+from loadtest import make_config
+from host import Host
+host = Host(make_config({port}), {owner!r}, state_dir={state_dir!r})
+host.connect('127.0.0.1', {port}, 'HostBot_' + {owner!r})
+host.start()
+"""
+
+
+class LobbyWatcher(threading.Thread):
+    """Raw-socket lobby member that timestamps the first !host per owner."""
+
+    def __init__(self, port):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.seen = {}
+        self.cond = threading.Condition()
+        self.joined = threading.Event()
+        self.sock.sendall("NICK watcher\r\nUSER watcher 0 * :watcher\r\nJOIN {}\r\n".format(LOBBY_CHANNEL))
+
+    def run(self):
+        for line in self.sock.makefile('rb'):
+            if " JOIN " in line:
+                self.joined.set()
+            if " PRIVMSG {} :!host ".format(LOBBY_CHANNEL) in line:
+                owner = line.split(":!host ", 1)[1].split()[0]
+                with self.cond:
+                    self.seen.setdefault(owner, time.time())
+                    self.cond.notify_all()
+
+    def wait_for(self, owner, timeout=30):
+        deadline = time.time() + timeout
+        with self.cond:
+            while owner not in self.seen and time.time() < deadline:
+                self.cond.wait(0.05)
+            return self.seen.get(owner)
+
+
+def time_cold(port, watcher, owner, state_dir):
+    script = COLD_HOST.format(root=ROOT_DIR, bench=os.path.join(ROOT_DIR, 'benchmarks'),
+                              port=port, owner=owner, state_dir=state_dir)
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, "-c", script])
+    seen = watcher.wait_for(owner)
+    proc.terminate()
+    proc.wait()
+    return seen - start if seen else None
+
+
+def time_pooled(pool, watcher, owner):
+    start = time.time()
+    pool.assign(owner)
+    seen = watcher.wait_for(owner)
+    pool.release(owner)
+    return seen - start if seen else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time-to-lobby for cold and pooled hosts.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from hostpool import HostPool
+
+    server = FakeIRCServer().start()
+    watcher = LobbyWatcher(server.port)
+    watcher.start()
+    watcher.joined.wait(5)
+    state_dir = tempfile.mkdtemp(prefix='catan-hoststart-')
+    pool = HostPool(make_config(server.port), size=1, state_dir=state_dir)
+    pool.fill()
+    try:
+        cold, warm = [], []
+        for i in range(args.repeat):
+            cold.append(time_cold(server.port, watcher, "cold{}".format(i), state_dir))
+            time.sleep(0.5)  # Let the pool reconnect its idle host
+            warm.append(time_pooled(pool, watcher, "warm{}".format(i)))
+        for name, times in (("cold start", cold), ("pooled host", warm)):
+            done = sorted(t for t in times if t is not None)
+            if done:
+                print("  {:<12} median {:7.1f} ms  min {:7.1f} ms  ({} of {} reached the lobby)".format(
+                    name, 1000 * done[len(done) // 2], 1000 * done[0], len(done), len(times)))
+            else:
+                print("  {:<12} never reached the lobby".format(name))
+    finally:
+        server.stop()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# bench_map.py - Map construction and topology queries across radii
+#
+# Times HexMap.generate_default_map, build_nodes_and_edges,
+# get_boundary_nodes, find_surrounding_tiles_and_nodes (per call, over a
+# spread of edges), the verify_* / check_degenerate_edges checks and their
+# vectorized counterpart topocheck.verify_topology at radius 3, 10, 30 and
+# 100, and reports how much each step grew the peak RSS. Every radius runs
+# in a fresh interpreter so the memory numbers don't inherit the previous
+# radius' heap; with --repeat the best run counts.
+#
+# map_baseline.json holds the numbers to compare against. --check exits 1
+# when a step got slower or hungrier than its baseline by more than the
+# tolerances below; --update rewrites the baseline from this run. Baselines
+# are per machine: update them on the box that runs the check.
+#
+#   python benchmarks/bench_map.py --check
+#   python benchmarks/bench_map.py --radius 30 --repeat 5 --update
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+BASELINE_PATH = os.path.join(ROOT_DIR, 'benchmarks', 'map_baseline.json')
+
+RADII = (3, 10, 30, 100)
+STEPS = (
+    'generate_default_map',
+    'build_nodes_and_edges',
+    'get_boundary_nodes',
+    'find_surrounding_tiles_and_nodes',
+    'verify_node_id_consistency',
+    'verify_edge_id_consistency',
+    'check_degenerate_edges',
+    'verify_topology',
+)
+SURROUNDING_SAMPLES = 20  # Edges queried per radius; the time is per call
+
+TIME_TOLERANCE = 1.5      # Fail above baseline * tolerance ...
+TIME_FLOOR_MS = 1.0       # ... and more than this many ms over it
+MEMORY_TOLERANCE = 1.25
+MEMORY_FLOOR_KB = 1024
+
+
+class _QuietTerminal(object):
+    """The verify_* checks report through the curses terminal; drop it."""
+
+    def write(self, text):
+        pass
+
+
+def peak_rss_kb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+
+
+def run_case(radius):
+    """{step: {'ms': ..., 'peak_kb': ...}} for one radius, in this process."""
+    import numpy  # Loaded up front so verify_topology isn't charged for the import
+    import map as hexmap_module
+    from board import get_boundary_nodes
+    from topocheck import verify_topology
+    hexmap_module.terminal = _QuietTerminal()
+    hexmap = hexmap_module.HexMap()
+
+    def surrounding():
+        count = hexmap.edge_autoinc
+        edges = range(0, count, max(1, count // SURROUNDING_SAMPLES))[:SURROUNDING_SAMPLES]
+        for edge_id in edges:
+            hexmap_module.find_surrounding_tiles_and_nodes(hexmap, edge_id)
+        return len(edges)
+
+    steps = {
+        'generate_default_map': lambda: hexmap.generate_default_map(radius),
+        'build_nodes_and_edges': hexmap.build_nodes_and_edges,
+        'get_boundary_nodes': lambda: get_boundary_nodes(hexmap),
+        'find_surrounding_tiles_and_nodes': surrounding,
+        'verify_node_id_consistency': lambda: hexmap_module.verify_node_id_consistency(hexmap),
+        'verify_edge_id_consistency': lambda: hexmap_module.verify_edge_id_consistency(hexmap),
+        'check_degenerate_edges': lambda: hexmap_module.check_degenerate_edges(hexmap),
+        'verify_topology': lambda: verify_topology(hexmap),
+    }
+    results = {}
+    for name in STEPS:
+        rss = peak_rss_kb()
+        start = time.time()
+        calls = steps[name]()
+        elapsed = time.time() - start
+        if name != 'find_surrounding_tiles_and_nodes':
+            calls = 1
+        results[name] = {'ms': round(1000 * elapsed / calls, 3), 'peak_kb': peak_rss_kb() - rss}
+    results['total_peak_kb'] = peak_rss_kb()
+    return results
+
+
+def measure(radius, repeat):
+    """Best of repeat fresh-interpreter runs of run_case(radius)."""
+    best = None
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", str(radius)])
+        result = json.loads(out.splitlines()[-1])
+        if best is None:
+            best = result
+            continue
+        for name in STEPS:
+            for key in ('ms', 'peak_kb'):
+                best[name][key] = min(best[name][key], result[name][key])
+        best['total_peak_kb'] = min(best['total_peak_kb'], result['total_peak_kb'])
+    return best
+
+
+def regressions(radius, result, baseline):
+    problems = []
+    for name in STEPS:
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ms, kb = result[name]['ms'], result[name]['peak_kb']
+        if ms > base['ms'] * TIME_TOLERANCE and ms - base['ms'] > TIME_FLOOR_MS:
+            problems.append("radius {} {}: {:.1f} ms, baseline {:.1f} ms".format(radius, name, ms, base['ms']))
+        if kb > base['peak_kb'] * MEMORY_TOLERANCE and kb - base['peak_kb'] > MEMORY_FLOOR_KB:
+            problems.append("radius {} {}: +{} KB peak, baseline +{} KB".format(radius, name, kb, base['peak_kb']))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark map construction and topology queries.")
+    parser.add_argument("--radius", type=int, action="append", help="radius to run (default: {})".format(
+        ", ".join(str(r) for r in RADII)))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="exit 1 on a regression against the baseline")
+    parser.add_argument("--update", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_case(args.child)))
+        return
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baselines = json.load(f)
+
+    problems = []
+    for radius in args.radius or RADII:
+        result = measure(radius, args.repeat)
+        print("radius {} (peak RSS {:,} KB)".format(radius, result['total_peak_kb']))
+        for name in STEPS:
+            print("  {:<34} {:>10.3f} ms  {:>+8,} KB".format(name, result[name]['ms'], result[name]['peak_kb']))
+        problems.extend(regressions(radius, result, baselines.get(str(radius), {})))
+        baselines[str(radius)] = result
+
+    for problem in problems:
+        print("REGRESSION: {}".format(problem))
+    if args.update:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baselines, f, indent=1, sort_keys=True, separators=(',', ': '))
+            f.write("\n")
+    if args.check and problems:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# bench_replay.py - Crash recovery timing for the per-game event log
+#
+# Plays a scripted game through GameState while logging it with GameLog,
+# then times restore() from the latest snapshot against a full replay of
+# the log from turn zero.
+#
+#   python benchmarks/bench_replay.py --turns 200
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from game import new_game
+from eventlog import GameLog
+
+PLAYERS = ["alice", "bob", "carol", "dave"]
+
+
+def play_logged_game(directory, turns, snapshot_interval, seed):
+    log = GameLog(directory, snapshot_interval)
+    game = new_game(seed=seed)
+    log.record_seed(game)
+
+    def command(nick, msg):
+        version = game.version
+        game.handle_command(nick, msg)
+        if game.version != version:
+            log.record_command(game, nick, msg)
+
+    for nick in PLAYERS:
+        game.add_player(nick)
+        log.record_join(game, nick)
+    for nick in PLAYERS:
+        command(nick, "!ready")
+    for _ in range(turns):
+        player = game.current_player()
+        command(player, "!roll")
+        if game.state == 'awaiting_robber_move':
+            command(player, "!robber 0,0,0")
+        command(player, "!build road 1")
+        command(player, "!pass")
+    log.close()
+    return game, log
+
+
+def time_restore(directory, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        GameLog(directory).restore()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark event log restore.")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--snapshot-interval", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='catan-replay-')
+    try:
+        game, log = play_logged_game(directory, args.turns, args.snapshot_interval, args.seed)
+        print("Logged {} events over {} turns ({} bytes of log)".format(
+            log.seq, args.turns, os.path.getsize(log.events_path)))
+        print("  restore from snapshot: {:.3f} ms".format(1000 * time_restore(directory, args.repeat)))
+        os.remove(log.snapshot_path)
+        print("  replay from turn zero: {:.3f} ms".format(1000 * time_restore(directory, args.repeat)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
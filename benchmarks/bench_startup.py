@@ -0,0 +1,134 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# bench_startup.py - Import-time profile and startup budget per entry point
+#
+# Imports each entry point module in a fresh interpreter with __import__
+# wrapped, and reports the total import time and the slowest modules
+# (cumulative, including what they import). Python 2.7 has no
+# "-X importtime", hence the hook. Entry points with a first-use step
+# (the host building its first game) have it timed as part of startup.
+#
+# startup_budget.json lists, per entry point, a time budget and modules
+# that must not be imported at startup (they have to stay lazy). With
+# --check the script exits 1 if any entry point breaks its budget.
+#
+#   python benchmarks/bench_startup.py --check
+#   python benchmarks/bench_startup.py --entry host --top 25
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(ROOT_DIR, 'benchmarks', 'startup_budget.json')
+
+# module -> statement run right after importing it, as part of startup
+ENTRY_POINTS = {
+    'client': None,
+    'host': 'host.new_game()',
+    'hostpool': None,
+    'bot': None,
+    'map': None,
+    'board': None,
+}
+
+# Runs in the child: time every first import of a module, then print JSON
+PROFILER = r"""
+import sys, time, json
+import __builtin__
+sys.path.insert(0, %(root)r)
+real_import = __builtin__.__import__
+stats = {}
+stack = []
+
+def timed_import(name, globals=None, locals=None, fromlist=None, level=-1):
+    before = set(sys.modules)
+    start = time.time()
+    stack.append(0.0)
+    try:
+        return real_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.time() - start
+        inner = stack.pop()
+        new = set(sys.modules) - before
+        if new:
+            key = name if name in sys.modules else sorted(new)[0]
+            stats[key] = (elapsed, elapsed - inner)
+            if stack:
+                stack[-1] += elapsed
+
+__builtin__.__import__ = timed_import
+start = time.time()
+import %(module)s
+imported = time.time()
+%(first_use)s
+total = time.time() - start
+__builtin__.__import__ = real_import
+print(json.dumps({'total': total, 'first_use': total - (imported - start),
+                  'modules': stats, 'loaded': sorted(sys.modules)}))
+"""
+
+
+def profile(module, repeat=3):
+    """Best of repeat fresh-interpreter imports of module."""
+    best = None
+    for _ in range(repeat):
+        script = PROFILER % {'root': ROOT_DIR, 'module': module, 'first_use': ENTRY_POINTS[module] or 'pass'}
+        out = subprocess.check_output([sys.executable, "-c", script])
+        result = json.loads(out.splitlines()[-1])
+        if best is None or result['total'] < best['total']:
+            best = result
+    return best
+
+
+def top_level(name):
+    return name.split('.')[0]
+
+
+def check(module, result, budget):
+    problems = []
+    limit = budget.get('max_ms')
+    if limit is not None and 1000 * result['total'] > limit:
+        problems.append("{:.1f} ms over the {} ms budget".format(1000 * result['total'], limit))
+    loaded = set(top_level(m) for m in result['loaded'])
+    for forbidden in budget.get('forbidden', []):
+        if forbidden in loaded:
+            problems.append("imports {} at startup".format(forbidden))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile import time of each entry point.")
+    parser.add_argument("--entry", action="append", choices=sorted(ENTRY_POINTS),
+                        help="entry point to profile (default: all)")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list per entry point")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="exit 1 if a budget in startup_budget.json is broken")
+    args = parser.parse_args()
+
+    with open(BUDGET_PATH) as f:
+        budgets = json.load(f)
+
+    failures = 0
+    for module in args.entry or sorted(ENTRY_POINTS):
+        result = profile(module, args.repeat)
+        first_use = ""
+        if ENTRY_POINTS[module]:
+            first_use = " (incl. {:.1f} ms for {})".format(1000 * result['first_use'], ENTRY_POINTS[module])
+        print("{}: {:.1f} ms{}, {} modules loaded".format(module, 1000 * result['total'], first_use, len(result['loaded'])))
+        slowest = sorted(result['modules'].items(), key=lambda item: -item[1][0])[:args.top]
+        for name, (cumulative, own) in slowest:
+            print("  {:>8.1f} ms cumulative {:>8.1f} ms own  {}".format(1000 * cumulative, 1000 * own, name))
+        problems = check(module, result, budgets.get(module, {}))
+        for problem in problems:
+            print("  BUDGET: {} {}".format(module, problem))
+        failures += len(problems)
+
+    if args.check and failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# loadtest.py - End-to-end load harness against the in-process fake IRC server
+#
+# Starts ircserver.FakeIRCServer, one child process per Host (N games, as
+# host.py runs them) and M scripted player bots that speak the same
+# lobby/game protocol as client.py. Reports !roll -> !rolled latency,
+# message throughput and host CPU per game, measured in each game's own
+# process.
+#
+#   python benchmarks/loadtest.py --hosts 4 --bots 12 --rolls 50
+
+import ConfigParser
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from ircserver import FakeIRCServer, FloodLimit
+
+LOBBY_CHANNEL = "#catan-lobby"
+
+
+def make_config(port, lobby=LOBBY_CHANNEL):
+    config = ConfigParser.ConfigParser()
+    config.add_section('irc')
+    config.set('irc', 'server', '127.0.0.1')
+    config.set('irc', 'port', str(port))
+    config.set('irc', 'channel', lobby)
+    config.set('irc', 'ssl', 'False')
+    return config
+
+
+def run_host(port, owner, pipe):
+    """Child process: run owner's Host, report its CPU between start/stop."""
+    from host import Host
+
+    config = make_config(port)
+    state_dir = tempfile.mkdtemp(prefix='catan-loadtest-')
+    host = Host(config, owner, state_dir=state_dir)
+    host.log_path = os.devnull
+    host.connect('127.0.0.1', port, "HostBot_{}".format(owner))
+    thread = threading.Thread(target=host.start)
+    thread.daemon = True
+    thread.start()
+    pipe.send("ready")
+    pipe.recv()
+    start = os.times()
+    pipe.recv()
+    end = os.times()
+    pipe.send((end[0] - start[0]) + (end[1] - start[1]))
+    pipe.close()
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os._exit(0)
+
+
+class GameStats(object):
+    def __init__(self, owner):
+        self.owner = owner
+        self.lock = threading.Lock()
+        self.rolls = 0
+        self.latencies = []
+
+    def record_roll(self, latency):
+        with self.lock:
+            self.rolls += 1
+            self.latencies.append(latency)
+
+
+class ScriptedPlayer(threading.Thread):
+    """Raw-socket bot: joins the lobby, asks the host for an invite, readies
+    up once every seat is filled and then rolls/passes on each of its turns."""
+
+    def __init__(self, nick, owner, seats, port, stats):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.nick = nick
+        self.owner = owner
+        self.host_nick = "HostBot_{}".format(owner)
+        self.game_channel = "&catan-game-{}".format(owner)
+        self.seats = seats
+        self.port = port
+        self.stats = stats
+        self.members = set()
+        self.join_requested = False
+        self.readied = False
+        self.current = None
+        self.roll_sent_at = None
+        self.running = True
+
+    def send(self, line):
+        self.sock.sendall(line + "\r\n")
+
+    def say(self, channel, text):
+        self.send("PRIVMSG {} :{}".format(channel, text))
+
+    def run(self):
+        self.sock = socket.create_connection(('127.0.0.1', self.port))
+        reader = self.sock.makefile('rb')
+        self.send("NICK {}".format(self.nick))
+        self.send("USER {0} 0 * :{0}".format(self.nick))
+        try:
+            while self.running:
+                line = reader.readline()
+                if not line:
+                    break
+                self.handle_line(line.rstrip("\r\n"))
+        except socket.error:
+            pass
+
+    def stop(self):
+        self.running = False
+        try:
+            self.send("QUIT :load test finished")
+            self.sock.close()
+        except socket.error:
+            pass
+
+    def handle_line(self, line):
+        source = ""
+        if line.startswith(":"):
+            source, line = line[1:].split(" ", 1)
+        if " :" in line:
+            head, trailing = line.split(" :", 1)
+            params = head.split() + [trailing]
+        else:
+            params = line.split()
+        command, params = params[0], params[1:]
+        sender = source.split("!", 1)[0]
+
+        if command == "001":
+            self.send("JOIN {}".format(LOBBY_CHANNEL))
+        elif command == "PING":
+            self.send("PONG :{}".format(params[-1]))
+        elif command == "INVITE" and params[-1] == self.game_channel:
+            self.send("JOIN {}".format(self.game_channel))
+        elif command == "353" and params[2] == self.game_channel:
+            self.members.update(n.lstrip("@+") for n in params[3].split())
+            self.check_seats()
+        elif command == "JOIN" and params[0] == self.game_channel:
+            self.members.add(sender)
+            self.check_seats()
+        elif command == "PRIVMSG":
+            self.handle_message(sender, params[0], params[1])
+
+    def check_seats(self):
+        players = self.members - set([self.host_nick])
+        if not self.readied and len(players) >= self.seats:
+            self.readied = True
+            self.say(self.game_channel, "!ready")
+
+    def handle_message(self, sender, channel, msg):
+        if channel == LOBBY_CHANNEL:
+            if sender == self.host_nick and not self.join_requested and msg.startswith("!host "):
+                self.join_requested = True
+                self.say(LOBBY_CHANNEL, "!join {}".format(self.owner))
+            return
+        if channel != self.game_channel or sender != self.host_nick:
+            return
+
+        parts = msg.split()
+        verb = parts[0]
+        if verb == "!turn":
+            self.current = parts[1]
+            if self.current == self.nick:
+                self.roll_sent_at = time.time()
+                self.say(self.game_channel, "!roll")
+        elif self.current != self.nick:
+            return
+        elif verb == "!rolled" and self.roll_sent_at is not None:
+            self.stats.record_roll(time.time() - self.roll_sent_at)
+            self.roll_sent_at = None
+        elif verb == "!robber":
+            self.say(self.game_channel, "!robber 0,0,0")
+        elif verb in ("!resources-distributed", "!robber-moved"):
+            self.say(self.game_channel, "!pass")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def wait_for(predicate, timeout, interval=0.05):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+def run_load_test(hosts=2, bots=4, rolls=50, timeout=120.0, flood_limit=None):
+    seats = bots // hosts
+    if seats < 2:
+        raise ValueError("need at least two bots per host")
+
+    server = FakeIRCServer(flood_limit=flood_limit).start()
+    owners = ["load{}".format(i) for i in range(hosts)]
+
+    children = []
+    for owner in owners:
+        parent_pipe, child_pipe = multiprocessing.Pipe()
+        child = multiprocessing.Process(target=run_host, args=(server.port, owner, child_pipe))
+        child.start()
+        children.append((child, parent_pipe))
+    for _, pipe in children:
+        pipe.recv()
+
+    host_nicks = set("HostBot_{}".format(o) for o in owners)
+
+    def hosts_in_lobby():
+        with server.lock:
+            members = server.channels.get(LOBBY_CHANNEL, ())
+            return host_nicks <= set(m.nick for m in members)
+    if not wait_for(hosts_in_lobby, timeout):
+        raise RuntimeError("hosts did not reach the lobby")
+
+    games = [GameStats(owner) for owner in owners]
+    players = []
+    for g, stats in enumerate(games):
+        for seat in range(seats):
+            players.append(ScriptedPlayer("bot{}_{}".format(g, seat), stats.owner, seats, server.port, stats))
+
+    for _, pipe in children:
+        pipe.send("start")
+    stats_before = server.snapshot_stats()
+    started = time.time()
+    for player in players:
+        player.start()
+
+    finished = wait_for(lambda: all(s.rolls >= rolls for s in games), timeout)
+    elapsed = time.time() - started
+    stats_after = server.snapshot_stats()
+    for _, pipe in children:
+        pipe.send("stop")
+    game_cpu = [pipe.recv() for _, pipe in children]
+    host_cpu = sum(game_cpu)
+
+    for player in players:
+        player.stop()
+    for child, _ in children:
+        child.join(timeout=5)
+    server.stop()
+
+    latencies = sorted(l for s in games for l in s.latencies)
+    total_rolls = sum(s.rolls for s in games)
+    delta = dict((k, stats_after[k] - stats_before[k]) for k in stats_after)
+    return {
+        "hosts": hosts,
+        "bots": len(players),
+        "finished": finished,
+        "elapsed_s": elapsed,
+        "rolls": total_rolls,
+        "latency_ms": {
+            "mean": 1000.0 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": 1000.0 * percentile(latencies, 50),
+            "p95": 1000.0 * percentile(latencies, 95),
+            "p99": 1000.0 * percentile(latencies, 99),
+            "max": 1000.0 * (latencies[-1] if latencies else 0.0),
+        },
+        "privmsgs_per_s": delta["privmsgs"] / elapsed,
+        "lines_in_per_s": delta["lines_in"] / elapsed,
+        "lines_out_per_s": delta["lines_out"] / elapsed,
+        "host_cpu_s": host_cpu,
+        "host_cpu_per_game_s": host_cpu / hosts,
+        "host_cpu_max_game_s": max(game_cpu),
+        "host_cpu_per_roll_ms": 1000.0 * host_cpu / total_rolls if total_rolls else 0.0,
+        "flood_delays": delta["flood_delays"],
+        "flood_kills": delta["flood_kills"],
+    }
+
+
+def print_report(result):
+    lat = result["latency_ms"]
+    print("Games: {hosts}  Bots: {bots}  Rolls: {rolls}  Elapsed: {elapsed_s:.2f}s{suffix}".format(
+        suffix="" if result["finished"] else "  (TIMED OUT)", **result))
+    print("!roll -> !rolled latency (ms): mean {mean:.2f}  p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}  max {max:.2f}".format(**lat))
+    print("Messages/sec: {privmsgs_per_s:.1f} PRIVMSG  ({lines_in_per_s:.1f} lines in, {lines_out_per_s:.1f} lines out)".format(**result))
+    print("Host CPU: {host_cpu_s:.3f}s total, {host_cpu_per_game_s:.3f}s per game (max {host_cpu_max_game_s:.3f}s), "
+          "{host_cpu_per_roll_ms:.3f}ms per roll".format(**result))
+    if result["flood_delays"] or result["flood_kills"]:
+        print("Flood control: {flood_delays} delayed lines, {flood_kills} disconnects".format(**result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test Host against a local fake IRC server.")
+    parser.add_argument("--hosts", type=int, default=2, help="number of Host instances (games)")
+    parser.add_argument("--bots", type=int, default=4, help="number of scripted players, split across hosts")
+    parser.add_argument("--rolls", type=int, default=50, help="rolls per game before stopping")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--flood-rate", type=float, default=0,
+                        help="lines per second per client (0 disables flood limits)")
+    parser.add_argument("--flood-burst", type=float, default=10)
+    parser.add_argument("--json", help="also write the result as JSON to this path")
+    args = parser.parse_args()
+
+    limit = FloodLimit(args.flood_rate, args.flood_burst) if args.flood_rate > 0 else None
+    result = run_load_test(args.hosts, args.bots, args.rolls, args.timeout, limit)
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    sys.exit(0 if result["finished"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -2,66 +2,170 @@
 # Uses the hex map structures from map.py but adds game logic
 # No terminal/curses or UI code here
 
-import networkx as nx
 import random
 
-class Player(object):
-    def __init__(self, player_id, name=""):
-        self.id = player_id
-        self.name = name or "Player %d" % player_id
-        self.roads = set()  # Set of edge IDs owned by this player
-        self.settlements = set()  # Set of node IDs with settlements
-        self.cities = set()  # Set of node IDs with cities
-        self.longest_road_length = 0
+from distance import DistanceField, adjacency, node_tiles
+from player import Player
 
 class GameBoard(object):
     def __init__(self, hexmap):
         self.hexmap = hexmap
         self.players = {}  # player_id -> Player object
+        self.node_owners = {}  # node ID -> player ID with a settlement or city there
+        self.distance_fields = {}  # player ID -> DistanceField, made on first use
+        self.node_tiles = node_tiles(hexmap)  # Shared per radius; don't modify
+        self.tile_buildings = {}  # tile coord -> {player ID: their settlements and cities on its corners}
         
-    def add_player(self, player_id, name=""):
-        self.players[player_id] = Player(player_id, name)
+    def add_player(self, player_id, name="", player=None):
+        """Seat player_id; a GameState passes its own Player record so both share it."""
+        if player is None:
+            player = Player(name or "Player %d" % player_id, player_id)
+        self.players[player_id] = player
+
+    def set_node_owner(self, node_id, player_id):
+        """node_owners[node_id] = player_id (None to clear), keeping tile_buildings in step."""
+        previous = self.node_owners.get(node_id)
+        if previous == player_id:
+            return
+        for coord in self.node_tiles.get(node_id, ()):
+            counts = self.tile_buildings.get(coord)
+            if previous is not None:
+                if counts[previous] > 1:
+                    counts[previous] -= 1
+                elif len(counts) > 1:
+                    del counts[previous]
+                else:
+                    del self.tile_buildings[coord]  # Only tiles with buildings have an entry
+                    counts = None
+            if player_id is not None:
+                if counts is None:
+                    counts = self.tile_buildings[coord] = {}
+                counts[player_id] = counts.get(player_id, 0) + 1
+        if player_id is None:
+            del self.node_owners[node_id]
+        else:
+            self.node_owners[node_id] = player_id
+
+    def building_owners(self, coord):
+        """IDs of the players with a settlement or city on a corner of tile coord."""
+        counts = self.tile_buildings.get(coord)
+        return counts.keys() if counts else []
+
+    def distance_field(self, player_id):
+        """player_id's DistanceField, kept current by the builds below."""
+        field = self.distance_fields.get(player_id)
+        if field is None:
+            field = self.distance_fields[player_id] = DistanceField(self, player_id)
+        return field
+
+    def _update_distances(self, player_id, edge_id=None, node_id=None):
+        for field in self.distance_fields.itervalues():
+            if field.player_id != player_id:
+                field.invalidate()  # Another player's piece can only lengthen paths
+            elif edge_id is not None:
+                field.road_built(edge_id)
+            else:
+                field.building_built(node_id)
         
     def build_road(self, player_id, edge_id):
         if player_id in self.players:
             self.players[player_id].roads.add(edge_id)
             self.hexmap.road_owners[edge_id] = player_id
+            if self.distance_fields:
+                self._update_distances(player_id, edge_id=edge_id)
             
     def build_settlement(self, player_id, node_id):
         if player_id in self.players:
             self.players[player_id].settlements.add(node_id)
+            self.set_node_owner(node_id, player_id)
+            if self.distance_fields:
+                self._update_distances(player_id, node_id=node_id)
             
     def build_city(self, player_id, node_id):
         if player_id in self.players:
             self.players[player_id].cities.add(node_id)
+            self.set_node_owner(node_id, player_id)
             # Remove settlement if upgrading
             self.players[player_id].settlements.discard(node_id)
+            if self.distance_fields:
+                self._update_distances(player_id, node_id=node_id)
+
+    def make_build(self, player_id, piece, location):
+        """Build piece ('road', 'settlement' or 'city') and return an undo
+        record for unmake_build(). The record is a flat tuple, so taking a
+        build back costs O(1) instead of a copy of the board."""
+        p = self.players[player_id]
+        record = (piece, player_id, location, p.longest_road_length, location in p.settlements)
+        if piece == 'road':
+            self.build_road(player_id, location)
+        elif piece == 'settlement':
+            self.build_settlement(player_id, location)
+        else:
+            self.build_city(player_id, location)
+        return record
+
+    def unmake_build(self, record):
+        piece, player_id, location, longest_road_length, had_settlement = record
+        p = self.players[player_id]
+        if piece == 'road':
+            p.roads.discard(location)
+            self.hexmap.road_owners.pop(location, None)
+        elif piece == 'settlement':
+            p.settlements.discard(location)
+            self.set_node_owner(location, None)
+        else:
+            p.cities.discard(location)
+            if had_settlement:
+                p.settlements.add(location)
+            else:
+                self.set_node_owner(location, None)
+        p.longest_road_length = longest_road_length
+        for field in self.distance_fields.itervalues():
+            field.invalidate()
             
     def compute_longest_road_for_player(self, player_id):
+        """Length of player_id's longest road: the most of their roads that
+        can be followed end to end without using one twice. Another
+        player's settlement or city cuts a road; a road can end there but
+        not pass through."""
         if player_id not in self.players:
             return 0
-            
-        G = nx.Graph()
+
+        edge_nodes, node_edges = adjacency(self.hexmap)
+        node_owners = self.node_owners
+        own_edges = {}  # node -> player_id's roads ending there
         for edge_id in self.players[player_id].roads:
-            if edge_id not in self.hexmap.edge_to_tile:
+            ends = edge_nodes.get(edge_id)
+            if ends is None or ends[0] == ends[1]:
                 continue
-            tile_coord, edge_idx = self.hexmap.edge_to_tile[edge_id]
-            tile = self.hexmap.tiles[tile_coord]
-            n1 = tile.nodes[edge_idx]
-            n2 = tile.nodes[(edge_idx + 1) % 6]
-            if n1 != n2:
-                G.add_edge(n1, n2)
-                
-        if not G:
-            return 0
-            
+            for node in ends:
+                own_edges.setdefault(node, []).append(edge_id)
+
+        used = set()
+
+        def follow(node):
+            best = 0
+            for edge_id in own_edges[node]:
+                if edge_id in used:
+                    continue
+                a, b = edge_nodes[edge_id]
+                other = b if a == node else a
+                if node_owners.get(other, player_id) != player_id:
+                    length = 1  # Cut by someone else's building
+                else:
+                    used.add(edge_id)
+                    length = 1 + follow(other)
+                    used.discard(edge_id)
+                if length > best:
+                    best = length
+            return best
+
         longest = 0
-        for node in G.nodes():
-            lengths = nx.single_source_dijkstra_path_length(G, node)
-            max_len = max(lengths.values())
-            if max_len > longest:
-                longest = max_len
-                
+        for node in own_edges:
+            length = follow(node)
+            if length > longest:
+                longest = length
+
         self.players[player_id].longest_road_length = longest
         return longest
         
@@ -77,8 +181,14 @@ class GameBoard(object):
             return best_player
         return None
 
-def random_branching_road_walk_for_player(board, player_id, steps=20, boundary_nodes=None, draw_func=None):
-    """Build roads for a player using random walk algorithm"""
+def random_branching_road_walk_for_player(board, player_id, steps=20, boundary_nodes=None, draw_func=None, rng=None):
+    """Build roads for a player using random walk algorithm
+
+    rng is any random.Random (usually the game's GameRNG); defaults to the
+    global random module.
+    """
+    if rng is None:
+        rng = random
     if player_id not in board.players:
         board.add_player(player_id)
         
@@ -86,7 +196,7 @@ def random_branching_road_walk_for_player(board, player_id, steps=20, boundary_n
     visited_edges = set(board.players[player_id].roads)  # Start with existing roads
     visited_nodes = set()
     
-    all_nodes = list(hexmap.node_ids.values())
+    all_nodes = range(hexmap.node_autoinc)
     if boundary_nodes is None:
         boundary_nodes = set()
         
@@ -106,7 +216,7 @@ def random_branching_road_walk_for_player(board, player_id, steps=20, boundary_n
         frontier = list(set(frontier))  # Remove duplicates
     else:
         # Start fresh
-        start_node = random.choice(non_boundary_nodes)
+        start_node = rng.choice(non_boundary_nodes)
         frontier = [start_node]
         
     visited_nodes.update(frontier)
@@ -115,7 +225,7 @@ def random_branching_road_walk_for_player(board, player_id, steps=20, boundary_n
         if not frontier:
             break
             
-        current_node = random.choice(frontier)
+        current_node = rng.choice(frontier)
         neighbors = []
         
         # Find all unvisited edges incident to current_node
@@ -139,7 +249,7 @@ def random_branching_road_walk_for_player(board, player_id, steps=20, boundary_n
             continue
             
         # Pick one randomly and build road
-        tile, edge_idx, edge_id, new_node = random.choice(neighbors)
+        tile, edge_idx, edge_id, new_node = rng.choice(neighbors)
         board.build_road(player_id, edge_id)
         
         # Draw the road if drawing function is provided
@@ -153,7 +263,11 @@ def random_branching_road_walk_for_player(board, player_id, steps=20, boundary_n
 def get_boundary_nodes(hexmap):
     """Get all nodes on the boundary of the map"""
     boundary_nodes = set()
-    for tile_coord, tile in hexmap.tiles.items():
+    if hexmap.radius is not None:
+        rim = hexmap.ring((0, 0, 0), hexmap.radius)  # Nothing inside the outer ring touches the edge
+    else:
+        rim = hexmap.tiles.values()
+    for tile in rim:
         for dir_idx in range(6):
             dx, dy, dz = hexmap.directions[dir_idx]
             neighbor_coord = (tile.x + dx, tile.y + dy, tile.z + dz)
@@ -166,8 +280,13 @@ def get_boundary_nodes(hexmap):
 
 
 if __name__ == "__main__":
+    import sys
     import time
     from map import HexMap, terminal, draw_map, get_map_screen_size
+    from rng import GameRNG
+
+    # Optional seed argument makes the walk repeatable
+    rng = GameRNG(int(sys.argv[1]) if len(sys.argv) > 1 else None)
     
     terminal.clear()
     terminal.gotoxy(0, 0)
@@ -194,8 +313,8 @@ if __name__ == "__main__":
             draw_road(tile, edge_idx, hexmap, color=terminal.COLOR_PAIR_BLUE)
 
     # Build roads for players using board system
-    random_branching_road_walk_for_player(board, player_id=1, steps=4, boundary_nodes=boundary_nodes, draw_func=draw_player_road)
-    random_branching_road_walk_for_player(board, player_id=2, steps=5, boundary_nodes=boundary_nodes, draw_func=draw_player_road)
+    random_branching_road_walk_for_player(board, player_id=1, steps=4, boundary_nodes=boundary_nodes, draw_func=draw_player_road, rng=rng)
+    random_branching_road_walk_for_player(board, player_id=2, steps=5, boundary_nodes=boundary_nodes, draw_func=draw_player_road, rng=rng)
 
     width, height = get_map_screen_size(hexmap)
     terminal.writexy(0, height, "")
@@ -203,7 +322,7 @@ if __name__ == "__main__":
     # Use board's longest road calculation
     board.update_all_longest_roads()
     for player_id, player in board.players.items():
-        terminal.write("Longest road for %s: %d tiles\n" % (player.name, player.longest_road_length))
+        terminal.write("Longest road for %s: %d tiles\n" % (player.nick, player.longest_road_length))
     
     # Capture screen buffer including the additional text lines
     height, width = terminal.gettermsize()
@@ -0,0 +1,387 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# bot.py - Computer player that fills empty seats, choosing moves with MCTS
+#
+# A Bot is an IRC client like client.py without the UI: it asks a host for
+# an invite, keeps a GameMirror of the game and, on its turn, searches the
+# mirrored position with Monte Carlo tree search. Searches run in a
+# multiprocessing pool shared by every bot in the process; each move is
+# searched by several workers in parallel (root parallelization) and their
+# visit counts are merged. A reactor timer enforces the per-move budget, so
+# a slow or lost worker never stalls the game and the IRC thread never
+# blocks on a search.
+#
+#   python bot.py <owner> [--bots 2] [--budget 1.0] [--workers 2]
+
+import ConfigParser
+import argparse
+import math
+import multiprocessing
+import os
+import ssl
+import sys
+import threading
+import time
+
+from irc.client import SimpleIRCClient, NickMask, ServerConnectionError
+from irc.connection import Factory
+
+import snapshot
+from distance import adjacency
+from game import BUILD_COST_ITEMS, tile_key
+from lobby import parse_host_broadcast
+from mirror import GameMirror, DELTA_VERB, STATE_VERB, RESYNC_VERB
+from rng import GameRNG, new_seed
+
+EXPLORATION = 1.4         # UCB1 exploration constant
+ROLLOUT_COMMANDS = 60     # Commands simulated after leaving the tree
+ROLLOUT_BUILD_BIAS = 0.7  # Chance a rollout player builds when it can instead of passing
+MAX_ACTIONS_PER_TURN = 8  # The bot passes after this many builds in one turn
+DEADLINE_GRACE = 0.25     # Seconds on top of the budget before falling back
+
+
+_move_strings = {}
+
+def _build_move(piece, location):
+    """"!build <piece> <location>", formatted once per spot."""
+    key = (piece, location)
+    move = _move_strings.get(key)
+    if move is None:
+        move = _move_strings[key] = "!build {} {}".format(piece, location)
+    return move
+
+
+def _affordable(player, piece):
+    return player.can_afford(BUILD_COST_ITEMS[piece])
+
+
+def robber_targets(game, nick):
+    """Land tiles touching an opponent's building and none of nick's."""
+    board = game.board
+    own_id = game.players[nick].id
+    coords = sorted(coord for coord, owners in board.tile_buildings.iteritems()
+                    if owners and own_id not in owners and coord in game.tile_resources)
+    tiles = board.hexmap.tiles
+    return [tile_key(tiles[c]) for c in coords] or [tile_key(tiles[min(game.tile_resources)])]
+
+
+def legal_moves(game, nick):
+    """Commands nick can usefully send right now, in a stable order.
+
+    Builds are limited to spots connected to nick's own pieces (anywhere
+    for a first settlement), which is stricter than the host's setup rule
+    but keeps the branching factor searchable. Every candidate is checked
+    with game.can_place(), so the host never answers !invalid-build.
+    """
+    state = game.state
+    if state == 'awaiting_roll':
+        return ["!roll"]
+    if state == 'awaiting_robber_move':
+        return ["!robber {}".format(t) for t in robber_targets(game, nick)]
+    if state != 'awaiting_actions':
+        return []
+
+    moves = ["!pass"]
+    board = game.board
+    if board is None:
+        return moves
+    player = game.players[nick]
+    edge_nodes, node_edges = adjacency(board.hexmap)
+    road_owners = board.hexmap.road_owners
+    node_owners = board.node_owners
+    can_place = game.can_place
+
+    if player.settlements and _affordable(player, 'city'):
+        moves.extend(_build_move('city', n) for n in sorted(player.settlements))
+
+    reach = set()
+    for edge_id in player.roads:
+        reach.update(edge_nodes[edge_id])
+    if _affordable(player, 'settlement'):
+        spots = reach if (player.settlements or player.cities) else node_edges
+        moves.extend(_build_move('settlement', n) for n in sorted(spots)
+                     if n not in node_owners and can_place(player, 'settlement', n))
+    if _affordable(player, 'road'):
+        reach.update(player.settlements)
+        reach.update(player.cities)
+        edges = set()
+        for node in reach:
+            for edge_id in node_edges.get(node, ()):
+                if edge_id not in road_owners:
+                    edges.add(edge_id)
+        moves.extend(_build_move('road', e) for e in sorted(edges) if can_place(player, 'road', e))
+    return moves
+
+
+def evaluate(game, nick):
+    """Reward in [0, 1] for nick: 1 for a win, else a victory point margin."""
+    if game.state == 'awaiting_ready' and not game.game_active:
+        winner = game.check_winner()
+        if winner is not None:
+            return 1.0 if winner == nick else 0.0
+    own = game.players[nick].total_victory_points()
+    best_other = max([p.total_victory_points() for n, p in game.players.items() if n != nick] or [0])
+    cards = game.players[nick].hand_size()
+    score = 0.5 + (own - best_other) / 20.0 + min(cards, 10) / 200.0
+    return max(0.0, min(1.0, score))
+
+
+def rollout(game, nick, rng, undo):
+    """Play random moves from game, pushing their undo records onto undo."""
+    make = game.make_move
+    for _ in xrange(ROLLOUT_COMMANDS):
+        if game.state == 'awaiting_ready':
+            break
+        player = game.current_player()
+        moves = legal_moves(game, player)
+        if len(moves) > 1 and moves[0] == "!pass" and rng.random() < ROLLOUT_BUILD_BIAS:
+            move = rng.choice(moves[1:])
+        elif moves[0] == "!pass":
+            move = "!pass"
+        else:
+            move = rng.choice(moves)
+        undo.append(make(player, move)[1])
+    return evaluate(game, nick)
+
+
+class _Node(object):
+    __slots__ = ('visits', 'value', 'children')
+
+    def __init__(self):
+        self.visits = 0
+        self.value = 0.0
+        self.children = {}  # move -> _Node
+
+
+def _ucb(parent, child):
+    return (child.value / child.visits +
+            EXPLORATION * math.sqrt(math.log(parent.visits) / child.visits))
+
+
+def search(data, nick, budget, seed):
+    """Open-loop MCTS from a snapshot until budget seconds have passed.
+
+    The tree only covers nick's own moves this turn (dice make everything
+    after that a chance node). The snapshot is loaded once; every iteration
+    plays forward with make_move() and takes it all back with unmake_move(),
+    then moves the dice on so the next iteration sees different rolls.
+    Runs in a pool worker; returns ({move: visits}, iterations).
+    """
+    deadline = time.time() + budget
+    game = snapshot.loads(data)
+    rng = game.rng = GameRNG(seed)
+    make, unmake = game.make_move, game.unmake_move
+    root = _Node()
+    undo = []
+    iterations = 0
+    while iterations == 0 or time.time() < deadline:
+        node = root
+        path = [root]
+        while game.state != 'awaiting_ready' and game.current_player() == nick:
+            moves = legal_moves(game, nick)
+            if not moves:
+                break
+            untried = [m for m in moves if m not in node.children]
+            if untried:
+                move = rng.choice(untried)
+                child = node.children[move] = _Node()
+                node = child
+                undo.append(make(nick, move)[1])
+                path.append(node)
+                break
+            move = max(moves, key=lambda m: _ucb(node, node.children[m]))
+            node = node.children[move]
+            undo.append(make(nick, move)[1])
+            path.append(node)
+        reward = rollout(game, nick, rng, undo)
+        rolled = rng.dice_drawn
+        while undo:
+            unmake(undo.pop())
+        rng.skip_dice(rolled - rng.dice_drawn)
+        for n in path:
+            n.visits += 1
+            n.value += reward
+        iterations += 1
+    return dict((move, child.visits) for move, child in root.children.items()), iterations
+
+
+class _Decision(object):
+    """One move being searched for: the game version it is for and the
+    worker results collected so far."""
+
+    def __init__(self, version, moves, workers):
+        self.version = version
+        self.moves = moves
+        self.workers = workers
+        self.results = []
+        self.done = False
+
+
+class Bot(SimpleIRCClient):
+    def __init__(self, config, owner, nick, pool, budget=1.0, workers=2):
+        SimpleIRCClient.__init__(self)
+        self.config = config
+        self.owner = owner
+        self.nick = nick
+        self.host_nick = "HostBot_{}".format(owner)
+        self.lobby_channel = config.get('irc', 'channel')
+        self.game_channel = "&catan-game-{}".format(owner)
+        self.pool = pool
+        self.budget = budget
+        self.workers = workers
+        self.mirror = None
+        self.join_requested = False
+        self.lock = threading.Lock()
+        self.decision = None
+        self.actions_this_turn = 0
+        self.searches = 0
+        self.iterations = 0
+
+    def on_welcome(self, connection, event):
+        connection.join(self.lobby_channel)
+
+    def on_pubmsg(self, connection, event):
+        sender = NickMask(event.source).nick
+        msg = event.arguments[0].strip()
+        if event.target == self.lobby_channel:
+            if sender == self.host_nick and not self.join_requested:
+                parsed = parse_host_broadcast(sender, msg)
+                if parsed is not None and parsed[0] == self.owner:
+                    self.join_requested = True
+                    connection.privmsg(self.lobby_channel, "!join {}".format(self.owner))
+        elif event.target == self.game_channel and sender == self.host_nick and self.mirror is not None:
+            if msg.startswith(DELTA_VERB + " "):
+                if self.mirror.handle_delta(msg):
+                    connection.privmsg(sender, RESYNC_VERB)
+                self.think()
+
+    def on_privnotice(self, connection, event):
+        sender = NickMask(event.source).nick
+        msg = event.arguments[0].strip()
+        if self.mirror is not None and sender == self.mirror.host_nick and msg.startswith(STATE_VERB + " "):
+            if self.mirror.handle_state(msg):
+                connection.privmsg(sender, RESYNC_VERB)
+            self.think()
+
+    def on_invite(self, connection, event):
+        if event.arguments[0] == self.game_channel:
+            self.mirror = GameMirror(NickMask(event.source).nick)
+            connection.join(self.game_channel)
+
+    def on_join(self, connection, event):
+        if NickMask(event.source).nick == self.nick and event.target == self.game_channel:
+            connection.privmsg(self.game_channel, "!ready")
+
+    def think(self):
+        """Start a search if the mirrored game is waiting on us."""
+        game = self.mirror.game
+        if game is None or game.state == 'awaiting_ready' or game.current_player() != self.nick:
+            return
+        with self.lock:
+            if self.decision is not None and self.decision.version == game.version:
+                return
+            if game.state == 'awaiting_roll':
+                self.actions_this_turn = 0
+            elif game.state == 'awaiting_actions':
+                self.actions_this_turn += 1
+            moves = legal_moves(game, self.nick)
+            if self.actions_this_turn > MAX_ACTIONS_PER_TURN:
+                moves = ["!pass"]
+            decision = self.decision = _Decision(game.version, moves, self.workers)
+        if len(moves) <= 1:
+            self.finish(decision)
+            return
+
+        data = snapshot.dumps(game, rng=False)
+        for _ in range(self.workers):
+            self.pool.apply_async(search, (data, self.nick, self.budget, new_seed()),
+                                  callback=lambda result: self.on_result(decision, result))
+        self.reactor.scheduler.execute_after(self.budget + DEADLINE_GRACE, lambda: self.finish(decision))
+
+    def on_result(self, decision, result):
+        """Pool callback (result handler thread). The irc connection isn't
+        thread-safe, so the move is played from the reactor."""
+        with self.lock:
+            decision.results.append(result)
+            complete = len(decision.results) >= decision.workers
+        if complete:
+            self.reactor.scheduler.execute_after(0, lambda: self.finish(decision))
+
+    def finish(self, decision):
+        """Play the most visited move, or the first legal one if no worker
+        made it in time. Runs on the reactor thread."""
+        with self.lock:
+            if decision.done or decision is not self.decision:
+                return
+            decision.done = True
+            visits = {}
+            for counts, iterations in decision.results:
+                self.iterations += iterations
+                for move, n in counts.items():
+                    visits[move] = visits.get(move, 0) + n
+            if decision.results:
+                self.searches += 1
+        move = decision.moves[0] if decision.moves else None
+        if visits:
+            move = max(sorted(visits), key=lambda m: visits[m])
+        if move is not None:
+            self.connection.privmsg(self.game_channel, move)
+
+
+def make_pool(processes):
+    return multiprocessing.Pool(processes)
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config = ConfigParser.ConfigParser()
+    config.read(os.path.join(script_dir, 'config.ini'))
+
+    def setting(name, default):
+        if config.has_option('bot', name):
+            return type(default)(config.get('bot', name))
+        return default
+
+    parser = argparse.ArgumentParser(description="Fill seats in a host's game with MCTS bots.")
+    parser.add_argument("owner", help="owner of the host whose game the bots join")
+    parser.add_argument("--bots", type=int, default=1)
+    parser.add_argument("--budget", type=float, default=setting('budget', 1.0),
+                        help="seconds of search per move")
+    parser.add_argument("--workers", type=int, default=setting('workers', 2),
+                        help="parallel searches per move")
+    parser.add_argument("--pool-size", type=int, default=setting('pool_size', multiprocessing.cpu_count()))
+    args = parser.parse_args()
+
+    # Fork the pool before any IRC threads exist
+    pool = make_pool(args.pool_size)
+
+    server = config.get('irc', 'server')
+    port = config.getint('irc', 'port')
+    ssl_enabled = config.getboolean('irc', 'ssl')
+    threads = []
+    for i in range(args.bots):
+        nick = "CatanBot_{}_{}".format(args.owner, i)
+        bot = Bot(config, args.owner, nick, pool, args.budget, args.workers)
+        try:
+            if ssl_enabled:
+                bot.connect(server, port, nick, connect_factory=Factory(wrapper=ssl.wrap_socket))
+            else:
+                bot.connect(server, port, nick)
+        except ServerConnectionError as e:
+            print("[BOT:{}] Connection failed: {}".format(nick, str(e)))
+            sys.exit(1)
+        thread = threading.Thread(target=bot.start)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    pool.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,23 @@
 # client.py
 
 import ConfigParser
-import ssl
 import subprocess
 import sys
 import threading
-import time
 import os
 
 from irc.client import SimpleIRCClient, NickMask, ServerConnectionError
-from irc.connection import Factory
 
+import metrics
+import profiling
 from ui import UI
 from terminal import Terminal
+from mirror import GameMirror, DELTA_VERB, STATE_VERB, RESYNC_VERB, CATCHUP_VERB
+from hostpool import PoolError, request_host, release_host
+from lobby import LobbyDirectory
+from reconnect import Reconnector
+
+REJOIN_DELAY = 2.0  # Seconds before rejoining a channel we were kicked from
 
 class Client(SimpleIRCClient):
     def __init__(self, config):
@@ -26,7 +31,14 @@ class Client(SimpleIRCClient):
         self.active_channel = self.lobby_channel
         #self.running = True
         self.host_process = None
+        self.pooled_host = None  # Nick of a host handed to us by hostpool.py
+        self.host_requested = False  # A request to the pool is in flight
+        self.pool_requested = False  # The pool took a request from us; release it on the way out
         self.ui = None
+        self.mirror = None  # Replica of the game we were invited to, kept in sync by !delta
+        self.lobby = LobbyDirectory()  # Games announced in the lobby, for !list
+        self.reconnector = Reconnector(self, config)
+        self.reconnecting = False
     
     def connect_to_server(self):
         """Handle nickname input and server connection"""
@@ -44,45 +56,49 @@ class Client(SimpleIRCClient):
         self.ui = UI(self)
         terminal.clear()
 
-        # Get connection parameters
-        server = self.config.get('irc', 'server')
-        port = self.config.getint('irc', 'port')
-        ssl_enabled = self.config.getboolean('irc', 'ssl')
-        
         # Connect to server
         try:
-            if ssl_enabled:
-                factory = Factory(wrapper=ssl.wrap_socket)
-            else:
-                factory = None
-            self.connect(server, port, self.nick, connect_factory=factory)
+            self.reconnector.connect(self.nick)
             return True
         except ServerConnectionError:
             print("Failed to connect to IRC server")
             return False
 
     def on_welcome(self, connection, event):
+        self.reconnector.registered()
         connection.join(self.lobby_channel)
+        if self.reconnecting:
+            self.reconnecting = False
+            self.ui.add_message("[System] Reconnected.")
+            if self.mirror is not None:
+                # Back into the game, then fetch only the deltas we missed
+                connection.join(self.active_channel)
+                connection.privmsg(self.mirror.host_nick, self.mirror.catchup_request())
+
+    def on_nicknameinuse(self, connection, event):
+        self.reconnector.nick_in_use()
 
     def on_pubmsg(self, connection, event):
         sender = NickMask(event.source).nick
         msg = event.arguments[0].strip()
         channel = event.target  # The channel where the message was sent
+        metrics.count('irc.in')
+
+        # Board sync traffic from the game host is for the mirror, not the chat window
+        if self.mirror is not None and sender == self.mirror.host_nick and msg.startswith(DELTA_VERB + " "):
+            if self.mirror.handle_delta(msg):
+                connection.privmsg(sender, RESYNC_VERB)
+            metrics.gauge('mirror.pending', len(self.mirror.pending))
+            return
 
-        # Listen for !host broadcasts from our own host
-        expected_bot = "HostBot_{}".format(self.nick)
-        if channel == self.lobby_channel and sender == expected_bot and msg.startswith("!host "):
+        if channel == self.lobby_channel:
             # Example: !host Alice (Players: Bob, Alice)
-            import re
-            m = re.match(r"!host (\S+) \(Players: (.*)\)", msg)
-            if m:
-                host_owner = m.group(1)
-                players = [p.strip() for p in m.group(2).split(',') if p.strip()]
-                if host_owner == self.nick:
-                    if self.nick not in players:
-                        self.ui.add_message("[System] Host {} is ready. Sending join request...".format(expected_bot))
-                        self.send_user_input("!join {}".format(self.nick))
-                        
+            entry = self.lobby.update(sender, msg)
+            # Join our own host as soon as it announces itself
+            if entry is not None and entry.owner == self.nick and self.nick not in entry.players:
+                self.ui.add_message("[System] Host {} is ready. Sending join request...".format(entry.host_nick))
+                self.send_user_input("!join {}".format(self.nick))
+
         responses = self.ui.handle_server_message(channel, sender, msg)
         for resp in responses:
             self.send_user_input(resp)
@@ -93,10 +109,37 @@ class Client(SimpleIRCClient):
         self.ui.add_message("[System] Received invite from {} to join {}".format(inviter, channel))
         connection.join(channel)
         self.active_channel = channel
+        self.mirror = GameMirror(inviter)
         self.ui.add_message("[System] Joined channel {} and set as active".format(channel))
 
+    def on_privnotice(self, connection, event):
+        sender = NickMask(event.source).nick
+        msg = event.arguments[0].strip()
+        metrics.count('irc.in')
+        if self.mirror is None or sender != self.mirror.host_nick:
+            return
+        if msg.startswith(STATE_VERB + " "):
+            if self.mirror.handle_state(msg):
+                connection.privmsg(sender, RESYNC_VERB)
+            elif self.mirror.game is not None and not self.mirror.chunks and not self.mirror.catching_up:
+                self.ui.add_message("[System] Board synced at version {}".format(self.mirror.game.version))
+        elif msg.startswith(DELTA_VERB + " "):
+            if self.mirror.handle_delta(msg):
+                connection.privmsg(sender, RESYNC_VERB)
+        elif msg.startswith(CATCHUP_VERB + " "):
+            if self.mirror.handle_catchup(msg):
+                connection.privmsg(sender, RESYNC_VERB)
+            elif self.mirror.game is not None:
+                self.ui.add_message("[System] Caught up at version {}".format(self.mirror.game.version))
+
     def on_disconnect(self, connection, event):
-        #self.running = False
+        if self.reconnector.enabled:
+            # Keep the host process and the mirror; the game resumes after the reconnect
+            if not self.reconnecting:
+                self.ui.add_message("[System] Disconnected from server. Reconnecting...")
+            self.reconnecting = True
+            self.reconnector.schedule()
+            return
         self.stop_host_process()
         #self.connection.quit("Disconnected.") #already disconnected
         sys.exit(0)
@@ -109,30 +152,63 @@ class Client(SimpleIRCClient):
             if len(parts) == 2:
                 target_username = parts[1].strip()
                 self.connection.privmsg(self.lobby_channel, "!join {}".format(target_username))
+        elif user_input == "!list":
+            for line in self.lobby.format_list():
+                self.ui.add_message(line)
         elif user_input in ("!quit", "!exit"):
+            self.reconnector.enabled = False
             self.stop_host_process()
             # Don't call connection.quit() to avoid triggering on_disconnect
             sys.exit(0)
         else:
+            metrics.count('irc.out')
             self.connection.privmsg(self.active_channel, user_input)
 
     def shutdown(self):
         print("[HOST:{}] Client from server.".format(self.nick))
+        self.reconnector.enabled = False
         self.stop_host_process()
         self.connection.quit("Shutting down.")
         sys.exit(0)
 
     def start_host_process(self):
-        if not self.host_process:
+        if self.host_process or self.pooled_host or self.host_requested:
+            return
+        # The pool may have to connect a host or replay a long game first; wait off the UI thread
+        self.host_requested = True
+        thread = threading.Thread(target=self.request_pooled_host)
+        thread.daemon = True
+        thread.start()
+
+    def request_pooled_host(self):
+        """Get a host from hostpool.py, or start one cold when no pool is running."""
+        try:
+            nick = request_host(self.config, self.nick)
+        except PoolError as e:
+            # The pool has the request and may still bring a host up: starting another would make two
+            self.pool_requested = True
+            self.host_requested = False
+            self.ui.add_message("[System] The host pool could not start a host: {}. Try !start again.".format(e))
+            return
+        if nick:
+            self.pool_requested = True
+            self.pooled_host = nick
+            self.ui.add_message("[System] Host {} assigned from the pool.".format(self.pooled_host))
+        else:
             # Get the directory where this script is located
             script_dir = os.path.dirname(os.path.abspath(__file__))
             host_path = os.path.join(script_dir, 'host.py')
             self.ui.add_message("[System] Starting host process...")
             self.host_process = subprocess.Popen([sys.executable, host_path, self.nick])
             self.ui.add_message("[System] Host process started. Waiting for host to become available...")
+        self.host_requested = False
 
 
     def stop_host_process(self):
+        if self.pooled_host or self.pool_requested:
+            release_host(self.config, self.nick)
+            self.pooled_host = None
+            self.pool_requested = False
         if self.host_process:
             self.host_process.terminate()
             self.host_process.wait()
@@ -144,8 +220,15 @@ class Client(SimpleIRCClient):
         if kicked_nick == self.nick:
             # Optionally, notify the UI
             self.ui.add_message("[System] You were kicked from {}. Attempting to reconnect...".format(channel))
-            time.sleep(2)  # Wait a moment before rejoining
-            connection.join(channel)
+            # Wait a moment before rejoining, without stalling the reactor
+            self.reactor.scheduler.execute_after(REJOIN_DELAY, lambda: connection.join(channel))
+
+    def on_part(self, connection, event):
+        if event.target == self.lobby_channel:
+            self.lobby.remove_host(NickMask(event.source).nick)
+
+    def on_quit(self, connection, event):
+        self.lobby.remove_host(NickMask(event.source).nick)
 
     def on_ping(self, connection, event):
         self.ui.add_message("[System] Received PING from server. Responding with PONG.")
@@ -164,6 +247,8 @@ def main():
     # Connect to server (includes nickname input)
     if not client.connect_to_server():
         sys.exit(1)
+    metrics.start_dumping(config, os.path.join(script_dir, 'metrics_client_{}.json'.format(client.nick)))
+    profiling.install(config, 'client_{}'.format(client.nick), script_dir)
 
     # Start the IRC event loop in a background thread (Python 2.7 style)
     irc_thread = threading.Thread(target=client.start)
@@ -0,0 +1,138 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# distance.py - Node adjacency tables and per-player road distance fields
+#
+# A DistanceField holds, for one player, the number of roads they would
+# have to build to reach every node on the map. The sources are the ends of
+# the player's roads and their settlements and cities. The field is a
+# multi-source BFS over the node graph:
+#   - another player's road closes its edge
+#   - another player's building can be reached but not passed through
+#
+# A player's own builds only ever add sources, which can only shorten
+# distances. So GameBoard hands them to the field and it repairs itself
+# with a BFS from the new sources that stops wherever nothing got shorter.
+# Anything else (another player building, a build taken back) may make
+# distances longer. That only marks the field stale, and it is recomputed
+# from scratch the next time someone reads it.
+
+import collections
+
+def adjacency(hexmap):
+    """(edge -> its two nodes, node -> its edges) for hexmap's topology.
+
+    The tables are kept in hexmap.derived, which copies of a default map
+    share, so they are built once per radius.
+    """
+    tables = hexmap.derived.get('adjacency')
+    if tables is None:
+        edge_nodes = {}
+        node_edges = {}
+        for edge_id, (coord, idx) in hexmap.edge_to_tile.iteritems():
+            tile = hexmap.tiles[coord]
+            ends = (tile.nodes[idx], tile.nodes[(idx + 1) % 6])
+            edge_nodes[edge_id] = ends
+            for node in ends:
+                node_edges.setdefault(node, []).append(edge_id)
+        tables = hexmap.derived['adjacency'] = (edge_nodes, node_edges)
+    return tables
+
+
+def node_tiles(hexmap):
+    """node -> coords of the (up to three) tiles it is a corner of; kept
+    in hexmap.derived like adjacency()."""
+    table = hexmap.derived.get('node_tiles')
+    if table is None:
+        table = {}
+        for coord, tile in hexmap.tiles.iteritems():
+            for node in tile.nodes:
+                table.setdefault(node, []).append(coord)
+        table = hexmap.derived['node_tiles'] = dict((node, tuple(coords)) for node, coords in table.iteritems())
+    return table
+
+
+class DistanceField(object):
+    """Roads player_id needs to reach each node of board; get one from
+    GameBoard.distance_field() so that builds keep it current."""
+
+    def __init__(self, board, player_id):
+        self.board = board
+        self.player_id = player_id
+        self.edge_nodes, self.node_edges = adjacency(board.hexmap)
+        self.dist = {}  # node -> roads to build; unreachable nodes are absent
+        self.stale = True
+
+    def sources(self):
+        player = self.board.players[self.player_id]
+        nodes = set(player.settlements)
+        nodes.update(player.cities)
+        edge_nodes = self.edge_nodes
+        for edge_id in player.roads:
+            nodes.update(edge_nodes.get(edge_id, ()))
+        return nodes
+
+    def recompute(self):
+        self.dist = {}
+        self.stale = False
+        self._spread(self.sources())
+
+    def _spread(self, nodes):
+        """Make nodes sources and BFS outwards while distances shrink."""
+        dist = self.dist
+        queue = collections.deque()
+        for node in nodes:
+            if dist.get(node) != 0:
+                dist[node] = 0
+                queue.append(node)
+        player_id = self.player_id
+        node_owners = self.board.node_owners
+        road_owners = self.board.hexmap.road_owners
+        edge_nodes, node_edges = self.edge_nodes, self.node_edges
+        while queue:
+            node = queue.popleft()
+            owner = node_owners.get(node)
+            if owner is not None and owner != player_id:
+                continue  # Someone else's building: the road ends here
+            step = dist[node] + 1
+            for edge_id in node_edges.get(node, ()):
+                owner = road_owners.get(edge_id)
+                if owner is not None and owner != player_id:
+                    continue
+                a, b = edge_nodes[edge_id]
+                other = b if a == node else a
+                if step < dist.get(other, step + 1):
+                    dist[other] = step
+                    queue.append(other)
+
+    # --- Kept current by GameBoard
+
+    def road_built(self, edge_id):
+        if not self.stale:
+            self._spread(self.edge_nodes.get(edge_id, ()))
+
+    def building_built(self, node_id):
+        if not self.stale:
+            self._spread([node_id])
+
+    def invalidate(self):
+        self.stale = True
+
+    # --- Queries
+
+    def distance(self, node):
+        """Roads needed to reach node, or None when it can't be reached."""
+        if self.stale:
+            self.recompute()
+        return self.dist.get(node)
+
+    def distances(self):
+        """{node: roads needed} for every reachable node; don't modify it."""
+        if self.stale:
+            self.recompute()
+        return self.dist
+
+    def within(self, steps):
+        """Nodes at most steps roads away, nearest first."""
+        dist = self.distances()
+        return sorted((n for n, d in dist.iteritems() if d <= steps), key=lambda n: (dist[n], n))
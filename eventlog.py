@@ -0,0 +1,212 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# eventlog.py - Append-only per-game event log with periodic snapshots
+#
+# Every accepted command (and every player join) is appended to
+# <directory>/events.log as one tab separated line:
+#
+#   <seq> S <seed>
+#   <seq> J <nick>
+#   <seq> C <nick> <dice or -> <message>
+#
+# The seed line comes first in a new game's log so a full replay leaves the
+# dice stream where the original game had it.
+#
+# Every snapshot_interval events the whole GameState is written to
+# <directory>/snapshot.bin (snapshot.py binary format) behind the seq and
+# byte offset of the log at that point, so restore() only replays the
+# events after the snapshot.
+#
+# The files only matter while a game can still be restored. When a game is
+# won, rotate() moves them to <archive>/<time>-<owner>/ (the host uses
+# ARCHIVE_DIR next to the game directories) and starts the log
+# over from a snapshot of the finished game; when the owner closes the game
+# (a pool release), archive() moves them out for good. At most keep
+# archived games are kept, oldest dropped first; keep 0 deletes the files
+# instead.
+
+import os
+import shutil
+import struct
+import time
+
+import metrics
+import snapshot
+from game import new_game, parse_command
+from rng import GameRNG
+
+EVENTS_FILE = 'events.log'
+SNAPSHOT_FILE = 'snapshot.bin'
+ARCHIVE_DIR = '.archive'  # Not a valid nick, so never some owner's game directory
+ARCHIVE_KEEP = 50  # Archived games kept per archive directory
+
+_POSITION = struct.Struct("<QQ")  # seq, log offset
+
+
+class GameLog(object):
+    def __init__(self, directory, snapshot_interval=50):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.events_path = os.path.join(directory, EVENTS_FILE)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.seq = 0
+        self.events_since_snapshot = 0
+        self.log_file = None
+
+    def _open(self):
+        if self.log_file is None:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self.log_file = open(self.events_path, 'ab')
+        return self.log_file
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+    def append(self, game, fields):
+        f = self._open()
+        self.seq += 1
+        with metrics.timer('log.event_write'):
+            f.write("\t".join([str(self.seq)] + fields) + "\n")
+            f.flush()
+        self.events_since_snapshot += 1
+        if self.events_since_snapshot >= self.snapshot_interval:
+            self.snapshot(game)
+
+    def record_seed(self, game):
+        self.append(game, ["S", str(game.rng.seed_value)])
+
+    def record_join(self, game, nick):
+        self.append(game, ["J", nick])
+
+    def record_command(self, game, nick, msg):
+        """Log a command the game accepted; rolls keep their dice for replay."""
+        cmd = parse_command(msg)
+        dice = str(game.last_roll) if cmd is not None and cmd.verb == '!roll' else "-"
+        self.append(game, ["C", nick, dice, msg])
+
+    def snapshot(self, game):
+        """Write the game and the current log position, replacing the old snapshot."""
+        offset = self._open().tell()
+        data = _POSITION.pack(self.seq, offset) + snapshot.dumps(game)
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            os.rename(tmp_path, self.snapshot_path)
+        except OSError:
+            # Windows will not rename over an existing file
+            os.remove(self.snapshot_path)
+            os.rename(tmp_path, self.snapshot_path)
+        self.events_since_snapshot = 0
+
+    def archive(self, archive_dir, keep=ARCHIVE_KEEP):
+        """Move this game's files to a new directory in archive_dir and
+        return its path, or delete them (and return None) when keep is 0.
+
+        The oldest archives beyond keep are deleted.
+        """
+        self.close()
+        files = [name for name in (EVENTS_FILE, SNAPSHOT_FILE)
+                 if os.path.exists(os.path.join(self.directory, name))]
+        dest = None
+        if files and keep > 0:
+            base = os.path.join(archive_dir, "{}-{}".format(time.strftime("%Y%m%d-%H%M%S"),
+                                                          os.path.basename(self.directory)))
+            dest, n = base, 1
+            while os.path.exists(dest):
+                n += 1
+                dest = "{}-{}".format(base, n)
+            os.makedirs(dest)
+            for name in files:
+                os.rename(os.path.join(self.directory, name), os.path.join(dest, name))
+            prune_archive(archive_dir, keep)
+        else:
+            for name in files:
+                os.remove(os.path.join(self.directory, name))
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass  # Something else lives there; leave it
+        self.seq = 0
+        self.events_since_snapshot = 0
+        return dest
+
+    def rotate(self, game, archive_dir, keep=ARCHIVE_KEEP):
+        """archive() the log so far and start a new one from a snapshot of
+        game, so restore() still returns game as it is now."""
+        seq = self.seq
+        dest = self.archive(archive_dir, keep)
+        self.seq = seq
+        self.snapshot(game)
+        return dest
+
+    def restore(self):
+        """Rebuild the game from the latest snapshot plus the events after it.
+
+        Returns None when there is nothing to restore. A snapshot from an
+        older format is ignored and the whole log is replayed instead.
+        """
+        game, seq, offset = None, 0, 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                data = f.read()
+            try:
+                game = snapshot.loads(buffer(data, _POSITION.size))
+                seq, offset = _POSITION.unpack_from(data)
+            except (ValueError, struct.error):
+                game = None
+        if not os.path.exists(self.events_path):
+            self.seq = seq
+            return game
+
+        if game is None:
+            game = new_game()
+        replayed = 0
+        with open(self.events_path, 'r+b') as f:
+            f.seek(offset)
+            good_offset = offset
+            for line in iter(f.readline, ''):
+                if not line.endswith("\n"):
+                    # Torn write from a crash: drop it so new events start on a fresh line
+                    f.seek(good_offset)
+                    f.truncate()
+                    break
+                good_offset += len(line)
+                event_seq = self.apply_event(game, line, seq)
+                if event_seq > seq:
+                    seq = event_seq
+                    replayed += 1
+
+        self.seq = seq
+        self.events_since_snapshot = replayed
+        return game
+
+    @staticmethod
+    def apply_event(game, line, after_seq=0):
+        """Apply one log line to game unless it is already covered by after_seq."""
+        fields = line.rstrip("\n").split("\t", 4)
+        seq = int(fields[0])
+        if seq <= after_seq:
+            return seq
+        if fields[1] == "S":
+            game.rng = GameRNG(int(fields[2]))
+        elif fields[1] == "J":
+            game.add_player(fields[2])
+        elif fields[1] == "C":
+            if fields[3] != "-":
+                game.pending_rolls.append(int(fields[3]))
+            game.handle_command(fields[2], fields[4])
+        return seq
+
+
+def prune_archive(archive_dir, keep):
+    """Delete all but the newest keep archived games in archive_dir."""
+    # Names start with the archive time, so they sort oldest first
+    names = sorted(name for name in os.listdir(archive_dir)
+                   if os.path.isdir(os.path.join(archive_dir, name)))
+    for name in names[:max(0, len(names) - keep)]:
+        shutil.rmtree(os.path.join(archive_dir, name), ignore_errors=True)
@@ -3,23 +3,139 @@
 
 # game.py
 
-import random
+from distance import adjacency
+from player import Player, RESOURCE_TYPES, RESOURCE_INDEX, new_hand, cost_items
+from rng import GameRNG
+from trade import TradeBook, trade_ratios
 
-RESOURCE_TYPES = ['brick', 'lumber', 'wool', 'grain', 'ore']
+BUILD_PIECES = ('road', 'settlement', 'city')
 
-class Player(object):
-    def __init__(self, nick):
-        self.nick = nick
-        self.resources = dict((r, 0) for r in RESOURCE_TYPES)
-        self.roads = set()
-        self.settlements = set()
-        self.cities = set()
+BUILD_COSTS = {
+    'road': {'brick': 1, 'lumber': 1},
+    'settlement': {'brick': 1, 'lumber': 1, 'wool': 1, 'grain': 1},
+    'city': {'grain': 2, 'ore': 3},
+}
 
-    def total_victory_points(self):
-        return len(self.settlements) + 2 * len(self.cities)
+# Dealt at game start: enough for two settlements with a road each
+STARTING_RESOURCES = {'brick': 4, 'lumber': 4, 'wool': 2, 'grain': 2}
+
+# Buildings a player may put down anywhere before settlements need a road
+SETUP_BUILDINGS = 2
+
+# The same as (resource index, n) pairs, for arithmetic on Player.resources
+BUILD_COST_ITEMS = dict((piece, cost_items(cost)) for piece, cost in BUILD_COSTS.items())
+STARTING_ITEMS = cost_items(STARTING_RESOURCES)
+
+# Victory points a piece is worth, and what it takes to win
+PIECE_POINTS = {'road': 0, 'settlement': 1, 'city': 2}
+WINNING_POINTS = 10
+
+# The longest road, once it is at least LONGEST_ROAD_MIN roads, is worth
+# LONGEST_ROAD_POINTS; a tie leaves the bonus where it is
+LONGEST_ROAD_MIN = 5
+LONGEST_ROAD_POINTS = 2
+
+# Number tokens handed out to land tiles in order, repeating on bigger maps
+NUMBER_TOKENS = [2, 3, 3, 4, 4, 5, 5, 6, 6, 8, 8, 9, 9, 10, 10, 11, 11, 12]
+
+class Command(object):
+    """A chat message parsed once into its verb and typed arguments.
+
+    args is None when the verb is known but its arguments are malformed.
+    """
+    __slots__ = ('verb', 'args')
+
+    def __init__(self, verb, args):
+        self.verb = verb
+        self.args = args
+
+def _parse_no_args(words):
+    if len(words) != 1:
+        raise ValueError("takes no arguments")
+    return ()
+
+def _parse_robber_args(words):
+    if len(words) != 2:
+        raise ValueError("usage: !robber <tile>")
+    return (words[1],)
+
+def _parse_build_args(words):
+    if len(words) != 3 or words[1] not in BUILD_PIECES:
+        raise ValueError("usage: !build <road|settlement|city> <id>")
+    return (words[1], int(words[2]))
+
+def _parse_trade_args(words):
+    if len(words) == 2 and words[1] == 'cancel':
+        return ('cancel',)
+    if len(words) == 4 and words[1] == 'bank':
+        if words[2] in RESOURCE_TYPES and words[3] in RESOURCE_TYPES and words[2] != words[3]:
+            return ('bank', words[2], words[3])
+    elif len(words) == 5 and words[2] in RESOURCE_TYPES and words[4] in RESOURCE_TYPES and words[2] != words[4]:
+        give_n, want_n = int(words[1]), int(words[3])
+        if 0 < give_n <= 99 and 0 < want_n <= 99:
+            return ('offer', words[2], give_n, words[4], want_n)
+    raise ValueError("usage: !trade <n> <resource> <n> <resource> | !trade bank <resource> <resource> | !trade cancel")
+
+# verb -> argument parser; anything else starting with "!" is chatter
+COMMAND_PARSERS = {
+    '!ready': _parse_no_args,
+    '!roll': _parse_no_args,
+    '!pass': _parse_no_args,
+    '!robber': _parse_robber_args,
+    '!build': _parse_build_args,
+    '!trade': _parse_trade_args,
+}
+
+# Commands are immutable, so repeated lines ("!roll", "!pass") are parsed once
+_command_cache = {}
+_COMMAND_CACHE_SIZE = 4096
+
+def parse_command(msg):
+    """Parse a chat line into a Command, or None if it is not a game command."""
+    if not msg.startswith("!"):
+        return None
+    try:
+        return _command_cache[msg]
+    except KeyError:
+        pass
+    words = msg.split()
+    parser = COMMAND_PARSERS.get(words[0])
+    if parser is None:
+        cmd = None
+    else:
+        try:
+            args = parser(words)
+        except ValueError:
+            args = None
+        cmd = Command(words[0], args)
+    if len(_command_cache) >= _COMMAND_CACHE_SIZE:
+        _command_cache.clear()
+    _command_cache[msg] = cmd
+    return cmd
+
+def tile_key(tile):
+    """The "x,y,z" form players use to name a tile in chat."""
+    return "{},{},{}".format(tile.x, tile.y, tile.z)
+
+def parse_tile_key(key):
+    """The (x, y, z) coord named by a tile_key() string, or None if malformed."""
+    try:
+        x, y, z = [int(n) for n in key.split(",")]
+    except ValueError:
+        return None
+    return (x, y, z)
+
+def new_game(radius=3, seed=None):
+    """A GameState playing on a fresh default map of the given radius.
+
+    Games from the same seed roll the same dice; None picks a random seed.
+    """
+    from board import GameBoard
+    from snapshot import default_hexmap
+    return GameState(board=GameBoard(default_hexmap(radius)), seed=seed)
 
 class GameState(object):
-    def __init__(self):
+    def __init__(self, board=None, seed=None):
         self.players = {}
         self.ready_players = set()
         self.turn_order = []
@@ -27,50 +143,120 @@ class GameState(object):
         self.game_active = False
         self.state = 'awaiting_ready'
         self.robber_tile = None
+        self.version = 0          # Bumped for every join and every command that reaches a handler
+        self.last_roll = None
+        self.pending_rolls = []   # Dice to use instead of rolling (event log replay)
+        self.rng = GameRNG(seed)
+        self.deltas = []          # Delta ops of the last change, see take_deltas()
+        self.trail = None         # Undo entries while inside make_move()
+        self.canonical = None     # (version, snapshot bytes) cached by snapshot.canonical()
+        self.board = None
+        self.tile_resources = {}  # tile coord -> resource it produces
+        self.number_tiles = {}    # dice number -> producing tiles
+        self.trades = TradeBook() # Open offers; dropped at the end of every turn
+        self.ports = {}           # node -> resource of a 2:1 harbour, None for 3:1; the default map has none
+        self.trade_ratios = {}    # nick -> {resource: bank ratio}, rebuilt when they settle on a harbour
+        if board is not None:
+            self.attach_board(board)
+
+    def attach_board(self, board):
+        """Play on board; land tiles get a resource and a number token."""
+        self.board = board
+        self.tile_resources = {}
+        self.number_tiles = {}
+        land = sorted((t for t in board.hexmap.tiles.values() if t.tile_type == 'land'), key=lambda t: t.id)
+        for i, tile in enumerate(land):
+            self.tile_resources[(tile.x, tile.y, tile.z)] = RESOURCE_TYPES[i % len(RESOURCE_TYPES)]
+            self.number_tiles.setdefault(NUMBER_TOKENS[i % len(NUMBER_TOKENS)], []).append(tile)
 
     def add_player(self, nick):
         if nick not in self.players:
-            self.players[nick] = Player(nick)
+            player = Player(nick, len(self.players) + 1)
+            self.players[nick] = player
+            if self.board is not None:
+                self.board.add_player(player.id, nick, player)
+            self.version += 1
+            self.deltas = ["J:{}".format(nick)]
 
     def handle_command(self, sender, msg):
+        cmd = parse_command(msg)
+        if cmd is None:
+            return []  # Chatter and unknown verbs are ignored before any state checks
 
-        if not msg.startswith("!"):
-            return[]  # Ignore silently or optionally log this
+        handler = self.ANY_STATE.get(cmd.verb)
+        if handler is None:
+            if self.state == 'awaiting_ready':
+                return ["!not-started"]
 
-        responses = []
+            handler = self.ANY_TURN.get((self.state, cmd.verb))
+            if handler is None:
+                if sender != self.turn_order[self.current_turn_index]:
+                    return ["!not-your-turn {}".format(sender)]
 
-        if msg == "!ready":
-            return self.handle_ready(sender)
+                handler = self.DISPATCH.get((self.state, cmd.verb))
+                if handler is None:
+                    return [self.STATE_REJECTIONS.get(self.state, "!invalid-state")]
 
-        if self.state == 'awaiting_ready':
-            return ["!not-started"]
+        if cmd.args is None:
+            return ["!usage-{}".format(cmd.verb[1:])]
+        self.version += 1
+        self.deltas = []
+        return handler(self, sender, *cmd.args)
 
-        if sender != self.current_player():
-            return ["!not-your-turn {}".format(sender)]
+    def take_deltas(self):
+        """Delta ops describing the last join or accepted command.
 
-        if self.state == 'awaiting_roll':
-            if msg == "!roll":
-                return self.handle_roll(sender)
-            return ["!must-roll"]
+        Each op is "<kind>:<fields>" and apply_delta() replays it on a mirror:
+        J join, R ready, O turn order, S state, $ resources, B build,
+        X robber, D dice, W winner (clears the ready flags).
+        """
+        deltas, self.deltas = self.deltas, []
+        return deltas
 
-        if self.state == 'awaiting_robber_move':
-            if msg.startswith("!robber"):
-                return self.handle_robber(sender, msg)
-            return ["!awaiting-robber"]
+    def emit_state(self):
+        self.deltas.append("S:{}:{}:{}".format(self.state, self.current_turn_index, int(self.game_active)))
 
-        if self.state == 'awaiting_actions':
-            if msg == "!pass":
-                return self.handle_pass(sender)
-            if msg.startswith("!build") or msg.startswith("!trade"):
-                return ["!action-accepted"]
-            return ["!unknown-action"]
+    def emit_resources(self, player):
+        self.deltas.append("$:{}:{}".format(player.nick, ",".join(str(n) for n in player.resources)))
 
-        return ["!invalid-state"]
+    def apply_delta(self, op):
+        """Apply one op from take_deltas() of the authoritative game."""
+        kind, _, rest = op.partition(":")
+        if kind == "J":
+            self.add_player(rest)
+        elif kind == "R":
+            self.ready_players.add(rest)
+        elif kind == "O":
+            self.turn_order = rest.split(",")
+        elif kind == "S":
+            state, index, active = rest.split(":")
+            self.state = state
+            self.current_turn_index = int(index)
+            self.game_active = active == "1"
+        elif kind == "$":
+            nick, counts = rest.split(":")
+            self.players[nick].resources = new_hand([int(n) for n in counts.split(",")])
+        elif kind == "B":
+            nick, piece, location = rest.split(":")
+            self.place_piece(self.players[nick], piece, int(location))
+        elif kind == "X":
+            self.robber_tile = rest
+        elif kind == "D":
+            self.last_roll = int(rest)
+        elif kind == "W":
+            self.ready_players = set()
+        else:
+            raise ValueError("unknown delta op {}".format(op))
 
     def handle_ready(self, sender):
         responses = []
-        if sender in self.players:
+        if self.game_active or self.state != 'awaiting_ready':
+            responses.append("!already-started")
+        elif sender in self.players:
+            if self.trail is not None and sender not in self.ready_players:
+                self.trail.append(('ready', sender))
             self.ready_players.add(sender)
+            self.deltas.append("R:{}".format(sender))
             responses.append("!player-ready {}".format(sender))
             if len(self.ready_players) >= 2 and self.ready_players == set(self.players.keys()):
                 responses += self.start_game()
@@ -79,44 +265,393 @@ class GameState(object):
         return responses
 
     def start_game(self):
-        self.turn_order = list(self.players.keys())
+        # Sorted so a restored game deals the same order as the original
+        if self.trail is not None:
+            self.trail.append(('order', self.turn_order))
+        self.turn_order = sorted(self.players)
         self.current_turn_index = 0
         self.game_active = True
         self.state = 'awaiting_roll'
+        self.deltas.append("O:{}".format(",".join(self.turn_order)))
+        self.emit_state()
+        for nick in self.turn_order:
+            player = self.players[nick]
+            for r, n in STARTING_ITEMS:
+                self.credit(player, r, n)
+            self.emit_resources(player)
         return ["!game-start", "Game started.", "!turn {}".format(self.current_player())]
 
     def handle_roll(self, sender):
         dice = self.roll_dice()
+        self.deltas.append("D:{}".format(dice))
         responses = ["!rolled {} {}".format(sender, dice)]
         if dice == 7:
             self.state = 'awaiting_robber_move'
             responses.append("!robber {}".format(sender))
         else:
+            self.distribute_resources(dice)
             responses.append("!resources-distributed {}".format(dice))
             self.state = 'awaiting_actions'
+        self.emit_state()
         return responses
 
-    def handle_robber(self, sender, msg):
-        parts = msg.split()
-        if len(parts) != 2:
-            return ["!usage-robber"]
-        tile = parts[1]
+    def distribute_resources(self, dice):
+        """Pay every settlement (1) and city (2) next to a tile numbered dice."""
+        if self.board is None:
+            return
+        board = self.board
+        blocked = parse_tile_key(self.robber_tile) if self.robber_tile else None
+        paid = set()
+        for tile in self.number_tiles.get(dice, ()):
+            coord = (tile.x, tile.y, tile.z)
+            if coord == blocked:
+                continue
+            resource = RESOURCE_INDEX[self.tile_resources[coord]]
+            for node in tile.nodes:
+                owner = board.node_owners.get(node)
+                if owner is None:
+                    continue
+                player = board.players[owner]
+                self.credit(player, resource, 2 if node in player.cities else 1)
+                paid.add(player.nick)
+        for nick in sorted(paid):
+            self.emit_resources(self.players[nick])
+
+    def handle_robber(self, sender, tile):
+        victims = []
+        if self.board is not None:
+            coord = parse_tile_key(tile)
+            if coord not in self.tile_resources:
+                return ["!invalid-robber {}".format(tile)]
+            tile = "{},{},{}".format(*coord)  # Canonical, so production checks compare equal
+            own_id = self.players[sender].id
+            board_players = self.board.players
+            victims = sorted(board_players[owner].nick for owner in self.board.building_owners(coord)
+                             if owner != own_id)
         self.robber_tile = tile
         self.state = 'awaiting_actions'
-        return ["!robber-moved {}".format(tile)]
+        self.deltas.append("X:{}".format(tile))
+        self.emit_state()
+        responses = ["!robber-moved {}".format(tile)]
+        if victims:
+            responses.append("!robber-victims {}".format(" ".join(victims)))
+        return responses
 
     def handle_pass(self, sender):
-        winner = self.check_winner()
-        if winner:
-            self.state = 'awaiting_ready'
-            self.game_active = False
-            return ["!winner {}".format(winner)]
+        self.expire_trades()
         self.next_turn()
         self.state = 'awaiting_roll'
+        self.emit_state()
         return ["!turn {}".format(self.current_player())]
 
+    def handle_build(self, sender, piece, location):
+        if self.board is None:
+            return ["!action-accepted"]
+        player = self.players[sender]
+        if not self.can_place(player, piece, location):
+            return ["!invalid-build {} {}".format(piece, location)]
+        cost = BUILD_COST_ITEMS[piece]
+        if not player.can_afford(cost):
+            return ["!cannot-afford {}".format(piece)]
+        for r, n in cost:
+            self.credit(player, r, -n)
+        self.place_piece(player, piece, location)
+        self.deltas.append("B:{}:{}:{}".format(sender, piece, location))
+        self.emit_resources(player)
+        responses = ["!built {} {} {}".format(sender, piece, location)]
+        if player.victory_points >= WINNING_POINTS:
+            responses += self.end_game(sender)
+        return responses
+
+    def end_game(self, winner):
+        """winner just reached WINNING_POINTS: the game is over there and then."""
+        self.expire_trades()
+        self.state = 'awaiting_ready'
+        self.game_active = False
+        # Everyone readies again for the next game
+        if self.trail is not None:
+            self.trail.append(('unready', self.ready_players))
+        self.ready_players = set()
+        self.emit_state()
+        self.deltas.append("W:{}".format(winner))
+        return ["!winner {}".format(winner)]
+
+    def can_place(self, player, piece, location):
+        """Whether player may put piece at location, an edge id for a road
+        and a node id otherwise.
+
+        A settlement needs an empty node with no building on any node next
+        to it, and one of player's roads leading to it once they have
+        SETUP_BUILDINGS buildings. A road needs a free edge with one of
+        player's buildings at an end, or one of player's roads at an end
+        that nobody else has built on. A city replaces player's settlement.
+        """
+        hexmap = self.board.hexmap
+        node_owners = self.board.node_owners
+        road_owners = hexmap.road_owners
+        edge_nodes, node_edges = adjacency(hexmap)
+        if piece == 'road':
+            ends = edge_nodes.get(location)
+            if ends is None or location in road_owners:
+                return False
+            for node in ends:
+                owner = node_owners.get(node)
+                if owner == player.id:
+                    return True
+                if owner is None and any(road_owners.get(e) == player.id for e in node_edges[node]):
+                    return True
+            return False
+        if piece == 'settlement':
+            edges = node_edges.get(location)
+            if edges is None or location in node_owners:
+                return False
+            for edge_id in edges:
+                for node in edge_nodes[edge_id]:
+                    if node in node_owners:
+                        return False
+            if len(player.settlements) + len(player.cities) < SETUP_BUILDINGS:
+                return True
+            return any(road_owners.get(e) == player.id for e in edges)
+        return location in player.settlements
+
+    def place_piece(self, player, piece, location):
+        """Put a piece on the board for player; costs are the caller's business.
+
+        player is also the board's record, so make_build() updates its pieces.
+        """
+        record = self.board.make_build(player.id, piece, location)
+        if piece == 'settlement':
+            self.score(player, PIECE_POINTS['settlement'])
+            if location in self.ports:
+                self.trade_ratios.pop(player.nick, None)
+        elif piece == 'city':
+            self.score(player, PIECE_POINTS['city'] - (PIECE_POINTS['settlement'] if record[4] else 0))
+        if self.trail is not None:
+            self.trail.append(('piece', player, record))
+        if piece == 'road' and len(player.roads) >= LONGEST_ROAD_MIN:
+            self.update_longest_road(player)
+        elif piece == 'settlement':
+            self.cut_roads(player, location)
+
+    def update_longest_road(self, player):
+        """Measure player's roads after a road build and move the longest
+        road bonus to them if they now have it.
+
+        Only the builder's road can get longer, so only they are measured.
+        """
+        if player.has_longest_road:
+            self.board.compute_longest_road_for_player(player.id)
+            return
+        length = self.board.compute_longest_road_for_player(player.id)
+        if length < LONGEST_ROAD_MIN:
+            return
+        holder = self.longest_road_holder()
+        if holder is not None and holder.longest_road_length >= length:
+            return
+        self.move_longest_road(holder, player)
+        if self.trail is not None:
+            self.trail.append(('longest', holder, player))
+
+    def cut_roads(self, player, node):
+        """Remeasure the roads player's new settlement at node cuts, and
+        take the bonus from its holder if their road is no longer the
+        longest: it goes to a sole longest road of LONGEST_ROAD_MIN or more,
+        and to nobody on a tie."""
+        board = self.board
+        road_owners = board.hexmap.road_owners
+        cut = set(road_owners.get(e) for e in adjacency(board.hexmap)[1].get(node, ()))
+        for p in self.players.itervalues():
+            if p.id not in cut or p is player or len(p.roads) < LONGEST_ROAD_MIN:
+                continue
+            length = p.longest_road_length
+            if board.compute_longest_road_for_player(p.id) != length and self.trail is not None:
+                self.trail.append(('length', p, length))
+        holder = self.longest_road_holder()
+        if holder is None or holder.id not in cut:
+            return
+        best = max(p.longest_road_length for p in self.players.itervalues())
+        if holder.longest_road_length == best and best >= LONGEST_ROAD_MIN:
+            return
+        leaders = [p for p in self.players.itervalues() if p.longest_road_length == best]
+        successor = leaders[0] if len(leaders) == 1 and best >= LONGEST_ROAD_MIN else None
+        self.move_longest_road(holder, successor)
+        if self.trail is not None:
+            self.trail.append(('longest', holder, successor))
+
+    def longest_road_holder(self):
+        for p in self.players.itervalues():
+            if p.has_longest_road:
+                return p
+        return None
+
+    def move_longest_road(self, holder, player):
+        """Take the bonus from holder (None if nobody has it) and give it to
+        player (None to leave nobody with it)."""
+        if holder is not None:
+            holder.has_longest_road = False
+            self.score(holder, -LONGEST_ROAD_POINTS)
+        if player is not None:
+            player.has_longest_road = True
+            self.score(player, LONGEST_ROAD_POINTS)
+
+    def score(self, player, points):
+        """Add points (possibly negative) to player's victory points.
+
+        Every change goes through here (pieces and the longest road bonus),
+        so totals never need a recount and a win shows up the moment it
+        happens.
+        """
+        player.victory_points += points
+
+    def credit(self, player, resource, n):
+        """Add n (possibly negative) of resource, a RESOURCE_INDEX, to player's hand."""
+        player.resources[resource] += n
+        if self.trail is not None:
+            self.trail.append(('res', player, resource, n))
+
+    def make_move(self, sender, msg):
+        """handle_command() that can be taken back with unmake_move().
+
+        Returns (responses, undo). The undo record holds the scalar fields
+        as they were plus a trail of what the handler changed (resources,
+        pieces, ready flags), so unmaking costs as much as the move did and
+        search needs no copies of the game. Moves must be unmade in reverse
+        order.
+        """
+        scalars = (self.version, self.state, self.current_turn_index, self.game_active,
+                   self.robber_tile, self.last_roll, self.rng.mark())
+        self.trail = trail = []
+        self.canonical = None  # The version may be reused by another move after unmake_move()
+        try:
+            responses = self.handle_command(sender, msg)
+        finally:
+            self.trail = None
+        return responses, (scalars, trail)
+
+    def unmake_move(self, undo):
+        scalars, trail = undo
+        for entry in reversed(trail):
+            kind = entry[0]
+            if kind == 'res':
+                entry[1].resources[entry[2]] -= entry[3]
+            elif kind == 'piece':
+                player, record = entry[1], entry[2]
+                piece, location = record[0], record[2]
+                if piece == 'settlement':
+                    self.score(player, -PIECE_POINTS['settlement'])
+                    if location in self.ports:
+                        self.trade_ratios.pop(player.nick, None)
+                elif piece == 'city':
+                    self.score(player, (PIECE_POINTS['settlement'] if record[4] else 0) - PIECE_POINTS['city'])
+                self.board.unmake_build(record)
+            elif kind == 'longest':
+                self.move_longest_road(entry[2], entry[1])
+            elif kind == 'length':
+                entry[1].longest_road_length = entry[2]
+            elif kind == 'ready':
+                self.ready_players.discard(entry[1])
+            elif kind == 'unready':
+                self.ready_players = entry[1]
+            elif kind == 'order':
+                self.turn_order = entry[1]
+            elif kind == 'pending':
+                self.pending_rolls.insert(0, entry[1])
+            elif kind == 'posted':
+                self.trades.unpost(entry[1], entry[2])
+            elif kind == 'withdrawn':
+                self.trades.restore(entry[1])
+            elif kind == 'book':
+                self.trades = entry[1]
+        (self.version, self.state, self.current_turn_index, self.game_active,
+         self.robber_tile, self.last_roll, dice_mark) = scalars
+        self.rng.rewind(dice_mark)
+        self.deltas = []
+        self.canonical = None
+
+    def handle_trade(self, sender, kind, *args):
+        """Offers from anyone, taken or matched only with the player on turn."""
+        player = self.players.get(sender)
+        if player is None:
+            return ["!join-first"]
+        trades = self.trades
+        if kind == 'cancel':
+            offers = trades.offers_of(sender)
+            for offer in offers:
+                trades.withdraw(offer)
+                if self.trail is not None:
+                    self.trail.append(('withdrawn', offer))
+            return ["!trade-cancelled {} {}".format(sender, len(offers))]
+
+        current = self.current_player()
+        if kind == 'bank':
+            if sender != current:
+                return ["!not-your-turn {}".format(sender)]
+            give, want = args
+            ratio = self.trade_ratio(player, give)
+            gi, wi = RESOURCE_INDEX[give], RESOURCE_INDEX[want]
+            if player.resources[gi] < ratio:
+                return ["!cannot-afford trade"]
+            self.credit(player, gi, -ratio)
+            self.credit(player, wi, 1)
+            self.emit_resources(player)
+            return ["!traded {} {} {} bank 1 {}".format(sender, ratio, give, want)]
+
+        give, give_n, want, want_n = args
+        gi, wi = RESOURCE_INDEX[give], RESOURCE_INDEX[want]
+        if player.resources[gi] < give_n:
+            return ["!cannot-afford trade"]
+        players = self.players
+
+        def acceptable(offer):
+            # Matching terms mean offer gives want_n of want
+            if offer.nick == sender or current not in (sender, offer.nick):
+                return False
+            return players[offer.nick].resources[wi] >= want_n
+
+        offer = trades.match((want, want_n, give, give_n), acceptable)
+        if offer is not None:
+            trades.withdraw(offer)
+            if self.trail is not None:
+                self.trail.append(('withdrawn', offer))
+            other = players[offer.nick]
+            self.credit(player, gi, -give_n)
+            self.credit(other, gi, give_n)
+            self.credit(other, wi, -want_n)
+            self.credit(player, wi, want_n)
+            for p in sorted((player, other), key=lambda p: p.nick):
+                self.emit_resources(p)
+            return ["!traded {} {} {} {} {} {}".format(sender, give_n, give, offer.nick, want_n, want)]
+
+        terms = (give, give_n, want, want_n)
+        offer = trades.find(sender, terms)
+        if offer is None:
+            offer, evicted = trades.post(sender, *terms)
+            if self.trail is not None:
+                self.trail.append(('posted', offer, evicted))
+        return ["!trade-offer {}".format(offer.describe())]
+
+    def trade_ratio(self, player, resource):
+        ratios = self.trade_ratios.get(player.nick)
+        if ratios is None:
+            ratios = trade_ratios(player.settlements | player.cities, self.ports, RESOURCE_TYPES)
+            self.trade_ratios[player.nick] = ratios
+        return ratios[resource]
+
+    def expire_trades(self):
+        if self.trades:
+            if self.trail is not None:
+                self.trail.append(('book', self.trades))
+            self.trades = TradeBook()
+
     def roll_dice(self):
-        return random.randint(1, 6) + random.randint(1, 6)
+        # Always draw, so the stream stays lined up with the roll count on replay
+        dice = self.rng.roll()
+        if self.pending_rolls:
+            dice = self.pending_rolls.pop(0)
+            if self.trail is not None:
+                self.trail.append(('pending', dice))
+        self.last_roll = dice
+        return dice
 
     def current_player(self):
         return self.turn_order[self.current_turn_index]
@@ -126,6 +661,32 @@ class GameState(object):
 
     def check_winner(self):
         for p in self.players.values():
-            if p.total_victory_points() >= 10:
+            if p.victory_points >= WINNING_POINTS:
                 return p.nick
         return None
+
+    # Verbs accepted in every state, checked before the turn checks
+    ANY_STATE = {
+        '!ready': handle_ready,
+    }
+
+    # (state, verb) -> handler for verbs any player may send, checked before the turn check
+    ANY_TURN = {
+        ('awaiting_actions', '!trade'): handle_trade,
+    }
+
+    # (state, verb) -> handler(self, sender, *args)
+    DISPATCH = {
+        ('awaiting_roll', '!roll'): handle_roll,
+        ('awaiting_robber_move', '!robber'): handle_robber,
+        ('awaiting_actions', '!pass'): handle_pass,
+        ('awaiting_actions', '!build'): handle_build,
+    }
+
+    # Reply for a known verb sent in a state that does not accept it
+    STATE_REJECTIONS = {
+        'awaiting_ready': "!not-started",
+        'awaiting_roll': "!must-roll",
+        'awaiting_robber_move': "!awaiting-robber",
+        'awaiting_actions': "!unknown-action",
+    }
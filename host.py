@@ -4,42 +4,155 @@
 # host.py
 
 import ConfigParser
-import ssl
 import sys
 import threading
 import time
 import os
 
-from irc.client import SimpleIRCClient, NickMask, ServerConnectionError
-from irc.connection import Factory
+from irc.client import SimpleIRCClient, NickMask, ServerConnectionError, ServerNotConnectedError
 
-from game import GameState
+import metrics
+import profiling
+from game import new_game, parse_command
+from eventlog import ARCHIVE_DIR, ARCHIVE_KEEP, GameLog
+from mirror import RESYNC_VERB, CATCHUP_VERB, DeltaHistory, catchup_lines, delta_line, state_lines
+from outbox import Outbox, LINE_INTERVAL as REPLY_LINE_INTERVAL
+from reconnect import Reconnector
+from spectate import BOARD_VERB, LINE_INTERVAL, MIN_INTERVAL, BoardFeed
+
+STATS_VERB = "!stats"
+STATS_INTERVAL = 60.0  # Seconds between !stats replies
 
 class Host(SimpleIRCClient):
-    def __init__(self, config, owner_username):
+    def __init__(self, config, owner_username=None, state_dir=None):
         SimpleIRCClient.__init__(self)
         self.config = config
-        self.owner_username = owner_username
         self.lobby_channel = config.get('irc', 'channel')
-        self.game_channel = "&catan-game-{}".format(owner_username)
         self.running = True
         self.broadcast_running = True
         self.present_nicks = set()
-        self.game = GameState()
+        self.reconnector = Reconnector(self, config)
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.log_path = os.path.join(script_dir, 'host_debug.log')
+        # Per-game event logs; a restarted host picks up where the last one died
+        if state_dir is None:
+            state_dir = os.path.join(script_dir, 'games')
+        self.state_dir = state_dir
+        self.archive_dir = os.path.join(state_dir, ARCHIVE_DIR)
+        if config.has_option('host', 'archived_games'):
+            self.archive_keep = config.getint('host', 'archived_games')
+        else:
+            self.archive_keep = ARCHIVE_KEEP
+        # A host without an owner is an idle hostpool.py worker
+        self.owner_username = None
+        self.game_channel = None
+        self.game = None
+        # Multi-line NOTICE replies (!resync, !catchup, !stats), paced and coalesced per nick
+        self.outbox = Outbox(self.send_queued_notice, self.reactor.scheduler.execute_after,
+                             self.config_float('reply_line_interval', REPLY_LINE_INTERVAL))
+        self.clock = time.time
+        self.stats_interval = self.config_float('stats_interval', STATS_INTERVAL)
+        self.next_stats = 0.0  # Earliest time the next !stats is answered
+        if owner_username is not None:
+            self.assign_owner(owner_username)
+
+    def assign_owner(self, owner_username):
+        """Host owner_username's game.
+
+        An idle pooled host that is already connected takes the owner's
+        nick and joins the channels straight away.
+        """
+        self.owner_username = owner_username
+        self.game_channel = "&catan-game-{}".format(owner_username)
+        self.game_log = GameLog(os.path.join(self.state_dir, owner_username))
+        self.history = DeltaHistory()  # Recent !delta lines for !catchup
+        self.invited = set()  # Nicks that asked to play; anyone else joining the game channel watches
+        self.board_feed = BoardFeed(lambda: self.game, self.send_board_line,
+                                    self.reactor.scheduler.execute_after,
+                                    self.config_float('board_line_interval', LINE_INTERVAL),
+                                    self.config_float('board_interval', MIN_INTERVAL))
+        self.game = self.game_log.restore()
+        if self.game is None:
+            self.game = new_game()
+            self.game_log.record_seed(self.game)
+        else:
+            self.debug_log("[HOST:{}] Restored game at event {}".format(owner_username, self.game_log.seq))
+        if self.config.has_option('host', 'verify_topology') and self.config.getboolean('host', 'verify_topology'):
+            self.verify_map()
+        if self.connection.is_connected():
+            self.connection.nick("HostBot_{}".format(owner_username))
+            self.join_channels()
+
+    def config_float(self, option, default):
+        if self.config.has_option('host', option):
+            return self.config.getfloat('host', option)
+        return default
+
+    def verify_map(self):
+        """Check the game map's node and edge ids and log the outcome."""
+        from topocheck import verify_topology  # Loads NumPy; opt-in via [host] verify_topology
+        with metrics.timer('map.verify'):
+            report = verify_topology(self.game.board.hexmap)
+        for line in report.lines():
+            self.debug_log("[HOST:{}] {}".format(self.owner_username, line))
 
     def debug_log(self, message):
         """Write debug messages to a log file since curses blocks stdout"""
         try:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            log_path = os.path.join(script_dir, 'host_debug.log')
-            with open(log_path, 'a') as f:
-                import datetime
-                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                f.write("[{}] {}\n".format(timestamp, message))
+            with metrics.timer('log.debug_write'):
+                with open(self.log_path, 'a') as f:
+                    import datetime
+                    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    f.write("[{}] {}\n".format(timestamp, message))
         except:
             pass  # Ignore logging errors
 
+    def privmsg(self, target, line):
+        metrics.count('irc.out')
+        self.connection.privmsg(target, line)
+
+    def notice(self, target, line):
+        metrics.count('irc.out')
+        self.connection.notice(target, line)
+
+    def send_queued_notice(self, nick, line):
+        try:
+            self.notice(nick, line)
+        except ServerNotConnectedError:
+            pass  # Reconnecting; the client asks again when its reply doesn't arrive
+
+    def send_board_line(self, line):
+        try:
+            self.privmsg(self.game_channel, line)
+        except ServerNotConnectedError:
+            pass  # Reconnecting; the board is only a courtesy
+
+    def send_stats(self, nick):
+        """Answer the owner's !stats with the metrics registry, one NOTICE
+        per line, at most once every stats_interval seconds."""
+        if nick != self.owner_username:
+            return
+        now = self.clock()
+        if now < self.next_stats:
+            metrics.count('host.stats_refused')
+            return
+        self.next_stats = now + self.stats_interval
+        self.outbox.request(nick, STATS_VERB, self.stats_lines)
+
+    def stats_lines(self):
+        metrics.gauge('host.players', len(self.game.players))
+        metrics.gauge('host.delta_history', len(self.history.lines))
+        return ["{} {}".format(STATS_VERB, line) for line in metrics.REGISTRY.format_stats()]
+
     def on_welcome(self, connection, event):
+        self.reconnector.registered()
+        if self.owner_username is None:
+            self.debug_log("[HOST] Connected as idle pool host {}".format(connection.get_nickname()))
+            return
+        self.join_channels()
+
+    def join_channels(self):
+        connection = self.connection
         self.debug_log("[HOST:{}] Connected successfully! Joining channels...".format(self.owner_username))
         connection.join(self.lobby_channel)
         connection.join(self.game_channel)
@@ -48,42 +161,124 @@ class Host(SimpleIRCClient):
         self.start_broadcast_thread()
         self.start_invite_monitor_thread()
 
+    def on_nicknameinuse(self, connection, event):
+        self.reconnector.nick_in_use()
+
     def on_pubmsg(self, connection, event):
         sender = NickMask(event.source).nick
         msg = event.arguments[0].strip()
+        metrics.count('irc.in')
 
         self.debug_log("[HOST:{}] Received message from {}: '{}' in channel {}".format(self.owner_username, sender, msg, event.target))
         
         if event.target == self.lobby_channel and msg == "!join {}".format(self.owner_username):
             self.debug_log("[HOST:{}] Processing join request from {}".format(self.owner_username, sender))
+            self.invited.add(sender)
             self.send_invite(sender)
+        elif event.target == self.game_channel and msg == STATS_VERB:
+            self.send_stats(sender)
+        elif event.target == self.game_channel and msg == BOARD_VERB:
+            self.board_feed.request(sender)
         elif event.target == self.game_channel:
+            version = self.game.version
+            # Timed here rather than in GameState, which also runs bot searches and replays
+            cmd = parse_command(msg)
+            start = time.time()
             responses = self.game.handle_command(sender, msg)
+            if cmd is not None:
+                metrics.observe('command.' + cmd.verb, time.time() - start)
+            if self.game.version != version:
+                self.game_log.record_command(self.game, sender, msg)
+                if responses and responses[-1].startswith("!winner "):
+                    self.archive_log(finished=True)
             for resp in responses:
                 if resp == "!game-start":
                     self.broadcast_running = False
                     self.debug_log("[HOST:{}] Broadcast stopped on !game-start".format(self.owner_username))
-                self.connection.privmsg(self.game_channel, resp)
+                self.privmsg(self.game_channel, resp)
+            if self.game.version != version:
+                self.publish_delta()
+
+    def on_privmsg(self, connection, event):
+        sender = NickMask(event.source).nick
+        words = event.arguments[0].split()
+        metrics.count('irc.in')
+        if self.game is None or not words:
+            return
+        if words == [STATS_VERB]:
+            self.send_stats(sender)
+        elif words == [RESYNC_VERB]:
+            if self.outbox.request(sender, RESYNC_VERB, lambda: state_lines(self.game)):
+                self.debug_log("[HOST:{}] Queued full state for {}".format(self.owner_username, sender))
+        elif words[0] == CATCHUP_VERB and len(words) == 2 and words[1].isdigit():
+            version = int(words[1])
+            # Made when the reply starts, so it runs up to the version live deltas continue from
+            if self.outbox.request(sender, CATCHUP_VERB, lambda: catchup_lines(self.game, self.history, version)):
+                self.debug_log("[HOST:{}] Queued catch-up for {} from version {}".format(
+                    self.owner_username, sender, version))
+
+    def archive_log(self, finished=False):
+        """Move the game's event log out of the state directory.
+
+        A finished game keeps going in memory (its players may !ready for
+        another round on the same board), so its log starts over from a
+        snapshot; a closed one is gone. See eventlog.py.
+        """
+        if finished:
+            path = self.game_log.rotate(self.game, self.archive_dir, self.archive_keep)
+        else:
+            path = self.game_log.archive(self.archive_dir, self.archive_keep)
+        self.debug_log("[HOST:{}] Event log {}".format(
+            self.owner_username, "archived to {}".format(path) if path else "deleted"))
+
+    def close_game(self):
+        """The owner is done with the game: archive its log and quit.
+
+        A pool release calls this from the pool's thread, so the work is
+        handed to the reactor rather than racing a command being logged.
+        """
+        self.running = False
+
+        def close():
+            if self.game is not None:
+                self.archive_log()
+            try:
+                self.connection.quit("Game closed.")
+            except Exception:
+                pass
+        self.reactor.scheduler.execute_after(0, close)
+
+    def publish_delta(self):
+        """Tell client mirrors what the last change did (see mirror.py)."""
+        line = delta_line(self.game, self.game.take_deltas())
+        self.history.add(self.game.version, line)
+        self.privmsg(self.game_channel, line)
 
     def on_join(self, connection, event):
         nick = NickMask(event.source).nick
         channel = event.target
         if channel == self.game_channel and nick != self.connection.get_nickname():
-            self.game.add_player(nick)
+            if nick not in self.game.players and nick in self.invited:
+                self.game.add_player(nick)
+                self.game_log.record_join(self.game, nick)
+                self.publish_delta()
 
     def send_invite(self, nick):
         self.debug_log("[HOST:{}] Sending invite to {} for channel {}".format(self.owner_username, nick, self.game_channel))
         self.connection.invite(nick, self.game_channel)
 
     def start_broadcast_thread(self):
+        # Still running from before a reconnect
+        if hasattr(self, 'broadcast_thread') and self.broadcast_thread.is_alive():
+            return
         def loop():
             while self.running:
                 visible_players = [p for p in self.game.players if p != self.connection.get_nickname()]
                 players_str = ', '.join(visible_players) if visible_players else 'None'
                 try:
-                    self.connection.privmsg(self.lobby_channel, "!host {} (Players: {})".format(self.owner_username, players_str))
-                except:
-                    break
+                    self.privmsg(self.lobby_channel, "!host {} (Players: {})".format(self.owner_username, players_str))
+                except ServerNotConnectedError:
+                    pass  # Reconnecting
                 time.sleep(5)
         self.broadcast_thread = threading.Thread(target=loop)
         self.broadcast_thread.daemon = False
@@ -95,10 +290,15 @@ class Host(SimpleIRCClient):
             self.broadcast_thread.join(timeout=2)
 
     def start_invite_monitor_thread(self):
+        if hasattr(self, 'invite_monitor_thread') and self.invite_monitor_thread.is_alive():
+            return
         def loop():
             while self.running:
                 self.present_nicks.clear()
-                self.connection.names(self.game_channel)
+                try:
+                    self.connection.names(self.game_channel)
+                except ServerNotConnectedError:
+                    pass  # Reconnecting
                 time.sleep(20)
         self.invite_monitor_thread = threading.Thread(target=loop)
         self.invite_monitor_thread.daemon = False
@@ -116,6 +316,8 @@ class Host(SimpleIRCClient):
             self.present_nicks.add(cleaned)
 
     def on_endofnames(self, connection, event):
+        if self.game is None:
+            return
         for player in self.game.players:
             if player not in self.present_nicks:
                 self.send_invite(player)
@@ -124,7 +326,10 @@ class Host(SimpleIRCClient):
         event_type = getattr(event, 'type', None)
         event_args = getattr(event, 'arguments', None)
         self.debug_log("[HOST:{}] Disconnected from server. Event: {} | Type: {} | Args: {}".format(self.owner_username, repr(event), event_type, event_args))
-        self.running = False
+        if self.running:
+            # Not a deliberate quit: the game and the threads carry on across the reconnect
+            self.reconnector.schedule()
+            return
         self.stop_broadcast_thread()
         self.stop_invite_monitor_thread()
         sys.exit(0)
@@ -170,18 +375,15 @@ def main():
     config.read(config_path)
     server = config.get('irc', 'server')
     port = config.getint('irc', 'port')
-    ssl_enabled = config.getboolean('irc', 'ssl')
 
     nick = "HostBot_{}".format(owner_username)
     print("[HOST:{}] Attempting to connect to {}:{} with nick '{}'".format(owner_username, server, port, nick))
     c = Host(config, owner_username)
+    metrics.start_dumping(config, os.path.join(script_dir, 'metrics_host_{}.json'.format(owner_username)))
+    profiling.install(config, 'host_{}'.format(owner_username), script_dir)
 
     try:
-        if ssl_enabled:
-            factory = Factory(wrapper=ssl.wrap_socket)
-        else:
-            factory = None
-        c.connect(server, port, nick, connect_factory=factory)
+        c.reconnector.connect(nick)
         print("[HOST:{}] Connection initiated successfully".format(owner_username))
     except ServerConnectionError as e:
         print("[HOST:{}] Connection failed: {}".format(owner_username, str(e)))
@@ -0,0 +1,304 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# hostpool.py - Warm pool of idle, already-connected hosts
+#
+# Starting "python host.py <nick>" cold pays for interpreter startup,
+# imports, the TLS handshake and IRC registration before the first !host
+# broadcast. The pool does all of that ahead of time: it keeps [hostpool]
+# size idle Host instances connected under placeholder nicks, and on request
+# hands one to an owner, which renames itself to HostBot_<owner> and joins
+# the lobby and game channels. The pool is then topped back up in the
+# background.
+#
+# Clients talk to the pool over a line-based TCP socket on localhost:
+#
+#   assign <owner>   ->  ok HostBot_<owner>   (or: error <reason>)
+#
+# An assign can take a while when the pool has run dry (a cold connect of
+# up to COLD_CONNECT_TIMEOUT) or the owner has a long event log to replay
+# (up to OWNER_TIMEOUT), so clients wait up to ASSIGN_TIMEOUT for the reply.
+# The host takes the owner on its own reactor thread, and "ok" goes out
+# only once it has. Once the pool has the
+# request, the client never starts a host of its own: asking again returns
+# the host the first request got.
+#   release <owner>  ->  ok                   (the host archives the game's log and quits)
+#   status           ->  ok idle <n> assigned <n>
+#
+#   python hostpool.py [--size 2]
+
+import ConfigParser
+import SocketServer
+import argparse
+import os
+import re
+import socket
+import threading
+import time
+
+from irc.client import ServerConnectionError
+
+import metrics
+import profiling
+
+DEFAULT_PORT = 6760
+DEFAULT_SIZE = 2
+COLD_CONNECT_TIMEOUT = 10.0  # Seconds an assign waits for a freshly spawned host to connect
+ASSIGN_TIMEOUT = 60.0        # Seconds a client waits for the reply to assign
+OWNER_TIMEOUT = 45.0         # Seconds an assign waits for the host's reactor to take the owner
+
+VALID_OWNER = re.compile(r"^[A-Za-z\[\]\\`_^{|}][A-Za-z0-9\[\]\\`_^{|}-]*$")
+
+
+def pool_address(config):
+    """(host, port) of the pool's control socket from the [hostpool] section."""
+    host, port = '127.0.0.1', DEFAULT_PORT
+    if config.has_section('hostpool'):
+        if config.has_option('hostpool', 'host'):
+            host = config.get('hostpool', 'host')
+        if config.has_option('hostpool', 'port'):
+            port = config.getint('hostpool', 'port')
+    return host, port
+
+
+class HostPool(object):
+    def __init__(self, config, size=DEFAULT_SIZE, state_dir=None):
+        self.config = config
+        self.size = size
+        self.state_dir = state_dir
+        self.lock = threading.Lock()
+        self.idle = []
+        self.assigned = {}  # owner -> Host
+        self.spawned = 0
+        self.filling = False
+        self.owner_locks = {}  # owner -> Lock held while assigning them a host
+        self.connect_timeout = COLD_CONNECT_TIMEOUT
+        self.owner_timeout = OWNER_TIMEOUT
+
+    def spawn(self):
+        """Connect one idle host and start its reactor thread."""
+        with self.lock:
+            self.spawned += 1
+            nick = "HostIdle{}_{}".format(os.getpid(), self.spawned)
+        from host import Host  # Not at module level: client.py only needs request_host()
+        host = Host(self.config, None, self.state_dir)
+        host.reconnector.connect(nick)
+        thread = threading.Thread(target=host.start)
+        thread.daemon = True
+        thread.start()
+        return host
+
+    def fill(self):
+        """Top the idle list back up to size, dropping dead connections."""
+        with self.lock:
+            if self.filling:
+                return
+            self.filling = True
+            for host in self.idle:
+                if not host.connection.is_connected():
+                    host.reconnector.enabled = False  # Replaced below; stop it coming back
+            self.idle = [h for h in self.idle if h.connection.is_connected()]
+            missing = self.size - len(self.idle)
+        try:
+            for _ in range(missing):
+                try:
+                    host = self.spawn()
+                except ServerConnectionError as e:
+                    host = None
+                    print("[HOSTPOOL] Could not connect an idle host: {}".format(e))
+                if host is not None:
+                    with self.lock:
+                        self.idle.append(host)
+        finally:
+            with self.lock:
+                self.filling = False
+
+    def fill_in_background(self):
+        thread = threading.Thread(target=self.fill)
+        thread.daemon = True
+        thread.start()
+
+    def assign(self, owner):
+        """Hand an idle host to owner; returns its nick.
+
+        Asking again for an owner that already has a live host returns the
+        same host, so a client may retry freely; a retry that arrives while
+        the first request is still being served waits for it. Raises
+        ServerConnectionError when no host could be connected.
+        """
+        with self.lock:
+            owner_lock = self.owner_locks.setdefault(owner, threading.Lock())
+        with owner_lock:
+            return self._assign(owner)
+
+    def _assign(self, owner):
+        with self.lock:
+            host = self.assigned.get(owner)
+            if host is not None and host.connection.is_connected():
+                return host.connection.get_nickname()
+            host = None
+            while self.idle:
+                candidate = self.idle.pop(0)
+                if candidate.connection.is_connected():
+                    host = candidate
+                    break
+                candidate.reconnector.enabled = False
+        if host is None:
+            host = self.spawn()  # Pool ran dry: fall back to a cold connect
+            deadline = time.time() + self.connect_timeout
+            while not host.connection.is_connected() and time.time() < deadline:
+                time.sleep(0.05)
+            if not host.connection.is_connected():
+                # Never give an owner a host that isn't there; it would come back later under their nick
+                host.reconnector.enabled = False
+                host.running = False
+                try:
+                    host.connection.disconnect("Connect timed out")
+                except Exception:
+                    pass
+                self.fill_in_background()
+                raise ServerConnectionError("no host connected within {:g}s".format(self.connect_timeout))
+        self.apply_owner(host, owner)
+        with self.lock:
+            self.assigned[owner] = host
+        self.fill_in_background()
+        return "HostBot_{}".format(owner)
+
+    def apply_owner(self, host, owner):
+        """host.assign_owner(owner) on the host's reactor thread, which is
+        live and owns the connection and the game; returns once it has run."""
+        applied = threading.Event()
+        errors = []
+
+        def apply():
+            try:
+                host.assign_owner(owner)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                applied.set()
+        host.reactor.scheduler.execute_after(0, apply)
+        if not applied.wait(self.owner_timeout):
+            # Runs after apply() if that ever does, so the host can't keep the owner's nick
+            host.reconnector.enabled = False
+            host.running = False
+            host.reactor.scheduler.execute_after(0, lambda: host.connection.disconnect("Assign timed out"))
+            self.fill_in_background()
+            raise ServerConnectionError("host did not take the game within {:g}s".format(self.owner_timeout))
+        if errors:
+            raise errors[0]
+
+    def release(self, owner):
+        with self.lock:
+            host = self.assigned.pop(owner, None)
+        if host is not None:
+            host.close_game()
+
+    def status(self):
+        with self.lock:
+            return len(self.idle), len(self.assigned)
+
+
+class PoolRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        pool = self.server.pool
+        for line in iter(self.rfile.readline, ''):
+            words = line.split()
+            if not words:
+                continue
+            command, args = words[0].lower(), words[1:]
+            if command in ('assign', 'release') and (len(args) != 1 or not VALID_OWNER.match(args[0])):
+                reply = "error bad owner"
+            elif command == 'assign':
+                try:
+                    reply = "ok {}".format(pool.assign(args[0]))
+                except ServerConnectionError as e:
+                    reply = "error {}".format(e)
+            elif command == 'release':
+                pool.release(args[0])
+                reply = "ok"
+            elif command == 'status':
+                reply = "ok idle {} assigned {}".format(*pool.status())
+            else:
+                reply = "error unknown command"
+            self.wfile.write(reply + "\r\n")
+            self.wfile.flush()
+
+
+class PoolServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, pool, address):
+        SocketServer.TCPServer.__init__(self, address, PoolRequestHandler)
+        self.pool = pool
+
+
+class PoolError(Exception):
+    """The pool took an assign request but gave no host for it."""
+
+
+def request_host(config, owner, timeout=1.0, reply_timeout=ASSIGN_TIMEOUT):
+    """Ask a running pool for a host for owner; returns its nick.
+
+    Returns None only when no pool is listening, in which case the caller
+    may start a host itself. Once the request is sent the pool may be
+    connecting or restoring a host, so this waits up to reply_timeout and
+    raises PoolError on a refusal or no reply: the pool may still bring a
+    host up, and the caller must not start a second one.
+    """
+    try:
+        sock = socket.create_connection(pool_address(config), timeout)
+    except socket.error:
+        return None
+    try:
+        sock.settimeout(reply_timeout)
+        sock.sendall("assign {}\r\n".format(owner))
+        reply = sock.makefile('rb').readline().split()
+    except socket.error as e:
+        raise PoolError("no reply from the host pool ({})".format(e))
+    finally:
+        sock.close()
+    if len(reply) == 2 and reply[0] == "ok":
+        return reply[1]
+    raise PoolError(" ".join(reply[1:]) or "no reply from the host pool")
+
+
+def release_host(config, owner, timeout=1.0):
+    try:
+        sock = socket.create_connection(pool_address(config), timeout)
+        try:
+            sock.sendall("release {}\r\n".format(owner))
+            sock.makefile('rb').readline()
+        finally:
+            sock.close()
+    except socket.error:
+        pass
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config = ConfigParser.ConfigParser()
+    config.read(os.path.join(script_dir, 'config.ini'))
+
+    size = DEFAULT_SIZE
+    if config.has_option('hostpool', 'size'):
+        size = config.getint('hostpool', 'size')
+    parser = argparse.ArgumentParser(description="Keep idle hosts connected and hand them out on request.")
+    parser.add_argument("--size", type=int, default=size, help="idle hosts to keep ready")
+    args = parser.parse_args()
+
+    pool = HostPool(config, args.size)
+    metrics.start_dumping(config, os.path.join(script_dir, 'metrics_hostpool.json'))
+    profiling.install(config, 'hostpool', script_dir)
+    pool.fill()
+    server = PoolServer(pool, pool_address(config))
+    print("[HOSTPOOL] {} idle hosts ready, listening on {}:{}".format(
+        len(pool.idle), *server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
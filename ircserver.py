@@ -0,0 +1,342 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# ircserver.py - Minimal in-process IRC server for local load testing
+# Speaks just enough of RFC 1459 for host.py, client.py and scripted bots:
+# NICK/USER registration, JOIN, PART, PRIVMSG, NOTICE, INVITE, NAMES,
+# PING/PONG and QUIT, plus optional per-connection flood limits.
+
+import SocketServer
+import socket
+import threading
+import time
+
+SERVER_NAME = "fake.irc"
+
+
+class FloodLimit(object):
+    """Token bucket applied to every line a client sends.
+
+    Lines beyond the burst are delayed ("fake lag") the way ircd does it;
+    once a client is more than max_lag seconds behind it is disconnected
+    with "Excess Flood".
+    """
+    def __init__(self, rate, burst, max_lag=10.0):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_lag = max_lag
+
+    def new_bucket(self):
+        return [self.burst, time.time()]
+
+    def consume(self, bucket):
+        """Take one token; return seconds to wait, or None for excess flood."""
+        now = time.time()
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[0] = tokens - 1
+        bucket[1] = now
+        if bucket[0] >= 0:
+            return 0.0
+        lag = -bucket[0] / self.rate
+        if lag > self.max_lag:
+            return None
+        return lag
+
+
+class IRCClientHandler(SocketServer.StreamRequestHandler):
+
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.nick = None
+        self.user = None
+        self.registered = False
+        self.channels = set()
+        self.send_lock = threading.Lock()
+        self.alive = True
+        limit = self.server.flood_limit
+        self.bucket = limit.new_bucket() if limit else None
+
+    @property
+    def prefix(self):
+        return "{0}!{1}@{2}".format(self.nick, self.user or self.nick, "localhost")
+
+    def send(self, line):
+        try:
+            with self.send_lock:
+                self.wfile.write(line + "\r\n")
+                self.wfile.flush()
+        except (socket.error, ValueError):
+            self.alive = False
+
+    def reply(self, numeric, *params):
+        self.send(":{0} {1} {2} {3}".format(SERVER_NAME, numeric, self.nick or "*", " ".join(params)))
+
+    def handle(self):
+        server = self.server
+        while self.alive:
+            try:
+                line = self.rfile.readline()
+            except socket.error:
+                break
+            if not line:
+                break
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            if self.bucket is not None:
+                delay = server.flood_limit.consume(self.bucket)
+                if delay is None:
+                    server.count("flood_kills")
+                    self.send("ERROR :Closing Link: {0} (Excess Flood)".format(self.nick))
+                    break
+                if delay:
+                    server.count("flood_delays")
+                    time.sleep(delay)
+            server.count("lines_in")
+            self.dispatch(line)
+
+    def finish(self):
+        self.server.quit(self, "Connection closed")
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except socket.error:
+            pass
+
+    def dispatch(self, line):
+        if line.startswith(":"):
+            line = line.split(" ", 1)[1] if " " in line else ""
+        if " :" in line:
+            head, trailing = line.split(" :", 1)
+            params = head.split() + [trailing]
+        else:
+            params = line.split()
+        if not params:
+            return
+        command = params[0].upper()
+        handler = getattr(self, "cmd_" + command, None)
+        if handler is None:
+            if self.registered:
+                self.reply("421", command, ":Unknown command")
+            return
+        handler(params[1:])
+
+    def cmd_NICK(self, params):
+        if not params:
+            self.reply("431", ":No nickname given")
+            return
+        if not self.server.rename(self, params[0]):
+            self.reply("433", params[0], ":Nickname is already in use")
+            return
+        self.maybe_welcome()
+
+    def cmd_USER(self, params):
+        if params:
+            self.user = params[0]
+        self.maybe_welcome()
+
+    def maybe_welcome(self):
+        if self.registered or not self.nick or not self.user:
+            return
+        self.registered = True
+        self.reply("001", ":Welcome to the fake Catan IRC network {0}".format(self.prefix))
+        self.reply("376", ":End of MOTD command")
+
+    def cmd_PING(self, params):
+        self.send(":{0} PONG {0} :{1}".format(SERVER_NAME, params[0] if params else ""))
+
+    def cmd_PONG(self, params):
+        pass
+
+    def cmd_MODE(self, params):
+        pass
+
+    def cmd_JOIN(self, params):
+        if params:
+            for channel in params[0].split(","):
+                self.server.join(self, channel)
+
+    def cmd_PART(self, params):
+        if params:
+            reason = params[1] if len(params) > 1 else ""
+            for channel in params[0].split(","):
+                self.server.part(self, channel, reason)
+
+    def cmd_NAMES(self, params):
+        if params:
+            for channel in params[0].split(","):
+                self.server.send_names(self, channel)
+
+    def cmd_INVITE(self, params):
+        if len(params) < 2:
+            self.reply("461", "INVITE", ":Not enough parameters")
+            return
+        if self.server.invite(self, params[0], params[1]):
+            self.reply("341", params[0], params[1])
+        else:
+            self.reply("401", params[0], ":No such nick/channel")
+
+    def cmd_PRIVMSG(self, params):
+        self.relay("PRIVMSG", params)
+
+    def cmd_NOTICE(self, params):
+        self.relay("NOTICE", params)
+
+    def relay(self, command, params):
+        if len(params) < 2:
+            return
+        if not self.server.message(self, command, params[0], params[1]):
+            self.reply("401", params[0], ":No such nick/channel")
+
+    def cmd_QUIT(self, params):
+        self.server.quit(self, params[0] if params else "Quit")
+        self.alive = False
+
+
+class FakeIRCServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """Threaded IRC stand-in; use port 0 to bind an ephemeral port."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, flood_limit=None):
+        SocketServer.TCPServer.__init__(self, (host, port), IRCClientHandler)
+        self.flood_limit = flood_limit
+        self.lock = threading.RLock()
+        self.clients = {}   # lowercased nick -> handler
+        self.channels = {}  # channel -> set of handlers
+        self.stats = dict((k, 0) for k in (
+            "lines_in", "lines_out", "privmsgs", "flood_delays", "flood_kills"))
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def snapshot_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def deliver(self, handlers, line):
+        for handler in handlers:
+            handler.send(line)
+        self.count("lines_out", len(handlers))
+
+    def rename(self, client, nick):
+        with self.lock:
+            owner = self.clients.get(nick.lower())
+            if owner is not None and owner is not client:
+                return False
+            old_prefix = client.prefix
+            if client.nick:
+                self.clients.pop(client.nick.lower(), None)
+            self.clients[nick.lower()] = client
+            announce = client.registered and client.nick != nick
+            client.nick = nick
+            if announce:
+                peers = set([client])
+                for channel in client.channels:
+                    peers.update(self.channels.get(channel, ()))
+                self.deliver(peers, ":{0} NICK :{1}".format(old_prefix, nick))
+        return True
+
+    def join(self, client, channel):
+        with self.lock:
+            members = self.channels.setdefault(channel, set())
+            if client in members:
+                return
+            members.add(client)
+            client.channels.add(channel)
+            self.deliver(members, ":{0} JOIN :{1}".format(client.prefix, channel))
+        self.send_names(client, channel)
+
+    def part(self, client, channel, reason=""):
+        with self.lock:
+            members = self.channels.get(channel)
+            if not members or client not in members:
+                return
+            self.deliver(members, ":{0} PART {1} :{2}".format(client.prefix, channel, reason))
+            members.discard(client)
+            client.channels.discard(channel)
+            if not members:
+                del self.channels[channel]
+
+    def quit(self, client, reason):
+        with self.lock:
+            if client.nick and self.clients.get(client.nick.lower()) is client:
+                del self.clients[client.nick.lower()]
+            peers = set()
+            for channel in list(client.channels):
+                members = self.channels.get(channel, set())
+                members.discard(client)
+                peers.update(members)
+                if not members:
+                    self.channels.pop(channel, None)
+            client.channels.clear()
+            if peers and client.nick:
+                self.deliver(peers, ":{0} QUIT :{1}".format(client.prefix, reason))
+
+    def send_names(self, client, channel):
+        with self.lock:
+            names = " ".join(sorted(m.nick for m in self.channels.get(channel, ())))
+        client.reply("353", "=", channel, ":" + names)
+        client.reply("366", channel, ":End of /NAMES list.")
+
+    def invite(self, client, nick, channel):
+        with self.lock:
+            target = self.clients.get(nick.lower())
+        if target is None:
+            return False
+        target.send(":{0} INVITE {1} :{2}".format(client.prefix, nick, channel))
+        return True
+
+    def message(self, client, command, target, text):
+        line = ":{0} {1} {2} :{3}".format(client.prefix, command, target, text)
+        with self.lock:
+            if target[:1] in "#&":
+                members = self.channels.get(target)
+                if members is None:
+                    return False
+                recipients = [m for m in members if m is not client]
+            else:
+                handler = self.clients.get(target.lower())
+                if handler is None:
+                    return False
+                recipients = [handler]
+            self.stats["privmsgs"] += 1
+            self.deliver(recipients, line)
+        return True
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a local fake IRC server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6667)
+    parser.add_argument("--flood-rate", type=float, default=0,
+                        help="lines per second per client (0 disables flood limits)")
+    parser.add_argument("--flood-burst", type=float, default=10)
+    args = parser.parse_args()
+
+    limit = FloodLimit(args.flood_rate, args.flood_burst) if args.flood_rate > 0 else None
+    server = FakeIRCServer(args.host, args.port, flood_limit=limit)
+    print("[IRCD] Listening on {}:{}".format(args.host, server.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
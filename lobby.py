@@ -0,0 +1,100 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# lobby.py - Client-side directory of the games announced in the lobby
+#
+# Every host says "!host <owner> (Players: a, b)" in the lobby channel every
+# few seconds. LobbyDirectory keeps the latest broadcast per host keyed by
+# owner, so looking a game up or listing them all never touches the server;
+# hosts that stop broadcasting (or leave the lobby) drop out of the list.
+
+import re
+import time
+
+HOST_NICK_PREFIX = "HostBot_"
+
+BROADCAST_INTERVAL = 5.0           # Seconds between a host's !host lines (host.py)
+DEFAULT_TTL = 3 * BROADCAST_INTERVAL
+
+_HOST_BROADCAST = re.compile(r"!host (\S+) \(Players: (.*)\)$")
+
+
+def parse_host_broadcast(sender, msg):
+    """(owner, players) if msg is a !host line really sent by that owner's host.
+
+    Anyone can type "!host x", so the sender's nick has to match the owner.
+    """
+    if not msg.startswith("!host "):
+        return None
+    m = _HOST_BROADCAST.match(msg)
+    if m is None or sender != HOST_NICK_PREFIX + m.group(1):
+        return None
+    players = [p.strip() for p in m.group(2).split(',') if p.strip()]
+    if players == ['None']:
+        players = []
+    return m.group(1), players
+
+
+class LobbyEntry(object):
+    __slots__ = ('owner', 'host_nick', 'players', 'last_seen')
+
+    def __init__(self, owner, host_nick, players, last_seen):
+        self.owner = owner
+        self.host_nick = host_nick
+        self.players = players
+        self.last_seen = last_seen
+
+
+class LobbyDirectory(object):
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.hosts = {}  # owner -> LobbyEntry
+
+    def update(self, sender, msg):
+        """Feed one lobby message; returns the LobbyEntry it refreshed, if any."""
+        parsed = parse_host_broadcast(sender, msg)
+        if parsed is None:
+            return None
+        owner, players = parsed
+        entry = self.hosts.get(owner)
+        if entry is None:
+            entry = self.hosts[owner] = LobbyEntry(owner, sender, players, self.clock())
+        else:
+            entry.players = players
+            entry.last_seen = self.clock()
+        return entry
+
+    def remove_host(self, nick):
+        """Forget the game of a host that left the lobby or quit."""
+        if nick.startswith(HOST_NICK_PREFIX):
+            self.hosts.pop(nick[len(HOST_NICK_PREFIX):], None)
+
+    def expire(self):
+        cutoff = self.clock() - self.ttl
+        for owner in [o for o, e in self.hosts.items() if e.last_seen < cutoff]:
+            del self.hosts[owner]
+
+    def get(self, owner):
+        entry = self.hosts.get(owner)
+        if entry is not None and entry.last_seen < self.clock() - self.ttl:
+            del self.hosts[owner]
+            return None
+        return entry
+
+    def games(self):
+        """Live entries, ordered by owner."""
+        self.expire()
+        return [self.hosts[owner] for owner in sorted(self.hosts)]
+
+    def format_list(self):
+        """Lines for the !list view."""
+        games = self.games()
+        if not games:
+            return ["[Lobby] No games announced in the last {:.0f}s.".format(self.ttl)]
+        now = self.clock()
+        lines = ["[Lobby] {} game(s):".format(len(games))]
+        for entry in games:
+            lines.append("[Lobby]   {:<16} {} player(s): {}  (seen {:.0f}s ago)".format(
+                entry.owner, len(entry.players), ", ".join(entry.players) or "-", now - entry.last_seen))
+        return lines
@@ -2,8 +2,9 @@
 # python 2.7 only
 # Hex map data structures and drawing functions
 
-import networkx as nx
 from terminal import Terminal
+from topology import (EDGE_OWNER, NODE_OWNERS, EdgeIndex, HexTopology, cube_distance, cube_line,
+                      range_offsets, ring_offsets)
 
 TILE_WIDTH = 11
 TILE_HEIGHT = 4
@@ -39,13 +40,15 @@ class HexMap(object):
     def __init__(self, orientation="pointy"):
         self.tiles = {}
         self.tile_autoinc = 0
-        self.node_ids = {}
-        self.edge_ids = {}
         self.road_owners = {}  # Maps edge ID to player ID who owns the road
-        self.edge_to_tile = {} 
+        self.edge_to_tile = {}  # Edge ID -> (tile coord, edge index) of the tile that owns it
+        self.topology = None  # HexTopology of a default map, set by build_nodes_and_edges
         self.node_autoinc = 0
         self.edge_autoinc = 0
         self.orientation = orientation
+        self.radius = None  # Set by generate_default_map
+        self.screen_positions = None  # Tile coord -> screen (col, row), see screen_positions()
+        self.derived = {}  # Tables built from the ids (distance.py); replaced whenever they change
 
         if orientation == "pointy":
             self.directions = [
@@ -72,8 +75,11 @@ class HexMap(object):
         tile = HexTile(self.tile_autoinc, x, y, z, tile_type)
         self.tiles[(x, y, z)] = tile
         self.tile_autoinc += 1
+        self.screen_positions = None
+        self.derived = {}
 
     def generate_default_map(self, radius=3):
+        self.radius = radius
         for x in range(-radius, radius + 1):
             for y in range(-radius, radius + 1):
                 z = -x - y
@@ -84,187 +90,249 @@ class HexMap(object):
 
 
     def build_nodes_and_edges(self):
-        def neighbor(tile, dir_idx):
-            dx, dy, dz = self.directions[dir_idx]
-            return (tile[0] + dx, tile[1] + dy, tile[2] + dz)
-
-        edge_id_map = {}
+        """Number every edge and corner; see topology.py for the scheme.
+
+        Tiles are visited in sorted order and a piece gets the next id on
+        the earliest tile touching it, so the other tiles copy the id from
+        that neighbour. A default map answers edge_to_tile from its
+        HexTopology instead of storing it.
+        """
+        tiles = self.tiles
+        directions = self.directions
+        generic = self.radius is None
+        edge_to_tile = {}
         next_edge_id = 0
-
-        # --- Pass 1: assign unique edge IDs
-        for tile_coord in sorted(self.tiles.keys()):
-            for dir_idx in range(6):
-                neighbor_tile = neighbor(tile_coord, dir_idx)
-                if neighbor_tile in self.tiles:
-                    key = tuple(sorted([tile_coord, neighbor_tile]))
-                else:
-                    key = (tile_coord, dir_idx)
-
-                if key not in edge_id_map:
-                    edge_id_map[key] = next_edge_id
-                    self.edge_to_tile[next_edge_id] = (tile_coord, dir_idx)
-                    next_edge_id += 1
-
-        self.edge_ids = edge_id_map
-        self.edge_autoinc = next_edge_id
-
-        node_id_map = {}
         next_node_id = 0
 
-        for tile_coord, tile in self.tiles.items():
-            tile_edges = []
-            corner_node_ids = []
+        for tile_coord in sorted(tiles):
+            tile = tiles[tile_coord]
+            x, y, z = tile_coord
+            neighbors = [tiles.get((x + dx, y + dy, z + dz)) for dx, dy, dz in directions]
 
+            tile_edges = []
             for i in range(6):
-                neighbor_tile = neighbor(tile_coord, i)
-                if neighbor_tile in self.tiles:
-                    key = tuple(sorted([tile_coord, neighbor_tile]))
+                owner = EDGE_OWNER.get(i)
+                if owner is not None and neighbors[owner[0]] is not None:
+                    tile_edges.append(neighbors[owner[0]].edges[owner[1]])
                 else:
-                    key = (tile_coord, i)
-                eid = edge_id_map[key]
-                tile_edges.append(eid)
+                    if generic:
+                        edge_to_tile[next_edge_id] = (tile_coord, i)
+                    tile_edges.append(next_edge_id)
+                    next_edge_id += 1
 
-            # --- Robust hybrid key for nodes
+            corner_node_ids = []
             for i in range(6):
-                neighbor1 = neighbor(tile_coord, (i - 1) % 6)
-                neighbor2 = neighbor(tile_coord, i)
-
-                tile_set = [tile_coord]
-                if neighbor1 in self.tiles:
-                    tile_set.append(neighbor1)
-                if neighbor2 in self.tiles:
-                    tile_set.append(neighbor2)
-
-                if len(tile_set) == 1:
-                    # Map edge: ensure unique key for single tile node
-                    key = (tile_coord, i)
+                for direction, corner in NODE_OWNERS[i]:
+                    if neighbors[direction] is not None:
+                        corner_node_ids.append(neighbors[direction].nodes[corner])
+                        break
                 else:
-                    key = frozenset(tile_set)
-
-                if key not in node_id_map:
-                    node_id_map[key] = next_node_id
+                    corner_node_ids.append(next_node_id)
                     next_node_id += 1
 
-                corner_node_ids.append(node_id_map[key])
-
             tile.edges = tile_edges
             tile.nodes = corner_node_ids
 
-        self.node_ids = node_id_map
+        self.edge_autoinc = next_edge_id
         self.node_autoinc = next_node_id
-
+        self.derived = {}
+        if generic:
+            self.topology = None
+            self.edge_to_tile = edge_to_tile
+        else:
+            self.topology = HexTopology(self.radius)
+            self.edge_to_tile = EdgeIndex(self.topology)
+
+    # --- Spatial queries. Offsets come from topology's cached tables, so a
+    # query costs O(size of the answer), not O(tiles on the map).
+
+    def _reach(self, coord, k=None):
+        """k, cut down to the farthest any tile is from coord."""
+        if self.radius is not None:
+            farthest = cube_distance(coord, (0, 0, 0)) + self.radius
+        elif k is not None:
+            return k
+        else:
+            farthest = max([cube_distance(coord, c) for c in self.tiles] or [0])
+        return farthest if k is None else min(k, farthest)
+
+    def _tiles_at(self, coord, offsets):
+        x, y, z = coord
+        get = self.tiles.get
+        found = []
+        for dx, dy, dz in offsets:
+            tile = get((x + dx, y + dy, z + dz))
+            if tile is not None:
+                found.append(tile)
+        return found
+
+    def distance(self, a, b):
+        """Steps between two tile coords."""
+        return cube_distance(a, b)
+
+    def tiles_within(self, coord, k):
+        """Tiles at most k steps from coord (itself included), nearest first."""
+        return self._tiles_at(coord, range_offsets(self._reach(coord, k)))
+
+    def ring(self, coord, k):
+        """Tiles exactly k steps from coord, in order around the ring."""
+        if k > self._reach(coord, k):
+            return []
+        return self._tiles_at(coord, ring_offsets(k))
+
+    def line(self, a, b):
+        """Tiles on the straight line from a to b, in order; off-map hexes are skipped."""
+        get = self.tiles.get
+        return [tile for tile in (get(c) for c in cube_line(a, b)) if tile is not None]
+
+    def nearest_tile(self, coord, tile_type, max_distance=None):
+        """The closest tile of tile_type to coord (coord's own included), or None.
+
+        Rings are searched outwards and the first hit on the closest ring wins.
+        """
+        max_distance = self._reach(coord, max_distance)
+        x, y, z = coord
+        get = self.tiles.get
+        for k in xrange(max_distance + 1):
+            for dx, dy, dz in ring_offsets(k):
+                tile = get((x + dx, y + dy, z + dz))
+                if tile is not None and tile.tile_type == tile_type:
+                    return tile
+        return None
+
+
+class _LazyTerminal(object):
+    """Stands in for the global Terminal until something draws.
+
+    Creating a Terminal starts curses, which processes that only need the
+    map topology (host, snapshots) must not do just by importing this module.
+    """
+    def __getattr__(self, name):
+        return getattr(Terminal(), name)
 
 # Global terminal instance
-terminal = Terminal()
+terminal = _LazyTerminal()
+
+
+# --- Sprites
+#
+# Everything drawn on a tile is a fixed block of glyphs at fixed offsets
+# from the tile's top-left corner; only the coordinate label of a tile
+# differs between tiles. So the blocks are built once per (kind, label,
+# colour) as a Sprite, and drawing is writing a cached block at a cached
+# screen position (see screen_positions()).
+
+TILE_BORDER = "+" + ("-" * (TILE_WIDTH - 2)) + "+"
+TILE_BLANK = "|" + (" " * (TILE_WIDTH - 2)) + "|"
+ROAD_WIDTH = (TILE_WIDTH - 3) // 2
+VLINE = 186  # CP437 double vertical line; Terminal.addch draws it as ACS_VLINE
+
+# Labels for the edges drawn as text; E and W are drawn as vertical lines
+ROAD_LABELS = {
+    HexMap.EDGE_NE: "=NE=",
+    HexMap.EDGE_NW: "=NW=",
+    HexMap.EDGE_SW: "=SW=",
+    HexMap.EDGE_SE: "=SE=",
+}
+
+# Corner index -> (dx, dy) of its "+" from the tile's top-left
+NODE_OFFSETS = {
+    HexMap.NODE_N: (TILE_WIDTH // 2, 0),
+    HexMap.NODE_NE: (TILE_WIDTH - 1, 0),
+    HexMap.NODE_SE: (TILE_WIDTH - 1, TILE_HEIGHT - 1),
+    HexMap.NODE_S: (TILE_WIDTH // 2, TILE_HEIGHT - 1),
+    HexMap.NODE_SW: (0, TILE_HEIGHT - 1),
+    HexMap.NODE_NW: (0, 0),
+}
+
+
+class Sprite(object):
+    """A prerendered glyph block: (dx, dy, glyph) ops drawn in order, a
+    string through writexy and an int character code through addch."""
+    __slots__ = ('color', 'ops')
+
+    def __init__(self, color, ops):
+        self.color = color
+        self.ops = tuple(ops)
+
+    def blit(self, col, row):
+        if self.color:
+            terminal.setcolor(self.color)
+        for dx, dy, glyph in self.ops:
+            if isinstance(glyph, int):
+                terminal.addch(col + dx, row + dy, glyph)
+            else:
+                terminal.writexy(col + dx, row + dy, glyph)
+        if self.color:
+            terminal.resetcolor()
+
+
+_sprites = {}  # (kind, tile label or index, colour) -> Sprite
+
+def tile_sprite(tile, color=None):
+    label = "(%d,%d,%d)" % (tile.x, tile.y, tile.z)
+    key = ('tile', label, color)
+    sprite = _sprites.get(key)
+    if sprite is None:
+        ops = [(0, 0, TILE_BORDER)]
+        for i in range(1, TILE_HEIGHT - 1):
+            if i == (TILE_HEIGHT - 1) // 2:
+                ops.append((0, i, "|" + label.center(TILE_WIDTH - 2) + "|"))
+            else:
+                ops.append((0, i, TILE_BLANK))
+        ops.append((0, TILE_HEIGHT - 1, TILE_BORDER))
+        # Center markers on the top and bottom borders (hex intersection points)
+        ops.append((TILE_WIDTH // 2, 0, "+"))
+        ops.append((TILE_WIDTH // 2, TILE_HEIGHT - 1, "+"))
+        sprite = _sprites[key] = Sprite(color, ops)
+    return sprite
+
+def road_sprite(edge_idx, color):
+    key = ('road', edge_idx, color)
+    sprite = _sprites.get(key)
+    if sprite is None:
+        middle = (TILE_HEIGHT - 1) // 2
+        label = ROAD_LABELS.get(edge_idx, "====")[:ROAD_WIDTH]
+        ops = []
+        if edge_idx in (HexMap.EDGE_E, HexMap.EDGE_W):
+            # A vertical road spanning the tile between its borders, lettered in the middle
+            dx = TILE_WIDTH - 1 if edge_idx == HexMap.EDGE_E else 0
+            for dy in range(1, TILE_HEIGHT - 1):
+                ops.append((dx, dy, VLINE))
+            ops.append((dx, middle, "E" if edge_idx == HexMap.EDGE_E else "W"))
+        elif edge_idx == HexMap.EDGE_NE:
+            ops.append((1 + TILE_WIDTH // 2, 0, label))
+        elif edge_idx == HexMap.EDGE_NW:
+            ops.append((1, 0, label))
+        elif edge_idx == HexMap.EDGE_SW:
+            ops.append((1, TILE_HEIGHT - 1, label))
+        elif edge_idx == HexMap.EDGE_SE:
+            ops.append((1 + TILE_WIDTH // 2, TILE_HEIGHT - 1, label))
+        sprite = _sprites[key] = Sprite(color, ops)
+    return sprite
+
+def node_sprite(node_idx, color):
+    key = ('node', node_idx, color)
+    sprite = _sprites.get(key)
+    if sprite is None:
+        dx, dy = NODE_OFFSETS[node_idx]
+        sprite = _sprites[key] = Sprite(color, [(dx, dy, "+")])
+    return sprite
 
 
 def draw_tile(tile, hexmap, color=None):
     col, row = get_tile_screen_pos(tile, hexmap)
-    border = "+" + ("-" * (TILE_WIDTH - 2)) + "+"
-    coord_str = "(%d,%d,%d)" % (tile.x, tile.y, tile.z)
-    coord_str = coord_str.center(TILE_WIDTH - 2)
-    coord_line = "|" + coord_str + "|"
-
-    if color:
-        terminal.setcolor(color)
-
-    # Draw top border
-    terminal.writexy(col, row, border)
-
-    # Draw middle lines (centered coord string on first, blank on others)
-    for i in range(1, TILE_HEIGHT - 1):
-        if i == (TILE_HEIGHT - 1) // 2:
-            terminal.writexy(col, row + i, coord_line)
-        else:
-            terminal.writexy(col, row + i, "|" + (" " * (TILE_WIDTH - 2)) + "|")
-
-    # Draw bottom border
-    terminal.writexy(col, row + TILE_HEIGHT - 1, border)
-    
-    # Add center markers for top and bottom borders (hex intersection points)
-    center_x = col + TILE_WIDTH // 2
-    terminal.writexy(center_x, row, "+")                    # Top center
-    terminal.writexy(center_x, row + TILE_HEIGHT - 1, "+") # Bottom center
-    
-    if color:
-        terminal.resetcolor()
-
+    tile_sprite(tile, color).blit(col, row)
     terminal.refresh()
 
 def draw_road(tile, edge_idx, hexmap, color=None):
     col, row = get_tile_screen_pos(tile, hexmap)
-    
-    if color is None:
-        terminal.setcolor(terminal.COLOR_PAIR_BLUE)
-    else: 
-        terminal.setcolor(color)
-
-
-    road_width = (TILE_WIDTH - 3) // 2
-    # Calculate tile vertical positions
-    tile_top = row
-    tile_middle = row + (TILE_HEIGHT - 1) // 2
-    tile_bottom = row + TILE_HEIGHT - 1
-    tile_vstart = row + 1
-    tile_vend = row + TILE_HEIGHT - 2
-
-    dir_labels = {
-        HexMap.EDGE_E: "|E",  # Use regular pipe character for labels
-        HexMap.EDGE_NE: "=NE=",
-        HexMap.EDGE_NW: "=NW=",
-        HexMap.EDGE_W: "|W",  # Use regular pipe character for labels  
-        HexMap.EDGE_SW: "=SW=",
-        HexMap.EDGE_SE: "=SE="
-    }
-
-    label = dir_labels.get(edge_idx, "====")[:road_width]
-    if edge_idx == HexMap.EDGE_E:
-        # Draw vertical road for E edge, spanning the tile height (excluding borders)
-        for y in range(tile_vstart, tile_vend + 1):
-            terminal.addch(col + TILE_WIDTH - 1, y, 186)  # Use chr(186) with addch
-        # Optionally, add label at the middle
-        terminal.writexy(col + TILE_WIDTH - 1, tile_middle, "E")
-    elif edge_idx == HexMap.EDGE_W:
-        for y in range(tile_vstart, tile_vend + 1):
-            terminal.addch(col, y, 186)  # Use chr(186) with addch
-        terminal.writexy(col, tile_middle, "W")
-    elif edge_idx == HexMap.EDGE_NE:
-        terminal.writexy(col + 1 + (TILE_WIDTH // 2), tile_top, label)
-    elif edge_idx == HexMap.EDGE_NW:
-        terminal.writexy(col + 1, tile_top, label)
-    elif edge_idx == HexMap.EDGE_SW:
-        terminal.writexy(col + 1, tile_bottom, label)
-    elif edge_idx == HexMap.EDGE_SE:
-        terminal.writexy(col + 1 + (TILE_WIDTH // 2), tile_bottom, label)
-
-    terminal.resetcolor()
+    road_sprite(edge_idx, Terminal.COLOR_PAIR_BLUE if color is None else color).blit(col, row)
     terminal.refresh()
 
 def draw_node(tile, node_idx, hexmap, color=None):
     col, row = get_tile_screen_pos(tile, hexmap)
-
-    if color == None:
-        terminal.setcolor(terminal.COLOR_PAIR_BRIGHT_RED)
-    else:
-        terminal.setcolor(color)
-
-    # Calculate tile vertical positions
-    tile_top = row
-    tile_bottom = row + TILE_HEIGHT - 1
-
-    if node_idx == HexMap.NODE_N:
-        terminal.writexy(col + TILE_WIDTH // 2, tile_top, "+")
-    elif node_idx == HexMap.NODE_NE:
-        terminal.writexy(col + TILE_WIDTH - 1, tile_top, "+")
-    elif node_idx == HexMap.NODE_SE:
-        terminal.writexy(col + TILE_WIDTH - 1, tile_bottom, "+")
-    elif node_idx == HexMap.NODE_S:
-        terminal.writexy(col + TILE_WIDTH // 2, tile_bottom, "+")
-    elif node_idx == HexMap.NODE_SW:
-        terminal.writexy(col, tile_bottom, "+")
-    elif node_idx == HexMap.NODE_NW:
-        terminal.writexy(col, tile_top, "+")
-    terminal.resetcolor()
+    node_sprite(node_idx, Terminal.COLOR_PAIR_BRIGHT_RED if color is None else color).blit(col, row)
     terminal.refresh()
 
 def compute_bounds(hexmap):
@@ -292,17 +360,27 @@ def get_map_screen_size(hexmap):
     height = max(rows) + TILE_HEIGHT
     return width, height
 
-def get_tile_screen_pos(tile, hexmap):
-    min_q, max_q, min_r, max_r = compute_bounds(hexmap)
-    offset_col = -(min_q + (min_r // 2)) - 1
-    offset_row = -min_r
+def screen_positions(hexmap):
+    """Tile coord -> (col, row) of the tile's top-left on screen, worked
+    out once per map instead of once per draw."""
+    positions = hexmap.screen_positions
+    if positions is None:
+        min_q, max_q, min_r, max_r = compute_bounds(hexmap)
+        offset_col = -(min_q + (min_r // 2)) - 1
+        offset_row = -min_r
+        positions = {}
+        for coord in hexmap.tiles:
+            q, r = coord[0], coord[2]
+            col = (q + (r // 2) + offset_col) * (TILE_WIDTH - 1)
+            row = (r + offset_row) * (TILE_HEIGHT - 1)
+            if r % 2 != 0:
+                col += TILE_WIDTH // 2
+            positions[coord] = (col, row)
+        hexmap.screen_positions = positions
+    return positions
 
-    q, r = tile.x, tile.z
-    col = (q + (r // 2) + offset_col) * (TILE_WIDTH - 1)
-    row = (r + offset_row) * (TILE_HEIGHT - 1)
-    if r % 2 != 0:
-        col += TILE_WIDTH // 2
-    return col, row
+def get_tile_screen_pos(tile, hexmap):
+    return screen_positions(hexmap)[(tile.x, tile.y, tile.z)]
 
 
 def find_surrounding_tiles_and_nodes(hexmap, edge_id, debug=False):
@@ -319,8 +397,10 @@ def find_surrounding_tiles_and_nodes(hexmap, edge_id, debug=False):
     candidate_nodes = []
 
     # --- Compute candidate nodes first (no drawing yet)
+    # Only the edge's tile and its neighbours can touch either end
+    nearby = hexmap.tiles_within(tile_coord, 1)
     for node in [n1, n2]:
-        for neighbor_tile_coord, neighbor_tile in hexmap.tiles.items():
+        for neighbor_tile in nearby:
             for i in range(6):
                 e = neighbor_tile.edges[i]
                 ni = neighbor_tile.nodes[i]
@@ -446,8 +526,7 @@ def check_degenerate_edges(hexmap):
 
     degenerate_edges = []
 
-    for edge_id in hexmap.edge_ids.values():
-        tile_coord, edge_idx = hexmap.edge_to_tile[edge_id]
+    for edge_id, (tile_coord, edge_idx) in hexmap.edge_to_tile.iteritems():
         tile = hexmap.tiles[tile_coord]
 
         n1 = tile.nodes[edge_idx]
@@ -468,13 +547,19 @@ def check_degenerate_edges(hexmap):
 
 
 def draw_map(hexmap, boundary_nodes=[]):
-    for tile in hexmap.tiles.values():
-        draw_tile(tile, hexmap, terminal.COLOR_PAIR_GREY)
-
-    for tile in hexmap.tiles.values():
+    positions = screen_positions(hexmap)
+    for coord, tile in hexmap.tiles.iteritems():
+        col, row = positions[coord]
+        tile_sprite(tile, Terminal.COLOR_PAIR_GREY).blit(col, row)
+
+    boundary_nodes = set(boundary_nodes)
+    white = Terminal.COLOR_PAIR_WHITE
+    for coord, tile in hexmap.tiles.iteritems():
+        col, row = positions[coord]
         for idx, node_id in enumerate(tile.nodes):
             if node_id in boundary_nodes:
-                draw_node(tile, idx, hexmap, color=terminal.COLOR_PAIR_WHITE)  # White color
+                node_sprite(idx, white).blit(col, row)
+    terminal.refresh()  # Once for the whole map, not once per tile
 
 
 if __name__ == "__main__":
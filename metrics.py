@@ -0,0 +1,164 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# metrics.py - Process-wide counters, gauges and latency histograms
+#
+# Hot paths call count(name), gauge(name, value) or observe(name, seconds),
+# or time a block with "with timer(name):". A counter is one dict update and
+# a histogram observation bumps one of a fixed set of log-spaced buckets, so
+# nothing grows with traffic and recording costs about a microsecond. The
+# maths (means, percentiles) only happens in snapshot(), when something
+# reads the numbers: the host's !stats command or the periodic JSON dump.
+#
+# Updates are not locked; under thread contention a counter may lose the
+# odd increment, which is fine for what these numbers are for.
+
+import bisect
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds: 10 us doubling up to ~10 s
+BUCKETS = [0.00001 * 2 ** i for i in range(21)]
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last bucket is "slower than that"
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th (0..1) observation."""
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': round(1000 * self.total / self.count, 3),
+            'p50_ms': round(1000 * self.percentile(0.5), 3),
+            'p99_ms': round(1000 * self.percentile(0.99), 3),
+            'max_ms': round(1000 * self.max, 3),
+        }
+
+
+class _Timer(object):
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.time() - self.start)
+        return False
+
+
+class Registry(object):
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def snapshot(self):
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'histograms': dict((name, h.summary()) for name, h in self.histograms.items()),
+        }
+
+    def format_stats(self):
+        """One line per metric, for !stats."""
+        snap = self.snapshot()
+        lines = ["uptime {}s".format(snap['uptime_s'])]
+        for name, value in sorted(snap['counters'].items()):
+            lines.append("{} {}".format(name, value))
+        for name, value in sorted(snap['gauges'].items()):
+            lines.append("{} = {}".format(name, value))
+        for name, s in sorted(snap['histograms'].items()):
+            if s['count']:
+                lines.append("{} n={} mean={}ms p50={}ms p99={}ms max={}ms".format(
+                    name, s['count'], s['mean_ms'], s['p50_ms'], s['p99_ms'], s['max_ms']))
+        return lines
+
+    def dump(self, path):
+        """Write snapshot() as JSON, replacing path atomically."""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=1, sort_keys=True)
+        os.rename(tmp_path, path)
+
+    def start_dumping(self, path, interval):
+        """Dump to path every interval seconds from a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path)
+                except (IOError, OSError):
+                    pass
+        thread = threading.Thread(target=loop)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+REGISTRY = Registry()
+
+count = REGISTRY.count
+gauge = REGISTRY.gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+
+def dump_interval(config):
+    """Seconds between dumps from the [metrics] section, 0 when disabled."""
+    if config.has_option('metrics', 'dump_interval'):
+        return config.getfloat('metrics', 'dump_interval')
+    return 0
+
+
+def start_dumping(config, path):
+    interval = dump_interval(config)
+    if interval > 0:
+        REGISTRY.start_dumping(path, interval)
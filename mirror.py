@@ -0,0 +1,196 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# mirror.py - Client-side replica of the host's GameState
+#
+# After every join and every accepted command the host says one line in the
+# game channel:
+#
+#   !delta <version> <checksum> <op> <op> ...
+#
+# where the ops are GameState.take_deltas() and checksum is
+# snapshot.checksum() of the host's game after the change. A client applies
+# the ops to its own copy and compares checksums; on a version gap, a bad op
+# or a mismatch it privmsgs the host "!resync" and the host answers with the
+# full snapshot as NOTICEs:
+#
+#   !state <version> <part>/<parts> <base64 chunk>
+#
+# Deltas that arrive while a resync is outstanding are buffered and applied
+# on top of the snapshot once it is complete.
+#
+# A client that reconnects privmsgs the host "!catchup <version>" with the
+# last version it has. The host keeps its most recent !delta lines and sends
+# back only the ones after that version as NOTICEs. When it no longer has
+# them all, or the client missed more than CATCHUP_MAX_DELTAS of them, one
+# full !state is shorter than the replay and goes instead. The reply ends
+# with "!catchup <version>" giving the host's current version. Live deltas
+# that overtake the reply are buffered until the end marker arrives.
+#
+# Both replies go through the host's outbox (outbox.py), paced and at most
+# one of each kind waiting per client.
+
+import base64
+import collections
+import struct
+
+import snapshot
+
+DELTA_VERB = "!delta"
+STATE_VERB = "!state"
+RESYNC_VERB = "!resync"
+CATCHUP_VERB = "!catchup"
+
+STATE_CHUNK = 400  # base64 characters per !state line, well inside the IRC line limit
+CATCHUP_DEPTH = 256  # !delta lines the host keeps for reconnecting clients
+CATCHUP_MAX_DELTAS = 32  # More missed than this and !catchup sends the full state
+
+
+def delta_line(game, ops):
+    """The !delta line announcing game's current version."""
+    return " ".join([DELTA_VERB, str(game.version), snapshot.checksum(game)] + ops)
+
+
+def state_lines(game):
+    """The !state lines carrying a snapshot of game, minus the dice seed."""
+    data = base64.b64encode(snapshot.canonical(game))
+    chunks = [data[i:i + STATE_CHUNK] for i in range(0, len(data), STATE_CHUNK)] or [""]
+    return ["{} {} {}/{} {}".format(STATE_VERB, game.version, i + 1, len(chunks), chunk)
+            for i, chunk in enumerate(chunks)]
+
+
+def catchup_lines(game, history, version, max_deltas=CATCHUP_MAX_DELTAS):
+    """The NOTICE lines answering "!catchup <version>": the missed !delta
+    lines, or the full !state when there are more than max_deltas of them
+    or some are gone."""
+    lines = None
+    if 0 <= game.version - version <= max_deltas:
+        lines = history.since(version, game.version)
+    if lines is None:
+        lines = state_lines(game)
+    return lines + ["{} {}".format(CATCHUP_VERB, game.version)]
+
+
+class DeltaHistory(object):
+    """The host's most recent !delta lines, by version."""
+
+    def __init__(self, depth=CATCHUP_DEPTH):
+        self.lines = collections.deque(maxlen=depth)  # (version, line)
+
+    def add(self, version, line):
+        self.lines.append((version, line))
+
+    def since(self, version, current):
+        """The lines after version, or None if some of them are gone."""
+        if version == current:
+            return []
+        if version > current or not self.lines or self.lines[0][0] > version + 1:
+            return None
+        return [line for v, line in self.lines if v > version]
+
+
+class GameMirror(object):
+    def __init__(self, host_nick):
+        self.host_nick = host_nick
+        self.game = None
+        self.resync_requested = False
+        self.pending = []  # (version, checksum, ops) received while waiting for !state
+        self.chunks = {}
+        self.chunks_version = None
+        self.catching_up = False
+
+    def request_resync(self):
+        """Drop the replica; True if the caller should send !resync now."""
+        self.game = None
+        if self.resync_requested:
+            return False
+        self.resync_requested = True
+        return True
+
+    def handle_delta(self, msg):
+        """Apply a !delta line; True if the caller should send !resync."""
+        parts = msg.split()
+        try:
+            version, crc, ops = int(parts[1]), parts[2], parts[3:]
+        except (IndexError, ValueError):
+            return False
+        if self.game is None:
+            self.pending.append((version, crc, ops))
+            return self.request_resync()
+        return self._apply(version, crc, ops)
+
+    def catchup_request(self):
+        """The line to privmsg the host after a reconnect."""
+        if self.game is None:
+            self.resync_requested = True  # Any earlier !resync was lost with the connection
+            return RESYNC_VERB
+        self.catching_up = True
+        return "{} {}".format(CATCHUP_VERB, self.game.version)
+
+    def handle_catchup(self, msg):
+        """End of the host's catch-up reply; True if the caller should send !resync."""
+        try:
+            version = int(msg.split()[1])
+        except (IndexError, ValueError):
+            return False
+        self.catching_up = False
+        if self.game is None:
+            return False  # The reply was a !state that is still incomplete
+        pending, self.pending = self.pending, []
+        for delta in sorted(pending, key=lambda p: p[0]):
+            if self._apply(*delta):
+                return True
+        if self.game.version < version:
+            return self.request_resync()
+        return False
+
+    def _apply(self, version, crc, ops):
+        game = self.game
+        if version <= game.version:
+            return False  # Already covered by the snapshot
+        if version != game.version + 1:
+            if self.catching_up:
+                self.pending.append((version, crc, ops))  # Overtook the catch-up reply
+                return False
+            return self.request_resync()
+        try:
+            for op in ops:
+                game.apply_delta(op)
+        except (ValueError, KeyError, IndexError):
+            return self.request_resync()
+        game.version = version
+        if snapshot.checksum(game) != crc:
+            return self.request_resync()
+        return False
+
+    def handle_state(self, msg):
+        """Collect a !state line; True if the caller should send !resync."""
+        parts = msg.split(" ", 3)
+        try:
+            version = int(parts[1])
+            part, total = [int(n) for n in parts[2].split("/")]
+            chunk = parts[3] if len(parts) > 3 else ""
+        except (IndexError, ValueError):
+            return False
+        if version != self.chunks_version:
+            self.chunks = {}
+            self.chunks_version = version
+        self.chunks[part] = chunk
+        if len(self.chunks) < total:
+            return False
+
+        data = "".join(self.chunks[i] for i in range(1, total + 1) if i in self.chunks)
+        self.chunks = {}
+        self.chunks_version = None
+        try:
+            self.game = snapshot.loads(base64.b64decode(data))
+        except (ValueError, TypeError, struct.error):
+            self.resync_requested = False
+            return self.request_resync()
+
+        self.resync_requested = False
+        pending, self.pending = self.pending, []
+        for version, crc, ops in sorted(pending, key=lambda p: p[0]):
+            if self._apply(version, crc, ops):
+                return True
+        return False
@@ -0,0 +1,68 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# outbox.py - Paced, coalesced multi-line replies to single nicks
+#
+# Some replies run to many NOTICE lines: the full state for !resync, the
+# missed deltas for !catchup, the metrics for !stats. Sent in one burst
+# they get the host disconnected for Excess Flood, and anyone can ask for
+# them. So the host queues them here instead:
+#
+#   - one line goes out every line_interval seconds, whoever it is for
+#   - a nick has at most one waiting reply of each kind; asking again
+#     before it starts costs nothing
+#   - a reply's lines are made when it starts, so a resync that waited
+#     in line still sends the newest state
+#
+# Like spectate.BoardFeed it runs on the reactor through a
+# schedule(delay, fn) callable, so nothing sleeps.
+
+import collections
+
+import metrics
+
+LINE_INTERVAL = 0.5  # Seconds between queued lines
+
+
+class Outbox(object):
+    """send(nick, line) delivers a line; schedule(delay, fn) runs fn on the reactor."""
+
+    def __init__(self, send, schedule, line_interval=LINE_INTERVAL):
+        self.send = send
+        self.schedule = schedule
+        self.line_interval = line_interval
+        self.waiting = collections.OrderedDict()  # (nick, kind) -> make_lines, oldest first
+        self.lines = collections.deque()          # (nick, line) of the reply going out
+        self.busy = False                         # A line is scheduled
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def request(self, nick, kind, make_lines):
+        """Queue make_lines() for nick; False if the same reply was already waiting."""
+        key = (nick, kind)
+        if key in self.waiting:
+            metrics.count('outbox.coalesced')
+            return False
+        metrics.count('outbox.requests')
+        self.waiting[key] = make_lines
+        if not self.busy:
+            self.busy = True
+            self.schedule(0, self._next)
+        return True
+
+    def pending(self, nick, kind):
+        return (nick, kind) in self.waiting
+
+    def _next(self):
+        while not self.lines:
+            if not self.waiting:
+                self.busy = False
+                return
+            (nick, kind), make_lines = self.waiting.popitem(last=False)
+            self.lines.extend((nick, line) for line in make_lines())
+        nick, line = self.lines.popleft()
+        try:
+            self.send(nick, line)
+        finally:
+            self.schedule(self.line_interval, self._next)
@@ -0,0 +1,74 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# player.py - The one record per player shared by GameState and GameBoard
+#
+# GameState and GameBoard used to keep a Player each and update both sets of
+# roads, settlements and cities on every build and every unmade build. Now
+# GameState hands its Player to GameBoard.add_player(), so a piece is put
+# down once and both sides see it.
+#
+# A hand of cards is an array of counts in RESOURCE_TYPES order rather than
+# a {name: count} dict: five machine ints instead of a hash table per
+# player, and costs are precomputed as (index, n) pairs (cost_items()) so
+# paying for a build or a trade never hashes a resource name. Names only
+# appear at the edges, when a command is parsed or a hand is printed.
+#
+# Pieces are indexed by id: roads, settlements and cities are sets of the
+# dense edge and node ids topology.py computes from a tile's coordinates,
+# so a set member maps straight back to its place on the map
+# (HexTopology.edge_tile()/node_tile()). They are sets rather than bitmaps
+# over all ids: a player owns a few dozen pieces of the thousands of ids a
+# big map has, and a bitmap costs the whole map per player.
+
+import array
+
+RESOURCE_TYPES = ['brick', 'lumber', 'wool', 'grain', 'ore']
+RESOURCE_INDEX = dict((r, i) for i, r in enumerate(RESOURCE_TYPES))
+
+_EMPTY_HAND = [0] * len(RESOURCE_TYPES)
+
+
+def new_hand(counts=None):
+    """A hand: counts in RESOURCE_TYPES order, all zero when None."""
+    return array.array('i', _EMPTY_HAND if counts is None else counts)
+
+
+def cost_items(cost):
+    """A {resource name: n} cost as sorted (resource index, n) pairs."""
+    return tuple(sorted((RESOURCE_INDEX[r], n) for r, n in cost.items()))
+
+
+class Player(object):
+    __slots__ = ('nick', 'id', 'resources', 'roads', 'settlements', 'cities',
+                 'victory_points', 'longest_road_length', 'has_longest_road')
+
+    def __init__(self, nick, player_id=0):
+        self.nick = nick
+        self.id = player_id
+        self.resources = new_hand()
+        self.roads = set()        # Edge ids (topology.py)
+        self.settlements = set()  # Node ids (topology.py)
+        self.cities = set()       # Node ids (topology.py)
+        self.victory_points = 0   # Kept current by GameState.score()
+        self.longest_road_length = 0
+        self.has_longest_road = False  # Holds the longest road bonus
+
+    def can_afford(self, items):
+        """Whether the hand covers items, a cost_items() tuple."""
+        resources = self.resources
+        for i, n in items:
+            if resources[i] < n:
+                return False
+        return True
+
+    def hand_size(self):
+        return sum(self.resources)
+
+    def count_victory_points(self):
+        """Points from the pieces on the board and the longest road bonus,
+        counted from scratch."""
+        return len(self.settlements) + 2 * len(self.cities) + (2 if self.has_longest_road else 0)
+
+    def total_victory_points(self):
+        return self.victory_points
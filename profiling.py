@@ -0,0 +1,198 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# profiling.py - Opt-in profiling of selected hot paths, driven by config.ini
+#
+#   [profiling]
+#   mode = off | cprofile | sample
+#   targets = game.GameState.handle_command, map.draw_map
+#
+# install() wraps each target (module.function or module.Class.method) so
+# that only time spent inside a target is profiled:
+#
+#   cprofile  cProfile runs while a target is on the stack; the session is
+#             written as profile_<process>_<session>.prof (load it with
+#             pstats or snakeviz).
+#   sample    a background thread looks at the stacks of threads that are
+#             inside a target every interval seconds and counts them; the
+#             session is written as profile_<process>_<session>.folded, one
+#             "outer;inner count" line per stack, ready for flamegraph.pl.
+#             Cheaper than cProfile and does not distort fast functions.
+#
+# Files go next to host_debug.log and are rewritten every flush_interval
+# seconds and at exit, so a host killed by its client still leaves a profile.
+
+import atexit
+import cProfile
+import functools
+import os
+import sys
+import threading
+import time
+from thread import get_ident
+
+MODES = ('off', 'cprofile', 'sample')
+DEFAULT_INTERVAL = 0.005
+DEFAULT_FLUSH_INTERVAL = 60.0
+
+
+def _option(config, name, default, get='get'):
+    if config.has_option('profiling', name):
+        return getattr(config, get)('profiling', name)
+    return default
+
+
+def resolve(target):
+    """(owner, attribute name, function) for "module.func" or "module.Class.method"."""
+    parts = target.split('.')
+    if len(parts) not in (2, 3):
+        raise ValueError("profiling target {!r} is not module.function or module.Class.method".format(target))
+    owner = __import__(parts[0])
+    if len(parts) == 3:
+        owner = getattr(owner, parts[1])
+        func = owner.__dict__[parts[2]]
+    else:
+        func = getattr(owner, parts[1])
+    return owner, parts[-1], func
+
+
+class _Profiler(object):
+    """What a mode does when a thread enters or leaves the outermost target."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.depth = {}  # thread ident -> nesting depth inside targets
+
+    def wrap(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            ident = get_ident()
+            depth = self.depth.get(ident, 0)
+            self.depth[ident] = depth + 1
+            if not depth:
+                self.enter(ident, func)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.depth[ident] = depth
+                if not depth:
+                    self.leave(ident)
+        return wrapper
+
+    def enter(self, ident, func):
+        pass
+
+    def leave(self, ident):
+        pass
+
+    def start(self):
+        pass
+
+    def write(self):
+        pass
+
+
+class CProfiler(_Profiler):
+    """One cProfile.Profile per thread, merged when written."""
+
+    def __init__(self, path):
+        _Profiler.__init__(self, path + '.prof')
+        self.profiles = {}  # thread ident -> cProfile.Profile
+
+    def enter(self, ident, func):
+        profile = self.profiles.get(ident)
+        if profile is None:
+            profile = self.profiles[ident] = cProfile.Profile()
+        with self.lock:
+            profile.enable()
+
+    def leave(self, ident):
+        with self.lock:
+            self.profiles[ident].disable()
+
+    def write(self):
+        import pstats
+        with self.lock:
+            # A profile whose thread is inside a target is skipped until the next flush
+            idle = [p for ident, p in self.profiles.items() if not self.depth.get(ident)]
+            if idle:
+                pstats.Stats(*idle).dump_stats(self.path)
+
+
+class SamplingProfiler(_Profiler):
+    def __init__(self, path, interval):
+        _Profiler.__init__(self, path + '.folded')
+        self.interval = interval
+        self.active = {}  # thread ident -> code object of the target it is in
+        self.stacks = {}  # "outer;...;inner" -> samples
+
+    def enter(self, ident, func):
+        self.active[ident] = func.__code__
+
+    def leave(self, ident):
+        self.active.pop(ident, None)
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        # Locals, so that module teardown at exit can't pull them from under us
+        sleep, current_frames, basename = time.sleep, sys._current_frames, os.path.basename
+        while True:
+            sleep(self.interval)
+            frames = current_frames()
+            for ident, code in self.active.items():
+                frame = frames.get(ident)
+                names = []
+                while frame is not None:
+                    names.append("{}:{}".format(basename(frame.f_code.co_filename), frame.f_code.co_name))
+                    if frame.f_code is code:
+                        break
+                    frame = frame.f_back
+                else:
+                    continue  # Left the target since we looked
+                key = ";".join(reversed(names))
+                with self.lock:
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def write(self):
+        with self.lock:
+            lines = ["{} {}\n".format(stack, n) for stack, n in sorted(self.stacks.items())]
+        with open(self.path, 'w') as f:
+            f.writelines(lines)
+
+
+def install(config, process_name, directory):
+    """Wrap the configured targets; returns the profiler, or None when off."""
+    mode = _option(config, 'mode', 'off').strip().lower()
+    if mode not in MODES:
+        raise ValueError("[profiling] mode must be one of {}, not {!r}".format(", ".join(MODES), mode))
+    if mode == 'off':
+        return None
+
+    session = "{}_{}".format(time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+    path = os.path.join(directory, "profile_{}_{}".format(process_name, session))
+    if mode == 'cprofile':
+        profiler = CProfiler(path)
+    else:
+        profiler = SamplingProfiler(path, _option(config, 'interval', DEFAULT_INTERVAL, 'getfloat'))
+
+    targets = [t.strip() for t in _option(config, 'targets', '').split(',') if t.strip()]
+    for target in targets:
+        owner, name, func = resolve(target)
+        setattr(owner, name, profiler.wrap(func))
+
+    flush_interval = _option(config, 'flush_interval', DEFAULT_FLUSH_INTERVAL, 'getfloat')
+    def flush():
+        while True:
+            time.sleep(flush_interval)
+            profiler.write()
+    thread = threading.Thread(target=flush)
+    thread.daemon = True
+    thread.start()
+    atexit.register(profiler.write)
+    profiler.start()
+    return profiler
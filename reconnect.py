@@ -0,0 +1,75 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# reconnect.py - Non-blocking reconnection with jittered exponential backoff
+#
+# Attempt n waits a random time between 0 and min(MAX_DELAY, FIRST_DELAY *
+# 2**n) ("full jitter"), so after a server restart the clients don't all come
+# back in the same instant, while the first retry after a network blip goes
+# out within FIRST_DELAY. Retries are scheduled on the client's reactor and
+# never sleep, so the reactor keeps running while we wait.
+#
+# The caller rejoins its channels from on_welcome as usual; the reconnect
+# keeps whatever nick the connection had last (a pooled host keeps
+# HostBot_<owner>, not its idle placeholder).
+
+import random
+import ssl
+
+from irc.client import ServerConnectionError
+from irc.connection import Factory
+
+FIRST_DELAY = 0.2  # Seconds; upper bound of the first retry's delay
+MAX_DELAY = 30.0
+
+
+class Reconnector(object):
+    def __init__(self, client, config, first_delay=FIRST_DELAY, max_delay=MAX_DELAY, rng=None):
+        self.client = client
+        self.server = config.get('irc', 'server')
+        self.port = config.getint('irc', 'port')
+        if config.getboolean('irc', 'ssl'):
+            self.connect_factory = Factory(wrapper=ssl.wrap_socket)
+        else:
+            self.connect_factory = Factory()
+        self.first_delay = first_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+        self.attempts = 0
+        self.scheduled = False
+        self.enabled = True  # Cleared on a deliberate quit
+
+    def connect(self, nick):
+        """First connection; raises ServerConnectionError like SimpleIRCClient.connect."""
+        self.client.connect(self.server, self.port, nick, connect_factory=self.connect_factory)
+
+    def delay(self):
+        return self.rng.uniform(0, min(self.max_delay, self.first_delay * 2 ** self.attempts))
+
+    def schedule(self):
+        """Queue the next attempt on the reactor; call from on_disconnect."""
+        if self.scheduled or not self.enabled:
+            return
+        self.scheduled = True
+        delay = self.delay()
+        self.attempts += 1
+        self.client.reactor.scheduler.execute_after(delay, self.attempt)
+
+    def attempt(self):
+        self.scheduled = False
+        connection = self.client.connection
+        if not self.enabled or connection.is_connected():
+            return
+        try:
+            self.connect(connection.get_nickname())
+        except ServerConnectionError:
+            self.schedule()
+
+    def registered(self):
+        """The server welcomed us; the next drop starts from FIRST_DELAY again."""
+        self.attempts = 0
+
+    def nick_in_use(self):
+        """Our old session may still hold the nick: hang up and retry later."""
+        if self.attempts:
+            self.client.connection.disconnect("Nick still in use")
@@ -0,0 +1,87 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# rng.py - Per-game seeded random numbers
+#
+# Every GameState owns one GameRNG, so a game (or a benchmark, or a bot's
+# simulation) started from the same seed rolls the same dice and makes the
+# same board choices no matter what else the process is doing with the
+# global random module.
+#
+# Dice come from their own stream, generated DICE_BLOCK rolls at a time with
+# one random() call per roll, so roll() is just a list index. Each block is
+# seeded from (seed, block number): roll n is the same value whatever else
+# the game drew from the RNG, and any position in the stream (a restored
+# snapshot, an unmade search move) is reached without replaying the rolls
+# before it.
+
+import random
+
+DICE_BLOCK = 256
+
+# All 36 outcomes of two dice; one uniform draw picks a sum with the right odds
+_TWO_DICE = [a + b for a in range(1, 7) for b in range(1, 7)]
+
+_DICE_STREAM = 0x5DEECE66D  # Mixed into the seed so dice and choices are independent streams
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(32)
+
+
+class GameRNG(random.Random):
+    """random.Random for board choices plus a pre-generated dice stream."""
+
+    def __new__(cls, seed=None, dice_drawn=0):
+        # The C base class only takes the seed
+        return random.Random.__new__(cls, seed)
+
+    def __init__(self, seed=None, dice_drawn=0):
+        if seed is None:
+            seed = new_seed()
+        random.Random.__init__(self, seed)
+        self.seed_value = seed
+        self.dice = None  # Current block, loaded on the first roll
+        self.dice_block = None
+        self.dice_index = dice_drawn % DICE_BLOCK
+        self.dice_drawn = dice_drawn
+
+    def _load_block(self, block):
+        r = random.Random(((self.seed_value ^ _DICE_STREAM) << 32) | block).random
+        self.dice = [_TWO_DICE[int(r() * 36)] for _ in xrange(DICE_BLOCK)]
+        self.dice_block = block
+
+    def roll(self):
+        """Sum of two dice, the next value of the stream."""
+        if self.dice_index >= DICE_BLOCK or self.dice is None:
+            self.skip_dice(0)
+        dice = self.dice[self.dice_index]
+        self.dice_index += 1
+        self.dice_drawn += 1
+        return dice
+
+    def dice_stream(self, n):
+        """The next n rolls as a list, consumed in one go."""
+        rolls = []
+        while len(rolls) < n:
+            if self.dice_index >= DICE_BLOCK or self.dice is None:
+                self.skip_dice(0)
+            take = self.dice[self.dice_index:self.dice_index + n - len(rolls)]
+            self.dice_index += len(take)
+            self.dice_drawn += len(take)
+            rolls.extend(take)
+        return rolls
+
+    def skip_dice(self, n):
+        """Move the dice stream n rolls on (or back, for negative n)."""
+        self.dice_drawn += n
+        block, self.dice_index = divmod(self.dice_drawn, DICE_BLOCK)
+        if block != self.dice_block:
+            self._load_block(block)
+
+    def mark(self):
+        """Current dice position, for rewind()."""
+        return (self.dice, self.dice_block, self.dice_index, self.dice_drawn)
+
+    def rewind(self, mark):
+        self.dice, self.dice_block, self.dice_index, self.dice_drawn = mark
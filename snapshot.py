@@ -0,0 +1,283 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# snapshot.py - Compact versioned binary snapshots of GameState and GameBoard
+#
+# Layout (all integers little-endian):
+#
+#   header    "CTNS" <version:B> <flags:B>
+#   strings   <count:H> then <len:H><bytes> each; nicks and names are
+#             stored once and referenced by index everywhere else
+#   game      <state:B> <active:B> <turn index:H> <version:I> <last roll:b>
+#             <robber:h string index, -1 for none>
+#             <players:H> then per player (index = position in this array):
+#               <nick:H> <id:H> <flags:B> <resources:5H> and the road, settlement
+#               and city ids as <counts:3H> followed by one <ids:nI> array
+#             <turn order:H> player indexes, <pending rolls:H> bytes
+#             player flags: PLAYER_READY, PLAYER_LONGEST_ROAD
+#   rng       (flags & FLAG_RNG) <seed:Q> <dice drawn:I>
+#   board     (flags & FLAG_BOARD) <radius:H> <players:H> then per player:
+#               <player id:i> <name:H> <longest road:H>; the board shares the
+#               game's Player records, so their pieces are only in the game section
+#   trades    (flags & FLAG_TRADES) <book seq:I> <offers:H> then per offer:
+#               <seq:I> <nick:H> <give:B> <give n:B> <want:B> <want n:B>
+#
+# Loading is a handful of struct.unpack_from calls per player, so a game
+# round-trips in well under a millisecond without pickling every object.
+# The bytes are canonical (players in nick order, ids sorted), which lets
+# checksum() compare a client mirror against the host's game. The RNG
+# section is left out of checksums and of anything sent to players, since
+# the seed predicts every future roll. Open trade offers go with it: they
+# only matter to the host (and its event log) and mirrors don't track them.
+
+import copy
+import struct
+import zlib
+
+from game import GameState
+from player import Player, RESOURCE_TYPES, new_hand
+from rng import GameRNG
+from trade import Offer
+
+MAGIC = "CTNS"
+SNAPSHOT_VERSION = 7  # 4: closed-form node ids (topology.py), 5: 16-bit pending roll count,
+                      # 6: longest road holder, 7: pieces stored once, not again per board player
+FLAG_BOARD = 0x01
+FLAG_RNG = 0x02
+FLAG_TRADES = 0x04
+PLAYER_READY = 0x01
+PLAYER_LONGEST_ROAD = 0x02
+
+STATES = ('awaiting_ready', 'awaiting_roll', 'awaiting_robber_move', 'awaiting_actions')
+
+_HEADER = struct.Struct("<4sBB")
+_GAME = struct.Struct("<BBHIbh")
+_PLAYER = struct.Struct("<HHB%dH" % len(RESOURCE_TYPES))
+_RNG = struct.Struct("<QI")
+_BOARD = struct.Struct("<HH")
+_BOARD_PLAYER = struct.Struct("<iHH")
+_COUNT = struct.Struct("<H")
+_ID_COUNTS = struct.Struct("<HHH")
+_TRADES = struct.Struct("<IH")
+_OFFER = struct.Struct("<IHBBBB")
+
+
+class _Strings(object):
+    def __init__(self):
+        self.index = {}
+        self.items = []
+
+    def ref(self, s):
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.items)
+            self.items.append(s)
+        return i
+
+    def pack(self):
+        parts = [_COUNT.pack(len(self.items))]
+        for s in self.items:
+            if isinstance(s, unicode):
+                s = s.encode('utf-8')  # Nicks arrive from the irc library as unicode
+            parts.append(_COUNT.pack(len(s)))
+            parts.append(s)
+        return parts
+
+
+def _pack_buildings(p):
+    roads, settlements, cities = sorted(p.roads), sorted(p.settlements), sorted(p.cities)
+    ids = roads + settlements + cities
+    return (_ID_COUNTS.pack(len(roads), len(settlements), len(cities)) +
+            struct.pack("<%dI" % len(ids), *ids))
+
+
+def _unpack_buildings(p, data, offset):
+    r, s, c = _ID_COUNTS.unpack_from(data, offset)
+    offset += _ID_COUNTS.size
+    ids = struct.unpack_from("<%dI" % (r + s + c), data, offset)
+    p.roads = set(ids[:r])
+    p.settlements = set(ids[r:r + s])
+    p.cities = set(ids[r + s:])
+    return offset + 4 * (r + s + c)
+
+
+def dumps(game, rng=True):
+    """Serialize game (and its GameBoard, if attached) to a byte string.
+
+    rng=False leaves out the seed and dice position, and the open trades.
+    """
+    strings = _Strings()
+    body = []
+
+    nicks = sorted(game.players)  # Canonical order: equal games give equal bytes
+    player_index = dict((nick, i) for i, nick in enumerate(nicks))
+    robber = -1 if game.robber_tile is None else strings.ref(game.robber_tile)
+    last_roll = -1 if game.last_roll is None else game.last_roll
+    body.append(_GAME.pack(STATES.index(game.state), int(game.game_active),
+                           game.current_turn_index, game.version, last_roll, robber))
+    body.append(_COUNT.pack(len(nicks)))
+    for nick in nicks:
+        p = game.players[nick]
+        player_flags = ((PLAYER_READY if nick in game.ready_players else 0) |
+                        (PLAYER_LONGEST_ROAD if p.has_longest_road else 0))
+        body.append(_PLAYER.pack(strings.ref(nick), p.id, player_flags, *p.resources))
+        body.append(_pack_buildings(p))
+    order = [player_index[nick] for nick in game.turn_order]
+    body.append(_COUNT.pack(len(order)) + struct.pack("<%dH" % len(order), *order))
+    body.append(_COUNT.pack(len(game.pending_rolls)) + struct.pack("<%dB" % len(game.pending_rolls), *game.pending_rolls))
+
+    flags = 0
+    if rng:
+        flags |= FLAG_RNG
+        body.append(_RNG.pack(game.rng.seed_value, game.rng.dice_drawn))
+    board = game.board
+    if board is not None:
+        flags |= FLAG_BOARD
+        body.append(_BOARD.pack(map_radius(board.hexmap), len(board.players)))
+        for player_id, p in sorted(board.players.items()):
+            body.append(_BOARD_PLAYER.pack(player_id, strings.ref(p.nick), p.longest_road_length))
+    if rng and game.trades:
+        flags |= FLAG_TRADES
+        offers = sorted((o for mine in game.trades.by_nick.values() for o in mine), key=lambda o: o.seq)
+        body.append(_TRADES.pack(game.trades.seq, len(offers)))
+        for o in offers:
+            body.append(_OFFER.pack(o.seq, strings.ref(o.nick), RESOURCE_TYPES.index(o.give), o.give_n,
+                                    RESOURCE_TYPES.index(o.want), o.want_n))
+
+    return "".join([_HEADER.pack(MAGIC, SNAPSHOT_VERSION, flags)] + strings.pack() + body)
+
+
+def loads(data, hexmap=None):
+    """Rebuild a game from dumps() output, with its board attached if stored.
+
+    Pass hexmap to attach the board to an existing map instead of building
+    a fresh default map of the stored radius.
+    """
+    magic, version, flags = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a game snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError("unsupported snapshot version {}".format(version))
+    offset = _HEADER.size
+
+    n, = _COUNT.unpack_from(data, offset)
+    offset += 2
+    strings = []
+    for _ in range(n):
+        length, = _COUNT.unpack_from(data, offset)
+        strings.append(data[offset + 2:offset + 2 + length])
+        offset += 2 + length
+
+    game = GameState()
+    state, active, turn_index, game.version, last_roll, robber = _GAME.unpack_from(data, offset)
+    offset += _GAME.size
+    game.state = STATES[state]
+    game.game_active = bool(active)
+    game.current_turn_index = turn_index
+    game.last_roll = None if last_roll < 0 else last_roll
+    game.robber_tile = None if robber < 0 else strings[robber]
+
+    n, = _COUNT.unpack_from(data, offset)
+    offset += 2
+    nicks = []
+    for _ in range(n):
+        fields = _PLAYER.unpack_from(data, offset)
+        offset += _PLAYER.size
+        nick = strings[fields[0]]
+        p = Player(nick, fields[1])
+        p.resources = new_hand(fields[3:])
+        offset = _unpack_buildings(p, data, offset)
+        p.has_longest_road = bool(fields[2] & PLAYER_LONGEST_ROAD)
+        p.victory_points = p.count_victory_points()
+        game.players[nick] = p
+        if fields[2] & PLAYER_READY:
+            game.ready_players.add(nick)
+        nicks.append(nick)
+
+    n, = _COUNT.unpack_from(data, offset)
+    offset += 2
+    game.turn_order = [nicks[i] for i in struct.unpack_from("<%dH" % n, data, offset)]
+    offset += 2 * n
+    n, = _COUNT.unpack_from(data, offset)
+    game.pending_rolls = list(struct.unpack_from("<%dB" % n, data, offset + 2))
+    offset += 2 + n
+
+    if flags & FLAG_RNG:
+        seed, dice_drawn = _RNG.unpack_from(data, offset)
+        offset += _RNG.size
+        game.rng = GameRNG(seed, dice_drawn)
+
+    if flags & FLAG_BOARD:
+        from board import GameBoard
+        radius, n = _BOARD.unpack_from(data, offset)
+        offset += _BOARD.size
+        if hexmap is None:
+            hexmap = default_hexmap(radius)
+        board = GameBoard(hexmap)
+        by_id = dict((p.id, p) for p in game.players.itervalues())  # Seat the same records, as add_player() does
+        for _ in range(n):
+            player_id, name, longest = _BOARD_PLAYER.unpack_from(data, offset)
+            offset += _BOARD_PLAYER.size
+            board.add_player(player_id, strings[name], by_id.get(player_id))
+            p = board.players[player_id]
+            p.longest_road_length = longest
+            for edge_id in p.roads:
+                hexmap.road_owners[edge_id] = player_id
+            for node_id in p.settlements | p.cities:
+                board.set_node_owner(node_id, player_id)
+        game.attach_board(board)
+
+    if flags & FLAG_TRADES:
+        game.trades.seq, n = _TRADES.unpack_from(data, offset)
+        offset += _TRADES.size
+        for _ in range(n):
+            seq, nick, give, give_n, want, want_n = _OFFER.unpack_from(data, offset)
+            offset += _OFFER.size
+            game.trades.restore(Offer(seq, strings[nick], RESOURCE_TYPES[give], give_n,
+                                      RESOURCE_TYPES[want], want_n))
+
+    return game
+
+
+def canonical(game):
+    """dumps(game, rng=False), serialized once per game version.
+
+    The host's !delta checksum and !state lines, and a mirror's check of
+    each delta, all read the same version; only the first one pays.
+    """
+    cached = game.canonical
+    if cached is None or cached[0] != game.version:
+        cached = game.canonical = (game.version, dumps(game, rng=False))
+    return cached[1]
+
+
+def checksum(game):
+    """Short hex digest of the canonical snapshot, for comparing replicas."""
+    return "%08x" % (zlib.crc32(canonical(game)) & 0xffffffff)
+
+
+def map_radius(hexmap):
+    radius = getattr(hexmap, 'radius', None)
+    if radius is None:
+        radius = max(max(abs(x), abs(y), abs(z)) for x, y, z in hexmap.tiles) if hexmap.tiles else 0
+    return radius
+
+
+_default_maps = {}
+
+def default_hexmap(radius):
+    """A default map of the given radius with no roads on it.
+
+    Topology is built once per radius and shared; only road ownership is
+    per copy.
+    """
+    template = _default_maps.get(radius)
+    if template is None:
+        from map import HexMap
+        template = HexMap()
+        template.generate_default_map(radius=radius)
+        template.build_nodes_and_edges()
+        _default_maps[radius] = template
+    hexmap = copy.copy(template)
+    hexmap.road_owners = {}
+    return hexmap
@@ -0,0 +1,157 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# spectate.py - The board as chat text, for "!board" in a game channel
+#
+#   !board v42 awaiting_actions, turn bob, last roll 8, robber 0,0,0
+#   !board        ~~~   ~~~   ~~~   ~~~
+#   !board     ~~~   lu  8 wo* 3 gr 11   ~~~
+#   ...
+#   !board alice: 4 VP, 2 settlements, 1 city, 5 roads, 7 cards
+#
+# A render depends only on the game's version, so BoardCache keeps the last
+# one and hands the same lines to everyone until the version moves on.
+#
+# BoardFeed answers the requests. The board goes to the whole channel, one
+# line every line_interval seconds, and at most once per min_interval:
+# requests that arrive while a board is queued or going out wait for the
+# next send and share it. Ten spectators asking at once cost one render and
+# one paced send, and a spectator repeating "!board" can't make the host
+# flood the channel. Everything runs on the IRC reactor through the
+# schedule(delay, fn) callable the host passes in, so nothing sleeps.
+
+import time
+
+import metrics
+from game import parse_tile_key
+
+BOARD_VERB = "!board"
+LINE_INTERVAL = 0.5  # Seconds between the lines of one board
+MIN_INTERVAL = 10.0  # Seconds from the end of one board to the start of the next
+
+CELL = 6  # Characters per tile; rows are offset by half a tile
+
+_ABBREVIATIONS = {'brick': 'br', 'lumber': 'lu', 'wool': 'wo', 'grain': 'gr', 'ore': 'or'}
+
+
+def _count(n, word, plural=None):
+    return "{} {}".format(n, word if n == 1 else plural or word + "s")
+
+
+def _cell(game, coord, numbers, robber):
+    resource = game.tile_resources.get(coord)
+    if resource is None:
+        return " ~~~"
+    return "{}{}{:>2}".format(_ABBREVIATIONS[resource], "*" if coord == robber else " ", numbers.get(coord, ""))
+
+
+def render_board(game):
+    """The chat lines showing game: a status line, one line per row of
+    tiles (resource, number, * for the robber, ~~~ for sea) and one line
+    per player."""
+    status = "v{} {}".format(game.version, game.state)
+    if game.game_active:
+        status += ", turn {}".format(game.current_player())
+    if game.last_roll is not None:
+        status += ", last roll {}".format(game.last_roll)
+    if game.robber_tile is not None:
+        status += ", robber {}".format(game.robber_tile)
+    lines = [status]
+
+    board = game.board
+    if board is not None and board.hexmap.tiles:
+        numbers = {}
+        for number, tiles in game.number_tiles.iteritems():
+            for tile in tiles:
+                numbers[(tile.x, tile.y, tile.z)] = number
+        robber = parse_tile_key(game.robber_tile) if game.robber_tile else None
+        rows = {}
+        for coord in board.hexmap.tiles:
+            rows.setdefault(coord[2], []).append(coord)
+        # Pointy tiles: x + z/2 is the column, so each row shifts half a tile
+        left = min(2 * x + z for x, _, z in board.hexmap.tiles)
+        for z in sorted(rows):
+            line = ""
+            for coord in sorted(rows[z]):
+                col = (2 * coord[0] + z - left) * CELL // 2
+                line += " " * (col - len(line)) + _cell(game, coord, numbers, robber)
+            lines.append(line.rstrip())
+
+    for nick in sorted(game.players):
+        p = game.players[nick]
+        lines.append("{}: {} VP, {}, {}, {}, {}".format(
+            nick, p.victory_points, _count(len(p.settlements), "settlement"),
+            _count(len(p.cities), "city", "cities"),
+            _count(len(p.roads), "road"), _count(p.hand_size(), "card")))
+    return ["{} {}".format(BOARD_VERB, line) for line in lines]
+
+
+class BoardCache(object):
+    """render_board() of the latest version of a game, rendered once per version.
+
+    The cache holds the game it rendered, so a new game (a restart, or one
+    reusing a freed game's id()) at the same version is never mistaken for it.
+    """
+
+    def __init__(self):
+        self.game = None
+        self.version = None
+        self.rendered = None
+
+    def lines(self, game):
+        if game is not self.game or game.version != self.version:
+            with metrics.timer('board.render'):
+                self.rendered = render_board(game)
+            self.game = game
+            self.version = game.version
+        return self.rendered
+
+
+class BoardFeed(object):
+    """Coalesces "!board" requests into paced sends of one cached render.
+
+    game() returns the game to show, send(line) puts a line in the channel
+    and schedule(delay, fn) runs fn on the reactor after delay seconds.
+    """
+
+    def __init__(self, game, send, schedule, line_interval=LINE_INTERVAL,
+                 min_interval=MIN_INTERVAL, clock=time.time):
+        self.game = game
+        self.send = send
+        self.schedule = schedule
+        self.line_interval = line_interval
+        self.min_interval = min_interval
+        self.clock = clock
+        self.cache = BoardCache()
+        self.waiting = set()   # Nicks asking since the last send started
+        self.busy = False      # A send is scheduled or going out
+        self.next_start = 0.0  # Earliest time the next send may start
+
+    def request(self, nick):
+        metrics.count('board.requests')
+        self.waiting.add(nick)
+        if not self.busy:
+            self.busy = True
+            self.schedule(max(0.0, self.next_start - self.clock()), self._start)
+
+    def _start(self):
+        metrics.count('board.sends')
+        self.waiting = set()
+        # Rendered when the send starts, so it shows the newest version
+        self._send_from(self.cache.lines(self.game()), 0)
+
+    def _send_from(self, lines, i):
+        try:
+            self.send(lines[i])
+        finally:
+            if i + 1 < len(lines):
+                self.schedule(self.line_interval, lambda: self._send_from(lines, i + 1))
+            else:
+                self._finish()
+
+    def _finish(self):
+        self.next_start = self.clock() + self.min_interval
+        self.busy = False
+        if self.waiting:
+            self.busy = True
+            self.schedule(self.min_interval, self._start)
@@ -2,6 +2,8 @@ import sys
 import atexit
 import signal
 
+import metrics
+
 class Terminal(object):
     # ncurses color pair numbers for use by UI and map drawing
     COLOR_PAIR_WHITE = 1
@@ -180,10 +182,11 @@ class Terminal(object):
 
     def refresh(self):
         """Refresh the screen to show changes"""
-        try:
-            self.stdscr.refresh()
-        except self.curses.error:
-            pass
+        with metrics.timer('terminal.refresh'):
+            try:
+                self.stdscr.refresh()
+            except self.curses.error:
+                pass
 
     def gettermsize(self):
         """Get terminal dimensions, with fallback"""
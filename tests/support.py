@@ -0,0 +1,140 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# support.py - Shared helpers for the tests: games on the default map, a
+# manual reactor clock and a Host wired to a recording connection instead
+# of an IRC server
+
+import ConfigParser
+import heapq
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def seated_game(players=('alice', 'bob'), seed=1):
+    """A game on the default map with players joined but not ready."""
+    from game import new_game
+    game = new_game(seed=seed)
+    for nick in players:
+        game.add_player(nick)
+    return game
+
+
+def started_game(players=('alice', 'bob'), seed=1, state='awaiting_actions'):
+    """seated_game() with everyone ready, so the starting cards are dealt.
+
+    The first player in turn order is on turn; state puts the game
+    straight into that state, None leaves it awaiting their roll.
+    """
+    game = seated_game(players, seed)
+    for nick in players:
+        game.handle_command(nick, "!ready")
+    if state is not None:
+        game.state = state
+    return game
+
+
+class ManualScheduler(object):
+    """schedule(delay, fn) that runs nothing until run_until(t) moves the clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.queue = []
+        self.count = 0
+
+    def execute_after(self, delay, fn):
+        self.schedule(delay, fn)
+
+    def clock(self):
+        return self.now
+
+    def schedule(self, delay, fn):
+        self.count += 1
+        heapq.heappush(self.queue, (self.now + delay, self.count, fn))
+
+    def run_until(self, t):
+        while self.queue and self.queue[0][0] <= t:
+            self.now, _, fn = heapq.heappop(self.queue)
+            fn()
+        self.now = t
+
+    def run_all(self):
+        """Run everything scheduled, including what that schedules."""
+        while self.queue:
+            self.run_until(self.queue[0][0])
+
+
+class RecordingConnection(object):
+    """What Host sends, as (time, kind, target, line)."""
+
+    def __init__(self, scheduler, nick="HostBot_owner"):
+        self.scheduler = scheduler
+        self.nick = nick
+        self.sent = []
+        self.invites = []  # (nick, channel), kept apart from the lines
+
+    def is_connected(self):
+        return True
+
+    def get_nickname(self):
+        return self.nick
+
+    def privmsg(self, target, line):
+        self.sent.append((self.scheduler.now, 'privmsg', target, line))
+
+    def quit(self, message=""):
+        self.sent.append((self.scheduler.now, 'quit', None, message))
+
+    def notice(self, target, line):
+        self.sent.append((self.scheduler.now, 'notice', target, line))
+
+    def invite(self, nick, channel):
+        self.invites.append((nick, channel))
+
+    def to(self, target):
+        return [line for _, _, t, line in self.sent if t == target]
+
+
+class Event(object):
+    """The parts of an irc Event the handlers read."""
+
+    def __init__(self, source, target, text):
+        self.source = source
+        self.target = target
+        self.arguments = [text]
+
+
+def host_config():
+    config = ConfigParser.ConfigParser()
+    config.add_section('irc')
+    for key, value in (('server', '127.0.0.1'), ('port', '6667'), ('channel', '#catan-lobby'),
+                       ('nick', 'test'), ('ssl', 'False')):
+        config.set('irc', key, value)
+    config.add_section('host')
+    return config
+
+
+def join_game(host, nick):
+    """nick asks for a seat in the lobby and joins the game channel, as client.py does."""
+    host.on_pubmsg(None, Event('{0}!{0}@h'.format(nick), host.lobby_channel, "!join {}".format(host.owner_username)))
+    host.on_join(None, Event('{0}!{0}@h'.format(nick), host.game_channel, ""))
+
+
+def new_host(owner='owner'):
+    """(Host for owner with a fresh game in a temp dir, its scheduler, its connection)."""
+    from host import Host
+    scheduler = ManualScheduler()
+    host = Host(host_config(), owner, state_dir=tempfile.mkdtemp(prefix='catan-test-'))
+    host.log_path = os.devnull
+    host.connection = RecordingConnection(scheduler, "HostBot_{}".format(owner))
+    host.outbox.schedule = scheduler.schedule
+    host.clock = scheduler.clock
+    host.reactor.scheduler = scheduler
+    host.board_feed.schedule = scheduler.schedule
+    host.board_feed.clock = scheduler.clock
+    return host, scheduler, host.connection
@@ -0,0 +1,77 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_board.py - GameBoard's building index and make/unmake of builds
+
+import os
+import random
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from board import GameBoard
+from map import HexMap
+
+
+def new_board(radius=3, players=3):
+    hexmap = HexMap()
+    hexmap.generate_default_map(radius)
+    hexmap.build_nodes_and_edges()
+    board = GameBoard(hexmap)
+    for player_id in range(1, players + 1):
+        board.add_player(player_id)
+    return board
+
+
+def scanned_tile_buildings(board):
+    """tile_buildings worked out from scratch from node_owners."""
+    counts = {}
+    for coord, tile in board.hexmap.tiles.items():
+        for node in tile.nodes:
+            owner = board.node_owners.get(node)
+            if owner is not None:
+                owners = counts.setdefault(coord, {})
+                owners[owner] = owners.get(owner, 0) + 1
+    return counts
+
+
+class TileBuildingsTest(unittest.TestCase):
+    def assertIndexed(self, board):
+        index = dict((c, o) for c, o in board.tile_buildings.items() if o)
+        self.assertEqual(index, scanned_tile_buildings(board))
+        for coord in board.hexmap.tiles:
+            self.assertEqual(sorted(board.building_owners(coord)),
+                             sorted(scanned_tile_buildings(board).get(coord, {})))
+
+    def test_random_owner_changes(self):
+        rng = random.Random(7)
+        for radius in (1, 3):
+            board = new_board(radius)
+            nodes = range(board.hexmap.node_autoinc)
+            for _ in range(500):
+                node = rng.choice(nodes)
+                board.set_node_owner(node, rng.choice([None, 1, 2, 3]) if node in board.node_owners
+                                     else rng.choice([1, 2, 3]))
+                self.assertIndexed(board)
+
+    def test_builds_and_unmakes(self):
+        board = new_board()
+        records = [board.make_build(1, 'settlement', 10), board.make_build(2, 'settlement', 12),
+                   board.make_build(1, 'city', 10), board.make_build(2, 'road', 5)]
+        self.assertIndexed(board)
+        self.assertEqual(board.node_owners, {10: 1, 12: 2})
+        self.assertEqual(board.players[1].cities, set([10]))
+        self.assertEqual(board.players[1].settlements, set())
+        for record in reversed(records):
+            board.unmake_build(record)
+            self.assertIndexed(board)
+        self.assertEqual(board.node_owners, {})
+        self.assertEqual(board.tile_buildings, {})
+        self.assertEqual(board.hexmap.road_owners, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
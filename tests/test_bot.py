@@ -0,0 +1,51 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_bot.py - Bot search results reaching the game channel
+
+import os
+import sys
+import threading
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from support import ManualScheduler, RecordingConnection, host_config
+
+from bot import Bot, _Decision
+
+
+class ResultTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = ManualScheduler()
+        self.bot = Bot(host_config(), 'owner', 'CatanBot_owner_0', pool=None, workers=2)
+        self.bot.reactor.scheduler = self.scheduler
+        self.bot.connection = RecordingConnection(self.scheduler, self.bot.nick)
+
+    def deliver(self, decision, result):
+        """on_result() from another thread, as the pool calls it."""
+        thread = threading.Thread(target=self.bot.on_result, args=(decision, result))
+        thread.start()
+        thread.join()
+
+    def test_move_is_sent_from_the_reactor(self):
+        decision = self.bot.decision = _Decision(7, ["!pass", "!roll"], 2)
+        self.deliver(decision, ({"!roll": 3, "!pass": 1}, 10))
+        self.deliver(decision, ({"!roll": 2}, 10))
+        self.assertEqual(self.bot.connection.sent, [])  # Nothing from the pool's thread
+        self.scheduler.run_all()
+        self.assertEqual(self.bot.connection.to(self.bot.game_channel), ["!roll"])
+        self.assertEqual((self.bot.searches, self.bot.iterations), (1, 20))
+
+    def test_deadline_and_results_send_once(self):
+        decision = self.bot.decision = _Decision(7, ["!pass", "!roll"], 1)
+        self.deliver(decision, ({"!roll": 3}, 5))
+        self.bot.finish(decision)  # The budget timer got there first
+        self.scheduler.run_all()
+        self.assertEqual(self.bot.connection.to(self.bot.game_channel), ["!roll"])
+
+
+if __name__ == '__main__':
+    unittest.main()
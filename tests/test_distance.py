@@ -0,0 +1,109 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_distance.py - Adjacency tables, node -> tile tables and DistanceField
+#
+#   python -m unittest discover -s tests
+
+import gc
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from board import GameBoard
+from distance import adjacency, node_tiles
+from map import HexMap
+
+
+def default_map(radius):
+    hexmap = HexMap()
+    hexmap.generate_default_map(radius)
+    hexmap.build_nodes_and_edges()
+    return hexmap
+
+
+def tile_map(coords):
+    """A generic map (no HexTopology) of the given tiles."""
+    hexmap = HexMap()
+    for x, y, z in coords:
+        hexmap.add_tile(x, y, z, 'land')
+    hexmap.build_nodes_and_edges()
+    return hexmap
+
+
+def brute_force(hexmap):
+    edge_nodes, corners = {}, {}
+    for coord, tile in hexmap.tiles.items():
+        for i in range(6):
+            edge_nodes[tile.edges[i]] = set((tile.nodes[i], tile.nodes[(i + 1) % 6]))
+            corners.setdefault(tile.nodes[i], set()).add(coord)
+    return edge_nodes, corners
+
+
+class TablesFollowTheirMap(unittest.TestCase):
+    def check(self, hexmap):
+        expected_edges, expected_corners = brute_force(hexmap)
+        edge_nodes, node_edges = adjacency(hexmap)
+        self.assertEqual(dict((e, set(n)) for e, n in edge_nodes.items()), expected_edges)
+        for node, edges in node_edges.items():
+            for edge_id in edges:
+                self.assertIn(node, edge_nodes[edge_id])
+        self.assertEqual(dict((n, set(c)) for n, c in node_tiles(hexmap).items()), expected_corners)
+
+    def test_rebuilt_maps_of_other_sizes(self):
+        # Freed maps hand their ids to the next ones; no table may follow them
+        for coords in ([(0, 0, 0)], [(0, 0, 0), (1, 0, -1)], [(0, 0, 0)], [(0, 0, 0), (0, 1, -1), (1, 0, -1)]):
+            hexmap = tile_map(coords)
+            self.check(hexmap)
+            del hexmap
+            gc.collect()
+        for radius in (2, 0, 3, 1, 2):
+            hexmap = default_map(radius)
+            self.check(hexmap)
+            del hexmap
+            gc.collect()
+
+    def test_tables_follow_a_map_that_grows(self):
+        hexmap = tile_map([(0, 0, 0)])
+        self.check(hexmap)
+        hexmap.add_tile(1, 0, -1, 'land')
+        hexmap.build_nodes_and_edges()
+        self.check(hexmap)
+
+    def test_board_uses_its_own_map(self):
+        small = GameBoard(default_map(1))
+        del small
+        gc.collect()
+        hexmap = default_map(2)
+        board = GameBoard(hexmap)
+        self.assertEqual(board.node_tiles, node_tiles(hexmap))
+        self.assertEqual(len(board.node_tiles), hexmap.node_autoinc)
+
+
+class DistanceFieldTest(unittest.TestCase):
+    def test_incremental_updates_match_a_recompute(self):
+        hexmap = default_map(3)
+        board = GameBoard(hexmap)
+        board.add_player(1)
+        board.add_player(2)
+        field = board.distance_field(1)
+        edge_nodes, node_edges = adjacency(hexmap)
+        board.build_settlement(1, 0)
+        edge_id = node_edges[0][0]
+        for _ in range(6):
+            board.build_road(1, edge_id)
+            _, b = edge_nodes[edge_id]
+            edge_id = [e for e in node_edges[b] if e not in hexmap.road_owners][0]
+        board.build_settlement(2, 40)
+        incremental = dict(field.distances())
+        field.recompute()
+        self.assertEqual(incremental, field.distances())
+        self.assertEqual(field.distance(0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
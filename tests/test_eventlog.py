@@ -0,0 +1,137 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_eventlog.py - Restoring games from the event log, and archiving logs
+# of games that are over
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import Event, join_game, new_host
+
+import snapshot
+from eventlog import ARCHIVE_DIR, EVENTS_FILE, SNAPSHOT_FILE, GameLog, prune_archive
+from game import new_game
+
+
+def logged_game(directory, commands=30, snapshot_interval=10):
+    """A game played through a GameLog in directory; returns (game, log)."""
+    game = new_game(seed=5)
+    log = GameLog(directory, snapshot_interval)
+    log.record_seed(game)
+    for nick in ('alice', 'bob'):
+        game.add_player(nick)
+        log.record_join(game, nick)
+    script = ["!ready"] * 2 + ["!roll", "!robber 0,0,0", "!pass"] * commands
+    for i, msg in enumerate(script):
+        nick = game.current_player() if game.game_active else ('alice', 'bob')[i % 2]
+        version = game.version
+        game.handle_command(nick, msg)
+        if game.version != version:
+            log.record_command(game, nick, msg)
+    return game, log
+
+
+class GameLogTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='catan-test-')
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.directory = os.path.join(self.root, 'alice')
+        self.archive_dir = os.path.join(self.root, ARCHIVE_DIR)
+
+    def test_restore(self):
+        game, log = logged_game(self.directory)
+        log.close()
+        restored = GameLog(self.directory).restore()
+        self.assertEqual(snapshot.dumps(restored), snapshot.dumps(game))
+
+    def test_archive_moves_the_files_out(self):
+        game, log = logged_game(self.directory)
+        path = log.archive(self.archive_dir)
+        self.assertFalse(os.path.exists(self.directory))
+        self.assertEqual(sorted(os.listdir(path)), sorted([EVENTS_FILE, SNAPSHOT_FILE]))
+        self.assertTrue(os.path.basename(path).endswith("-alice"))
+        self.assertEqual(snapshot.dumps(GameLog(path).restore()), snapshot.dumps(game))
+        self.assertIsNone(GameLog(self.directory).restore())
+
+    def test_keep_zero_deletes(self):
+        _, log = logged_game(self.directory)
+        self.assertIsNone(log.archive(self.archive_dir, keep=0))
+        self.assertFalse(os.path.exists(self.directory))
+        self.assertFalse(os.path.exists(self.archive_dir))
+
+    def test_rotate_starts_over_from_the_game(self):
+        game, log = logged_game(self.directory)
+        size = os.path.getsize(os.path.join(self.directory, EVENTS_FILE))
+        log.rotate(game, self.archive_dir)
+        self.assertEqual(os.path.getsize(os.path.join(self.directory, EVENTS_FILE)), 0)
+        game.handle_command(game.current_player(), "!roll")
+        log.record_command(game, game.current_player(), "!roll")
+        log.close()
+        self.assertLess(os.path.getsize(os.path.join(self.directory, EVENTS_FILE)), size)
+        self.assertEqual(snapshot.dumps(GameLog(self.directory).restore()), snapshot.dumps(game))
+
+    def test_prune_keeps_the_newest(self):
+        os.makedirs(self.archive_dir)
+        names = ["20260101-00000{}-alice".format(i) for i in range(5)]
+        for name in names:
+            os.mkdir(os.path.join(self.archive_dir, name))
+        prune_archive(self.archive_dir, 2)
+        self.assertEqual(sorted(os.listdir(self.archive_dir)), names[3:])
+
+    def test_archives_of_one_second_do_not_collide(self):
+        paths = set()
+        for _ in range(3):
+            _, log = logged_game(self.directory, commands=2)
+            paths.add(log.archive(self.archive_dir))
+        self.assertEqual(len(paths), 3)
+        self.assertEqual(len(os.listdir(self.archive_dir)), 3)
+
+
+class HostArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.host, self.scheduler, self.connection = new_host('alice')
+        self.addCleanup(shutil.rmtree, self.host.state_dir, True)
+        self.directory = os.path.join(self.host.state_dir, 'alice')
+        for nick in ('alice', 'bob'):
+            self.say(nick, None)
+        for nick in ('alice', 'bob'):
+            self.say(nick, "!ready")
+
+    def say(self, nick, msg):
+        if msg is None:
+            join_game(self.host, nick)
+        else:
+            self.host.on_pubmsg(None, Event('{0}!{0}@h'.format(nick), self.host.game_channel, msg))
+
+    def archived(self):
+        if not os.path.isdir(self.host.archive_dir):
+            return []
+        return os.listdir(self.host.archive_dir)
+
+    def test_a_win_archives_the_log(self):
+        game = self.host.game
+        alice = game.players['alice']
+        alice.victory_points = 9  # One settlement from winning
+        alice.resources[:] = type(alice.resources)('i', [5] * 5)
+        game.current_turn_index = game.turn_order.index('alice')
+        game.state = 'awaiting_actions'
+        self.say('alice', "!build settlement 20")
+        self.assertFalse(game.game_active)
+        self.assertEqual(len(self.archived()), 1)
+        restored = GameLog(self.directory).restore()
+        self.assertEqual(snapshot.dumps(restored), snapshot.dumps(game))
+
+    def test_close_game_archives_and_quits(self):
+        self.host.close_game()
+        self.assertFalse(self.host.running)
+        self.scheduler.run_all()
+        self.assertFalse(os.path.exists(self.directory))
+        self.assertEqual(len(self.archived()), 1)
+        self.assertEqual([kind for _, kind, _, _ in self.connection.sent][-1], 'quit')
+
+
+if __name__ == '__main__':
+    unittest.main()
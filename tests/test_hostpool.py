@@ -0,0 +1,207 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_hostpool.py - assign/request_host handshake between clients and the pool
+
+import ConfigParser
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from irc.client import ServerConnectionError
+
+import hostpool
+
+
+class FakeConnection(object):
+    def __init__(self, connected):
+        self.connected = connected
+        self.nick = None
+
+    def is_connected(self):
+        return self.connected
+
+    def get_nickname(self):
+        return self.nick
+
+    def disconnect(self, message=""):
+        self.connected = False
+
+
+class FakeReconnector(object):
+    enabled = True
+
+
+class FakeScheduler(object):
+    """Runs each call on one thread of its own, standing in for the reactor
+    thread; stalled holds every call back."""
+
+    def __init__(self):
+        self.stalled = False
+        self.held = []
+
+    def execute_after(self, delay, fn):
+        if self.stalled:
+            self.held.append(fn)
+            return
+
+        timer = threading.Timer(delay, fn)
+        timer.daemon = True
+        timer.start()
+
+
+class FakeReactor(object):
+    def __init__(self):
+        self.scheduler = FakeScheduler()
+
+
+class FakeHost(object):
+    """Stands in for host.Host: connects connect_after seconds after spawning."""
+
+    def __init__(self, connect_after):
+        self.connection = FakeConnection(connect_after == 0)
+        self.reconnector = FakeReconnector()
+        self.reactor = FakeReactor()
+        self.assign_thread = None
+        self.running = True
+        self.owners = []
+        if connect_after:
+            timer = threading.Timer(connect_after, lambda: setattr(self.connection, 'connected', True))
+            timer.daemon = True
+            timer.start()
+
+    def assign_owner(self, owner):
+        self.assign_thread = threading.current_thread()
+        self.owners.append(owner)
+        self.connection.nick = "HostBot_{}".format(owner)
+
+    def close_game(self):
+        self.running = False
+
+
+def pool_config(port):
+    config = ConfigParser.ConfigParser()
+    config.add_section('hostpool')
+    config.set('hostpool', 'host', '127.0.0.1')
+    config.set('hostpool', 'port', str(port))
+    return config
+
+
+def new_pool(connect_after):
+    pool = hostpool.HostPool(pool_config(0), size=0)
+    pool.spawned_hosts = []
+
+    def spawn():
+        host = FakeHost(connect_after)
+        pool.spawned_hosts.append(host)
+        return host
+    pool.spawn = spawn
+    pool.fill_in_background = lambda: None
+    return pool
+
+
+class SlowPool(object):
+    def __init__(self, delay):
+        self.delay = delay
+
+    def assign(self, owner):
+        time.sleep(self.delay)
+        return "HostBot_{}".format(owner)
+
+
+class RequestHostTest(unittest.TestCase):
+    def serve(self, pool):
+        server = hostpool.PoolServer(pool, ('127.0.0.1', 0))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return pool_config(server.server_address[1])
+
+    def test_no_pool_means_none(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        self.assertIsNone(hostpool.request_host(pool_config(port), 'alice'))
+
+    def test_waits_past_the_connect_timeout_for_a_slow_assign(self):
+        config = self.serve(SlowPool(1.5))
+        self.assertEqual(hostpool.request_host(config, 'alice', timeout=1.0), "HostBot_alice")
+
+    def test_no_reply_is_an_error_not_a_missing_pool(self):
+        config = self.serve(SlowPool(2.0))
+        self.assertRaises(hostpool.PoolError, hostpool.request_host, config, 'alice', 1.0, 0.3)
+
+    def test_refusal_is_an_error(self):
+        pool = new_pool(connect_after=None)
+        pool.connect_timeout = 0.1
+        config = self.serve(pool)
+        self.assertRaises(hostpool.PoolError, hostpool.request_host, config, 'alice')
+
+
+class AssignTest(unittest.TestCase):
+    def test_cold_connect_past_the_deadline_is_refused(self):
+        pool = new_pool(connect_after=None)  # Never connects
+        pool.connect_timeout = 0.1
+        self.assertRaises(ServerConnectionError, pool.assign, 'alice')
+        host = pool.spawned_hosts[0]
+        self.assertEqual(host.owners, [])
+        self.assertFalse(host.reconnector.enabled)
+        self.assertEqual(pool.assigned, {})
+
+    def test_concurrent_requests_for_one_owner_share_a_host(self):
+        pool = new_pool(connect_after=0.3)
+        nicks = []
+        threads = [threading.Thread(target=lambda: nicks.append(pool.assign('alice'))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(nicks, ["HostBot_alice"] * 3)
+        self.assertEqual(len(pool.spawned_hosts), 1)
+        self.assertEqual(pool.spawned_hosts[0].owners, ['alice'])
+
+    def test_owner_is_taken_on_the_reactor_before_ok(self):
+        pool = new_pool(connect_after=0)
+        self.assertEqual(pool.assign('alice'), "HostBot_alice")
+        host = pool.spawned_hosts[0]
+        self.assertEqual(host.owners, ['alice'])  # Already applied when assign returns
+        self.assertIsNot(host.assign_thread, threading.current_thread())
+        self.assertEqual(host.connection.get_nickname(), "HostBot_alice")
+
+    def test_stalled_reactor_is_refused(self):
+        pool = new_pool(connect_after=0)
+        pool.owner_timeout = 0.1
+        pool.spawn = lambda: stalled
+        stalled = FakeHost(0)
+        stalled.reactor.scheduler.stalled = True
+        self.assertRaises(ServerConnectionError, pool.assign, 'alice')
+        self.assertEqual(pool.assigned, {})
+        self.assertFalse(stalled.reconnector.enabled)
+        # The disconnect is queued behind the assign, should the reactor come back
+        for fn in stalled.reactor.scheduler.held:
+            fn()
+        self.assertEqual(stalled.owners, ['alice'])
+        self.assertFalse(stalled.connection.is_connected())
+
+    def test_release_closes_the_game(self):
+        pool = new_pool(connect_after=0)
+        pool.assign('alice')
+        host = pool.spawned_hosts[0]
+        pool.release('alice')
+        self.assertFalse(host.running)
+        self.assertEqual(pool.assigned, {})
+        pool.release('alice')  # Releasing twice is harmless
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_makemove.py - make_move()/unmake_move() put a game back exactly
+
+import os
+import random
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from support import seated_game
+
+import snapshot
+from bot import legal_moves
+from player import new_hand
+
+NICKS = ('alice', 'bob', 'carol')
+
+
+def fingerprint(game):
+    """Everything make/unmake must restore, beyond what a snapshot holds."""
+    board = game.board
+    return (snapshot.dumps(game),
+            sorted(game.ready_players), list(game.turn_order), list(game.pending_rolls),
+            dict(board.node_owners), dict(board.hexmap.road_owners),
+            dict((c, dict(o)) for c, o in board.tile_buildings.items()),
+            dict((n, (p.victory_points, p.has_longest_road, p.longest_road_length, list(p.resources)))
+                 for n, p in game.players.items()),
+            sorted((o.seq, o.nick) + o.terms() for mine in game.trades.by_nick.values() for o in mine),
+            game.trades.seq, game.rng.dice_drawn)
+
+
+def random_move(game, rng):
+    """A random command from the player whose move it is, or an offer from anyone."""
+    if game.state == 'awaiting_ready':
+        return rng.choice(NICKS), "!ready"
+    nick = game.current_player()
+    offers = [o for mine in game.trades.by_nick.values() for o in mine]
+    if game.state == 'awaiting_actions' and offers and rng.random() < 0.3:
+        offer = rng.choice(offers)  # Take it up: the player on turn, or anyone if it is theirs
+        taker = nick if offer.nick != nick else rng.choice([n for n in NICKS if n != nick])
+        return taker, "!trade {} {} {} {}".format(offer.want_n, offer.want, offer.give_n, offer.give)
+    if game.state == 'awaiting_actions' and rng.random() < 0.3:
+        other = rng.choice(NICKS)
+        give, want = rng.sample(['brick', 'lumber', 'wool', 'grain', 'ore'], 2)
+        return other, "!trade {} {} {} {}".format(rng.randint(1, 2), give, rng.randint(1, 2), want)
+    return nick, rng.choice(legal_moves(game, nick))
+
+
+class MakeUnmakeTest(unittest.TestCase):
+    def new_game(self, seed):
+        game = seated_game(NICKS, seed)
+        game.pending_rolls = [6, 8, 7]
+        return game
+
+    def test_each_move_unmakes_exactly(self):
+        for seed in range(3):
+            game = self.new_game(seed)
+            rng = random.Random(seed)
+            for _ in range(300):
+                if game.state == 'awaiting_actions':
+                    game.players[game.current_player()].resources = new_hand(
+                        [rng.randint(0, 6) for _ in range(5)])
+                before = fingerprint(game)
+                nick, msg = random_move(game, rng)
+                responses, undo = game.make_move(nick, msg)
+                after = fingerprint(game)
+                game.unmake_move(undo)
+                self.assertEqual(fingerprint(game), before, msg)
+                self.assertEqual(game.handle_command(nick, msg), responses, msg)  # Replays the same
+                self.assertEqual(fingerprint(game), after, msg)
+
+    def test_deep_unwind(self):
+        for seed in range(3):
+            game = self.new_game(seed)
+            rng = random.Random(100 + seed)
+            start = fingerprint(game)
+            undo = []
+            for _ in range(400):
+                nick, msg = random_move(game, rng)
+                undo.append(game.make_move(nick, msg)[1])
+            self.assertNotEqual(fingerprint(game), start)
+            while undo:
+                game.unmake_move(undo.pop())
+            self.assertEqual(fingerprint(game), start)
+
+    def test_checksum_follows_unmake(self):
+        game = self.new_game(4)
+        for nick in NICKS:
+            game.handle_command(nick, "!ready")
+        crc = snapshot.checksum(game)
+        _, undo = game.make_move(game.current_player(), "!roll")
+        self.assertNotEqual(snapshot.checksum(game), crc)
+        game.unmake_move(undo)
+        self.assertEqual(snapshot.checksum(game), crc)
+
+
+if __name__ == '__main__':
+    unittest.main()
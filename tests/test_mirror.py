@@ -0,0 +1,238 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_mirror.py - Client mirrors following a host through deltas, resyncs
+# and catch-ups
+
+import random
+import unittest
+
+from support import Event, join_game, new_host
+
+import snapshot
+from bot import legal_moves
+from mirror import CATCHUP_MAX_DELTAS, CATCHUP_VERB, DELTA_VERB, RESYNC_VERB, STATE_VERB, GameMirror
+
+
+class Client(object):
+    """A GameMirror fed from what the host sent, as client.py does."""
+
+    def __init__(self, host, nick):
+        self.host = host
+        self.nick = nick
+        self.mirror = GameMirror(host.connection.nick)
+        self.seen = 0  # Index into host.connection.sent
+        self.online = True
+        self.received = []
+
+    def ask(self, line):
+        self.host.on_privmsg(None, Event('{0}!{0}@h'.format(self.nick), self.host.connection.nick, line))
+
+    def pump(self):
+        """Handle whatever the host sent since the last pump."""
+        sent = self.host.connection.sent
+        while self.seen < len(sent):
+            _, kind, target, line = sent[self.seen]
+            self.seen += 1
+            if not self.online:
+                continue
+            mirror = self.mirror
+            if kind == 'privmsg' and target == self.host.game_channel and line.startswith(DELTA_VERB + " "):
+                resync = mirror.handle_delta(line)
+            elif kind == 'notice' and target == self.nick:
+                self.received.append(line)
+                if line.startswith(STATE_VERB + " "):
+                    resync = mirror.handle_state(line)
+                elif line.startswith(DELTA_VERB + " "):
+                    resync = mirror.handle_delta(line)
+                elif line.startswith(CATCHUP_VERB + " "):
+                    resync = mirror.handle_catchup(line)
+                else:
+                    continue
+            else:
+                continue
+            if resync:
+                self.ask("!resync")
+
+    def in_step(self):
+        game = self.host.game
+        return (self.mirror.game is not None and self.mirror.game.version == game.version
+                and snapshot.checksum(self.mirror.game) == snapshot.checksum(game))
+
+
+class MirrorTest(unittest.TestCase):
+    def setUp(self):
+        self.host, self.scheduler, self.connection = new_host()
+        self.client = Client(self.host, 'alice')
+        self.resyncs = 0
+        ask = self.client.ask
+
+        def counting(line):
+            if line == RESYNC_VERB:
+                self.resyncs += 1
+            ask(line)
+        self.client.ask = counting
+        self.rng = random.Random(3)
+
+    def say(self, nick, msg):
+        if msg is None:
+            join_game(self.host, nick)
+        else:
+            self.host.on_pubmsg(None, Event('{0}!{0}@h'.format(nick), self.host.game_channel, msg))
+
+    def settle(self):
+        for _ in range(3):
+            self.scheduler.run_all()
+            self.client.pump()
+
+    def step(self):
+        """One random command with an effect, from whoever may send it."""
+        game = self.host.game
+        if not game.game_active:
+            for nick in sorted(game.players):
+                self.say(nick, "!ready")
+            return
+        nick = game.current_player()
+        self.say(nick, self.rng.choice(legal_moves(game, nick)))
+
+    def test_follows_every_delta(self):
+        for nick in ('alice', 'bob', 'carol'):
+            self.say(nick, None)
+        self.settle()  # The first delta finds no replica: one resync
+        self.assertEqual(self.resyncs, 1)
+        self.assertTrue(self.client.in_step())
+        builds = 0
+        for _ in range(300):
+            self.step()
+            self.client.pump()
+            self.assertTrue(self.client.in_step(), self.host.game.version)
+            builds += self.connection.sent[-1][3].count(" B:")
+        self.assertEqual(self.resyncs, 1)  # Nothing but deltas after the first sync
+        self.assertTrue(builds)
+
+    def test_recovers_from_a_lost_delta(self):
+        for nick in ('alice', 'bob'):
+            self.say(nick, None)
+        self.settle()
+        for nick in ('alice', 'bob'):
+            self.say(nick, "!ready")
+        self.client.pump()
+        self.client.online = False
+        self.step()
+        self.client.pump()
+        self.client.online = True
+        self.step()  # Version gap: the mirror asks for the state
+        self.client.pump()
+        self.step()  # Arrives while the resync is outstanding and is kept
+        self.settle()
+        self.assertEqual(self.resyncs, 2)
+        self.assertTrue(self.client.in_step())
+
+    def test_recovers_from_a_diverged_replica(self):
+        for nick in ('alice', 'bob'):
+            self.say(nick, None)
+        self.settle()
+        self.client.mirror.game.players['bob'].resources[0] += 1  # Drifted without a version gap
+        self.say('alice', "!ready")
+        self.settle()
+        self.assertEqual(self.resyncs, 2)
+        self.assertTrue(self.client.in_step())
+
+    def test_bad_op_resyncs(self):
+        self.say('alice', None)
+        self.settle()
+        game = self.host.game
+        line = " ".join([DELTA_VERB, str(game.version + 1), snapshot.checksum(game), "Q:nonsense"])
+        self.assertTrue(self.client.mirror.handle_delta(line))
+
+
+class CatchupTest(unittest.TestCase):
+    def setUp(self):
+        self.host, self.scheduler, self.connection = new_host()
+        self.say('alice', None)
+        self.say('bob', None)
+        self.client = Client(self.host, 'alice')
+        self.client.ask("!resync")
+        self.settle()
+        self.assertTrue(self.client.in_step())
+
+    def say(self, nick, msg):
+        """nick joins (msg None) or speaks in the game channel."""
+        if msg is None:
+            join_game(self.host, nick)
+        else:
+            self.host.on_pubmsg(None, Event('{0}!{0}@h'.format(nick), self.host.game_channel, msg))
+
+    def settle(self):
+        self.scheduler.run_all()
+        self.client.pump()
+        self.scheduler.run_all()
+        self.client.pump()
+
+    def play(self, changes):
+        """Make changes versions of chatter-free game traffic."""
+        start = self.host.game.version
+        self.say('alice', "!ready")
+        self.say('bob', "!ready")
+        while self.host.game.version - start < changes:
+            nick = self.host.game.current_player()
+            self.say(nick, {'awaiting_roll': "!roll", 'awaiting_robber_move': "!robber 0,0,0"}
+                     .get(self.host.game.state, "!pass"))
+
+    def reconnect(self, changes):
+        self.client.pump()
+        self.client.online = False
+        self.play(changes)
+        self.client.pump()
+        self.client.online = True
+        del self.client.received[:]
+        self.client.ask(self.client.mirror.catchup_request())
+        self.settle()
+
+    def test_a_few_missed_deltas_are_replayed(self):
+        self.reconnect(5)
+        self.assertTrue(self.client.in_step())
+        kinds = [line.split()[0] for line in self.client.received]
+        self.assertEqual(kinds[-1], CATCHUP_VERB)
+        self.assertEqual(kinds, [DELTA_VERB] * 5 + [CATCHUP_VERB])
+
+    def test_far_behind_gets_the_state(self):
+        self.reconnect(CATCHUP_MAX_DELTAS + 10)
+        self.assertTrue(self.client.in_step())
+        kinds = [line.split()[0] for line in self.client.received]
+        self.assertNotIn(DELTA_VERB, kinds)
+        self.assertEqual(kinds, [STATE_VERB] * (len(kinds) - 1) + [CATCHUP_VERB])
+
+    def test_catchup_flood_is_coalesced_and_paced(self):
+        self.client.pump()
+        self.client.online = False
+        self.play(10)
+        self.client.pump()
+        self.client.online = True
+        request = self.client.mirror.catchup_request()
+        for _ in range(100):
+            self.client.ask(request)
+        self.assertEqual(len(self.host.outbox), 1)
+        self.settle()
+        self.assertTrue(self.client.in_step())
+        replies = [(t, line) for t, kind, target, line in self.connection.sent if target == 'alice']
+        self.assertEqual(len([l for _, l in replies if l.startswith(CATCHUP_VERB)]), 1)
+        times = [t for t, _ in replies]
+        self.assertTrue(all(b - a >= self.host.outbox.line_interval for a, b in zip(times, times[1:])))
+
+    def test_live_deltas_during_the_reply_are_kept(self):
+        self.client.pump()
+        self.client.online = False
+        self.play(CATCHUP_MAX_DELTAS + 5)
+        self.client.pump()
+        self.client.online = True
+        self.client.ask(self.client.mirror.catchup_request())
+        self.scheduler.run_until(self.scheduler.now + 0.1)  # The first state line is out
+        self.client.pump()
+        self.play(3)  # Live deltas overtake the rest of the reply
+        self.settle()
+        self.assertTrue(self.client.in_step())
+
+
+if __name__ == '__main__':
+    unittest.main()
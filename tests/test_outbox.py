@@ -0,0 +1,154 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_outbox.py - Paced replies, and the host's !resync and !stats going through them
+
+import unittest
+
+from support import Event, ManualScheduler, new_host, seated_game, started_game
+
+import snapshot
+from mirror import RESYNC_VERB, STATE_VERB
+from host import STATS_VERB
+from outbox import Outbox
+
+
+class OutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = ManualScheduler()
+        self.sent = []
+        self.outbox = Outbox(lambda nick, line: self.sent.append((self.scheduler.now, nick, line)),
+                             self.scheduler.schedule, line_interval=0.5)
+
+    def test_lines_are_paced_across_nicks(self):
+        self.outbox.request('a', 'x', lambda: ['a1', 'a2', 'a3'])
+        self.outbox.request('b', 'x', lambda: ['b1'])
+        self.scheduler.run_all()
+        self.assertEqual([line for _, _, line in self.sent], ['a1', 'a2', 'a3', 'b1'])
+        times = [t for t, _, _ in self.sent]
+        self.assertEqual(times, [0.0, 0.5, 1.0, 1.5])
+
+    def test_repeats_are_coalesced_while_waiting(self):
+        made = []
+
+        def lines():
+            made.append(1)
+            return ['s']
+        self.outbox.request('a', 'x', lambda: ['first'] * 4)
+        for _ in range(50):
+            self.outbox.request('b', 'x', lines)
+        self.assertEqual(len(self.outbox), 2)
+        self.scheduler.run_all()
+        self.assertEqual(len(made), 1)
+        self.assertEqual(len(self.sent), 5)
+
+    def test_lines_are_made_when_the_reply_starts(self):
+        state = ['old']
+        self.outbox.request('a', 'x', lambda: ['a'] * 3)
+        self.outbox.request('b', 'x', lambda: list(state))
+        self.scheduler.run_until(0.1)
+        state[0] = 'new'
+        self.scheduler.run_all()
+        self.assertEqual(self.sent[-1][2], 'new')
+
+    def test_idle_outbox_sends_at_once(self):
+        self.outbox.request('a', 'x', lambda: ['1'])
+        self.scheduler.run_until(100)
+        self.outbox.request('a', 'x', lambda: ['2'])
+        self.scheduler.run_until(100)
+        self.assertEqual([(t, line) for t, _, line in self.sent], [(0.0, '1'), (100.0, '2')])
+
+
+class HostResyncTest(unittest.TestCase):
+    def test_resync_flood_is_paced_and_coalesced(self):
+        host, scheduler, connection = new_host()
+        for nick in ('alice', 'bob'):
+            host.game.add_player(nick)
+        for _ in range(100):
+            host.on_privmsg(None, Event('mallory!m@h', host.connection.nick, RESYNC_VERB))
+        self.assertEqual(connection.sent, [])  # Nothing goes out inside the handler
+        scheduler.run_all()
+        lines = connection.to('mallory')
+        self.assertTrue(lines and all(l.startswith(STATE_VERB + " ") for l in lines))
+        parts = int(lines[0].split()[2].split("/")[1])
+        self.assertEqual(len(lines), parts)  # One state, not a hundred
+        times = [t for t, _, _, _ in connection.sent]
+        self.assertTrue(all(b - a >= host.outbox.line_interval for a, b in zip(times, times[1:])))
+
+
+class HostStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.host, self.scheduler, self.connection = new_host('owner')
+
+    def stats(self, nick, public=False):
+        source = '{0}!{0}@h'.format(nick)
+        if public:
+            self.host.on_pubmsg(None, Event(source, self.host.game_channel, STATS_VERB))
+        else:
+            self.host.on_privmsg(None, Event(source, self.connection.nick, STATS_VERB))
+
+    def test_only_the_owner_is_answered(self):
+        self.stats('mallory')
+        self.stats('mallory', public=True)
+        self.scheduler.run_all()
+        self.assertEqual(self.connection.sent, [])
+        self.stats('owner', public=True)
+        self.scheduler.run_all()
+        lines = self.connection.to('owner')
+        self.assertTrue(lines and all(l.startswith(STATS_VERB + " ") for l in lines))
+
+    def test_once_per_interval_and_paced(self):
+        for _ in range(20):
+            self.stats('owner')
+        self.scheduler.run_all()
+        first = list(self.connection.sent)
+        self.assertTrue(first)
+        self.assertEqual(len(first), len(self.host.stats_lines()))
+        times = [t for t, _, _, _ in first]
+        self.assertTrue(all(b - a >= self.host.outbox.line_interval for a, b in zip(times, times[1:])))
+        self.scheduler.run_until(self.host.stats_interval - 1)
+        self.stats('owner')
+        self.scheduler.run_all()
+        self.assertEqual(len(self.connection.sent), len(first))
+        self.scheduler.run_until(self.host.stats_interval)
+        self.stats('owner')
+        self.scheduler.run_all()
+        self.assertGreater(len(self.connection.sent), len(first))
+
+
+class ChecksumTest(unittest.TestCase):
+    def test_serialized_once_per_version(self):
+        game = seated_game(('a',), seed=1)
+        calls = []
+        dumps = snapshot.dumps
+
+        def counting(*args, **kwargs):
+            calls.append(1)
+            return dumps(*args, **kwargs)
+        snapshot.dumps = counting
+        try:
+            crc = snapshot.checksum(game)
+            self.assertEqual(snapshot.checksum(game), crc)
+            snapshot.canonical(game)
+            self.assertEqual(len(calls), 1)
+            game.add_player('b')
+            self.assertNotEqual(snapshot.checksum(game), crc)
+            self.assertEqual(len(calls), 2)
+        finally:
+            snapshot.dumps = dumps
+
+    def test_make_and_unmake_drop_the_cache(self):
+        game = started_game(('a', 'b'), seed=2, state=None)
+        before = snapshot.checksum(game)
+        _, undo = game.make_move('a', '!roll')
+        after_roll = snapshot.checksum(game)
+        game.unmake_move(undo)
+        self.assertEqual(snapshot.checksum(game), before)
+        _, undo = game.make_move('a', '!trade 1 brick 1 ore')  # Same version, different state
+        self.assertNotEqual(snapshot.checksum(game), after_roll)
+        self.assertEqual(snapshot.checksum(game), "%08x" % (
+            __import__('zlib').crc32(snapshot.dumps(game, rng=False)) & 0xffffffff))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_player.py - The shared Player record: hands, costs and id-indexed pieces
+
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from distance import adjacency
+from game import BUILD_COST_ITEMS, BUILD_COSTS, new_game
+from player import RESOURCE_INDEX, RESOURCE_TYPES, Player, cost_items, new_hand
+
+
+class HandTest(unittest.TestCase):
+    def test_record_is_slotted(self):
+        p = Player('alice', 1)
+        self.assertFalse(hasattr(p, '__dict__'))
+        self.assertRaises(AttributeError, setattr, p, 'gold', 1)
+
+    def test_costs_as_indices(self):
+        for piece, cost in BUILD_COSTS.items():
+            self.assertEqual(dict((RESOURCE_TYPES[i], n) for i, n in BUILD_COST_ITEMS[piece]), cost)
+        self.assertEqual(cost_items({'ore': 3, 'brick': 1}), ((RESOURCE_INDEX['brick'], 1), (RESOURCE_INDEX['ore'], 3)))
+
+    def test_can_afford(self):
+        p = Player('alice')
+        self.assertEqual(list(p.resources), [0] * len(RESOURCE_TYPES))
+        city = BUILD_COST_ITEMS['city']
+        self.assertFalse(p.can_afford(city))
+        p.resources = new_hand([0, 0, 0, 2, 3])
+        self.assertTrue(p.can_afford(city))
+        self.assertFalse(p.can_afford(BUILD_COST_ITEMS['road']))
+        self.assertEqual(p.hand_size(), 5)
+
+
+class SharedRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.game = new_game(radius=4, seed=1)
+        for nick in ('alice', 'bob'):
+            self.game.add_player(nick)
+        self.alice = self.game.players['alice']
+
+    def test_game_and_board_share_it(self):
+        self.assertIs(self.game.board.players[self.alice.id], self.alice)
+        self.game.place_piece(self.alice, 'settlement', 7)
+        self.assertEqual(self.alice.settlements, set([7]))
+        self.assertEqual(self.game.board.node_owners[7], self.alice.id)
+
+    def test_pieces_are_topology_ids(self):
+        hexmap = self.game.board.hexmap
+        topology = hexmap.topology
+        edge_nodes, node_edges = adjacency(hexmap)
+        node = topology.node_id(1, -1, 2)
+        self.game.place_piece(self.alice, 'settlement', node)
+        for edge_id in node_edges[node]:
+            self.game.place_piece(self.alice, 'road', edge_id)
+        self.game.place_piece(self.alice, 'city', node)
+        self.assertEqual(self.alice.cities, set([node]))
+        for edge_id in self.alice.roads:
+            coord, idx = topology.edge_tile(edge_id)
+            self.assertEqual(hexmap.tiles[coord].edges[idx], edge_id)
+            self.assertEqual(topology.edge_id(coord[0], coord[1], idx), edge_id)
+            self.assertIn(node, topology.edge_nodes(edge_id))
+        coord, corner = topology.node_tile(node)
+        self.assertEqual(hexmap.tiles[coord].nodes[corner], node)
+
+
+if __name__ == '__main__':
+    unittest.main()
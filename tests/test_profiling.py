@@ -0,0 +1,110 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_profiling.py - Resolving targets and profiling only inside them
+
+import ConfigParser
+import atexit
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+import types
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import profiling
+
+
+class Handler(object):
+    def handle(self, n):
+        return [n] * n
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    return seconds
+
+
+def target_module():
+    """A module "proftarget" with busy() and Handler.handle as targets."""
+    module = types.ModuleType('proftarget')
+    module.busy = busy
+    module.Handler = type('Handler', (Handler,), {'handle': Handler.__dict__['handle']})
+    return module
+
+
+def profiling_config(mode, targets):
+    config = ConfigParser.ConfigParser()
+    config.add_section('profiling')
+    config.set('profiling', 'mode', mode)
+    config.set('profiling', 'targets', targets)
+    config.set('profiling', 'interval', '0.002')
+    config.set('profiling', 'flush_interval', '3600')
+    return config
+
+
+class ProfilingTest(unittest.TestCase):
+    def setUp(self):
+        self.module = sys.modules['proftarget'] = target_module()
+        self.addCleanup(sys.modules.pop, 'proftarget')
+        self.directory = tempfile.mkdtemp(prefix='catan-profile-')
+        # install() writes the profile again at exit; handlers run last in, first out
+        atexit.register(shutil.rmtree, self.directory, True)
+
+    def install(self, mode):
+        return profiling.install(profiling_config(mode, "proftarget.busy, proftarget.Handler.handle"),
+                                 'test', self.directory)
+
+    def test_resolve(self):
+        owner, name, func = profiling.resolve("proftarget.Handler.handle")
+        self.assertEqual((owner, name, func), (self.module.Handler, 'handle', Handler.__dict__['handle']))
+        self.assertEqual(profiling.resolve("proftarget.busy"), (self.module, 'busy', busy))
+        self.assertRaises(ValueError, profiling.resolve, "proftarget")
+        self.assertRaises(ValueError, profiling.resolve, "proftarget.a.b.c")
+
+    def test_off_leaves_targets_alone(self):
+        self.assertIsNone(self.install('off'))
+        self.assertIs(self.module.busy, busy)
+        self.assertRaises(ValueError, self.install, 'gprof')
+
+    def test_cprofile_times_wrapped_targets(self):
+        profiler = self.install('cprofile')
+        self.assertIsNot(self.module.busy, busy)
+        self.assertEqual(self.module.busy.__name__, 'busy')
+        self.assertEqual(self.module.Handler().handle(3), [3, 3, 3])  # Still returns its result
+        self.assertEqual(self.module.busy(0.01), 0.01)
+        profiler.write()
+        stats = pstats.Stats(profiler.path).stats
+        names = set(name for _, _, name in stats)
+        self.assertTrue(set(['busy', 'handle']) <= names, names)
+        self.assertEqual(profiler.depth.values(), [0])
+
+    def test_sample_counts_stacks_inside_targets(self):
+        profiler = self.install('sample')
+        self.assertEqual(self.module.busy(0.1), 0.1)
+        profiler.write()
+        with open(profiler.path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, n = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("test_profiling.py:busy"), stack)
+            self.assertGreater(int(n), 0)
+        self.assertEqual(profiler.active, {})
+
+    def test_exception_leaves_the_target(self):
+        profiler = self.install('sample')
+        self.assertRaises(TypeError, self.module.busy)
+        self.assertEqual((profiler.active, profiler.depth.values()), ({}, [0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_rules.py - Placement, costs and production in GameState
+
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from support import seated_game, started_game
+
+from distance import adjacency
+from game import BUILD_COST_ITEMS, STARTING_ITEMS
+from player import RESOURCE_INDEX, new_hand
+
+
+def neighbours(game, node):
+    edge_nodes, node_edges = adjacency(game.board.hexmap)
+    return [n for e in node_edges[node] for n in edge_nodes[e] if n != node]
+
+
+def build(game, nick, piece, location):
+    """!build piece for nick on nick's turn with cards to spare."""
+    game.current_turn_index = game.turn_order.index(nick)
+    game.players[nick].resources = new_hand([9] * 5)
+    return game.handle_command(nick, "!build {} {}".format(piece, location))
+
+
+class PlacementTest(unittest.TestCase):
+    def setUp(self):
+        self.game = started_game()
+        self.alice = self.game.players['alice']
+        self.bob = self.game.players['bob']
+        self.edge_nodes, self.node_edges = adjacency(self.game.board.hexmap)
+
+    def test_distance_rule(self):
+        self.assertEqual(build(self.game, 'alice', 'settlement', 20), ["!built alice settlement 20"])
+        self.assertFalse(self.game.can_place(self.alice, 'settlement', 20))
+        for node in neighbours(self.game, 20):
+            self.assertFalse(self.game.can_place(self.alice, 'settlement', node))
+            self.assertFalse(self.game.can_place(self.bob, 'settlement', node))
+        two_away = [n for m in neighbours(self.game, 20) for n in neighbours(self.game, m) if n != 20]
+        self.assertTrue(self.game.can_place(self.bob, 'settlement', two_away[0]))
+
+    def test_settlements_need_a_road_after_setup(self):
+        build(self.game, 'alice', 'settlement', 0)
+        far = max(self.node_edges)
+        self.assertEqual(build(self.game, 'alice', 'settlement', far), ["!built alice settlement {}".format(far)])
+        target = [n for m in neighbours(self.game, 0) for n in neighbours(self.game, m)
+                  if n != 0 and self.game.can_place(self.bob, 'settlement', n)][0]
+        self.assertFalse(self.game.can_place(self.alice, 'settlement', target))
+        self.assertEqual(build(self.game, 'alice', 'settlement', target),
+                         ["!invalid-build settlement {}".format(target)])
+        middle = [m for m in neighbours(self.game, 0) if target in neighbours(self.game, m)][0]
+        for a, b in ((0, middle), (middle, target)):
+            edge = [e for e in self.node_edges[a] if b in self.edge_nodes[e]][0]
+            self.assertEqual(build(self.game, 'alice', 'road', edge), ["!built alice road {}".format(edge)])
+        self.assertTrue(self.game.can_place(self.alice, 'settlement', target))
+
+    def test_roads_must_connect(self):
+        build(self.game, 'alice', 'settlement', 20)
+        own = self.node_edges[20][0]
+        loose = [e for e in sorted(self.edge_nodes) if not set(self.edge_nodes[e]) & set([20])
+                 and not set(self.edge_nodes[e]) & set(self.edge_nodes[own])][0]
+        self.assertFalse(self.game.can_place(self.alice, 'road', loose))
+        self.assertTrue(self.game.can_place(self.alice, 'road', own))
+        self.assertFalse(self.game.can_place(self.bob, 'road', own))
+        build(self.game, 'alice', 'road', own)
+        self.assertFalse(self.game.can_place(self.alice, 'road', own))
+        far_end = [n for n in self.edge_nodes[own] if n != 20][0]
+        onward = [e for e in self.node_edges[far_end] if e != own]
+        self.assertTrue(all(self.game.can_place(self.alice, 'road', e) for e in onward))
+
+    def test_opponent_building_cuts_a_road(self):
+        build(self.game, 'alice', 'settlement', 20)
+        own = self.node_edges[20][0]
+        build(self.game, 'alice', 'road', own)
+        far_end = [n for n in self.edge_nodes[own] if n != 20][0]
+        self.game.board.build_settlement(self.bob.id, far_end)  # Beside alice's settlement, so only directly
+        onward = [e for e in self.node_edges[far_end] if e != own]
+        self.assertFalse(any(self.game.can_place(self.alice, 'road', e) for e in onward))
+        self.assertTrue(all(self.game.can_place(self.bob, 'road', e) for e in onward))
+
+    def test_cities_replace_own_settlements(self):
+        build(self.game, 'alice', 'settlement', 20)
+        self.assertFalse(self.game.can_place(self.bob, 'city', 20))
+        self.assertFalse(self.game.can_place(self.alice, 'city', 21))
+        self.assertEqual(build(self.game, 'alice', 'city', 20), ["!built alice city 20"])
+        self.assertFalse(self.game.can_place(self.alice, 'city', 20))
+        self.assertEqual(self.alice.victory_points, 2)
+
+    def test_bad_locations(self):
+        for piece in ('road', 'settlement', 'city'):
+            for location in (-1, 10 ** 6):
+                self.assertFalse(self.game.can_place(self.alice, piece, location))
+
+
+class CostTest(unittest.TestCase):
+    def test_starting_hand_and_charges(self):
+        game = started_game()
+        alice = game.players['alice']
+        start = new_hand()
+        for r, n in STARTING_ITEMS:
+            start[r] += n
+        self.assertEqual(alice.resources, start)
+        self.assertEqual(game.handle_command('alice', "!build settlement 20"), ["!built alice settlement 20"])
+        road = adjacency(game.board.hexmap)[1][20][0]
+        self.assertEqual(game.handle_command('alice', "!build road {}".format(road)),
+                         ["!built alice road {}".format(road)])
+        for r, n in BUILD_COST_ITEMS['settlement'] + BUILD_COST_ITEMS['road']:
+            start[r] -= n
+        self.assertEqual(alice.resources, start)
+
+    def test_cannot_afford(self):
+        game = started_game()
+        game.players['alice'].resources = new_hand()
+        self.assertEqual(game.handle_command('alice', "!build settlement 20"), ["!cannot-afford settlement"])
+        self.assertNotIn(20, game.board.node_owners)
+
+
+class ProductionTest(unittest.TestCase):
+    def test_settlements_and_cities_are_paid(self):
+        game = started_game()
+        dice, tiles = sorted((d, t) for d, t in game.number_tiles.items() if d != 7)[0]
+        tile = tiles[0]
+        coord = (tile.x, tile.y, tile.z)
+        resource = RESOURCE_INDEX[game.tile_resources[coord]]
+        build(game, 'alice', 'settlement', tile.nodes[0])
+        build(game, 'bob', 'settlement', tile.nodes[3])
+        build(game, 'bob', 'city', tile.nodes[3])
+        alice, bob = game.players['alice'], game.players['bob']
+        before = alice.resources[resource], bob.resources[resource]
+        game.distribute_resources(dice)
+        paid = (sum(t.nodes.count(tile.nodes[0]) for t in tiles),
+                2 * sum(t.nodes.count(tile.nodes[3]) for t in tiles))
+        self.assertEqual((alice.resources[resource] - before[0], bob.resources[resource] - before[1]), paid)
+
+    def test_robber_blocks_its_tile(self):
+        game = started_game()
+        dice, tiles = sorted((d, t) for d, t in game.number_tiles.items() if len(t) == 1)[0]
+        tile = tiles[0]
+        build(game, 'alice', 'settlement', tile.nodes[0])
+        game.robber_tile = "{},{},{}".format(tile.x, tile.y, tile.z)
+        before = list(game.players['alice'].resources)
+        game.distribute_resources(dice)
+        self.assertEqual(list(game.players['alice'].resources), before)
+
+
+class ReadyTest(unittest.TestCase):
+    def test_ready_twice_does_not_restart(self):
+        game = seated_game()
+        game.handle_command('alice', "!ready")
+        self.assertEqual(game.handle_command('bob', "!ready")[1], "!game-start")
+        game.handle_command('alice', "!roll")
+        state, hands = game.state, [list(p.resources) for _, p in sorted(game.players.items())]
+        for nick in ('alice', 'bob'):
+            self.assertEqual(game.handle_command(nick, "!ready"), ["!already-started"])
+        self.assertEqual((game.state, game.turn_order), (state, ['alice', 'bob']))
+        self.assertEqual([list(p.resources) for _, p in sorted(game.players.items())], hands)
+
+    def test_ready_does_not_leave_the_robber_move(self):
+        game = started_game()
+        game.state = 'awaiting_robber_move'
+        self.assertEqual(game.handle_command('bob', "!ready"), ["!already-started"])
+        self.assertEqual(game.state, 'awaiting_robber_move')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_scoring.py - Incremental victory points, the longest road bonus and
+# the win that follows
+
+import os
+import random
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from support import started_game
+
+import snapshot
+from bot import legal_moves
+from distance import adjacency
+from game import LONGEST_ROAD_POINTS, WINNING_POINTS
+from player import new_hand
+
+
+def command(game, nick, msg):
+    """msg from nick on nick's turn, with cards to spare."""
+    game.current_turn_index = game.turn_order.index(nick)
+    game.state = 'awaiting_actions'
+    game.players[nick].resources = new_hand([20] * 5)
+    return game.handle_command(nick, msg)
+
+
+def road_path(game, start, length, avoid=()):
+    """Edges of a simple path of length roads from node start."""
+    edge_nodes, node_edges = adjacency(game.board.hexmap)
+    path, seen, node = [], set([start]) | set(avoid), start
+    while len(path) < length:
+        for edge_id in sorted(node_edges[node]):
+            other = [n for n in edge_nodes[edge_id] if n != node][0]
+            if other not in seen:
+                break
+        else:
+            raise AssertionError("no path of {} roads from {}".format(length, start))
+        path.append(edge_id)
+        seen.add(other)
+        node = other
+    return path, seen
+
+
+def build_roads(game, nick, start, length, avoid=()):
+    """Settle start and run length roads from it; returns the nodes used."""
+    command(game, nick, "!build settlement {}".format(start))
+    path, nodes = road_path(game, start, length, avoid)
+    for edge_id in path:
+        responses = command(game, nick, "!build road {}".format(edge_id))
+        assert responses[0].startswith("!built"), responses
+    return nodes
+
+
+class LongestRoadTest(unittest.TestCase):
+    def setUp(self):
+        self.game = started_game()
+        self.alice = self.game.players['alice']
+        self.bob = self.game.players['bob']
+
+    def assertConsistent(self):
+        for p in self.game.players.values():
+            self.assertEqual(p.victory_points, p.count_victory_points(), p.nick)
+
+    def test_five_roads_score(self):
+        command(self.game, 'alice', "!build settlement 0")
+        path, _ = road_path(self.game, 0, 5)
+        for edge_id in path[:4]:
+            command(self.game, 'alice', "!build road {}".format(edge_id))
+        self.assertEqual(self.alice.victory_points, 1)
+        command(self.game, 'alice', "!build road {}".format(path[4]))
+        self.assertTrue(self.alice.has_longest_road)
+        self.assertEqual(self.alice.longest_road_length, 5)
+        self.assertEqual(self.alice.victory_points, 1 + LONGEST_ROAD_POINTS)
+        self.assertConsistent()
+
+    def test_bonus_moves_only_to_a_longer_road(self):
+        used = build_roads(self.game, 'alice', 0, 5)
+        far = max(adjacency(self.game.board.hexmap)[1])
+        build_roads(self.game, 'bob', far, 5, avoid=used)
+        self.assertTrue(self.alice.has_longest_road)  # A tie leaves it where it is
+        self.assertFalse(self.bob.has_longest_road)
+        _, nodes = road_path(self.game, far, 5, avoid=used)
+        edge_nodes, node_edges = adjacency(self.game.board.hexmap)
+        end = [n for n in nodes if n not in used and n != far and
+               len([e for e in node_edges[n] if e in self.bob.roads]) == 1][0]
+        onward = [e for e in node_edges[end] if e not in self.bob.roads and
+                  not set(edge_nodes[e]) & (used | set(self.game.board.node_owners))]
+        command(self.game, 'bob', "!build road {}".format(onward[0]))
+        self.assertEqual(self.bob.longest_road_length, 6)
+        self.assertTrue(self.bob.has_longest_road)
+        self.assertFalse(self.alice.has_longest_road)
+        self.assertEqual(self.alice.victory_points, 1)
+        self.assertEqual(self.bob.victory_points, 1 + LONGEST_ROAD_POINTS)
+        self.assertConsistent()
+
+    def test_unmake_gives_the_bonus_back(self):
+        command(self.game, 'alice', "!build settlement 0")
+        path, _ = road_path(self.game, 0, 5)
+        for edge_id in path[:4]:
+            command(self.game, 'alice', "!build road {}".format(edge_id))
+        self.game.players['alice'].resources = new_hand([20] * 5)
+        before = snapshot.dumps(self.game)
+        _, undo = self.game.make_move('alice', "!build road {}".format(path[4]))
+        self.assertTrue(self.alice.has_longest_road)
+        self.game.unmake_move(undo)
+        self.assertFalse(self.alice.has_longest_road)
+        self.assertEqual(self.alice.longest_road_length, 0)  # Not measured below five roads
+        self.assertEqual(snapshot.dumps(self.game), before)
+        self.assertConsistent()
+
+    def test_longest_road_can_win(self):
+        build_roads(self.game, 'alice', 0, 4)
+        edge_nodes, node_edges = adjacency(self.game.board.hexmap)
+        owners = self.game.board.node_owners
+        for node in sorted(node_edges):
+            if self.alice.victory_points >= WINNING_POINTS - LONGEST_ROAD_POINTS:
+                break
+            if node not in owners and not any(n in owners for e in node_edges[node] for n in edge_nodes[e]):
+                self.game.place_piece(self.alice, 'settlement', node)  # Only the score matters here
+        self.assertEqual(self.alice.victory_points, WINNING_POINTS - LONGEST_ROAD_POINTS)
+        path, _ = road_path(self.game, 0, 5)
+        responses = command(self.game, 'alice', "!build road {}".format(path[4]))
+        self.assertEqual(responses[-1], "!winner alice")
+        self.assertEqual(self.game.check_winner(), 'alice')
+        self.assertFalse(self.game.game_active)
+        self.assertEqual(self.game.ready_players, set())  # Everyone readies again for the next game
+        self.assertEqual(self.game.take_deltas()[-1], "W:alice")
+
+    def test_loop_counts_every_road(self):
+        tile = self.game.board.hexmap.tiles[(0, 0, 0)]
+        command(self.game, 'alice', "!build settlement {}".format(tile.nodes[0]))
+        for edge_id in tile.edges:
+            command(self.game, 'alice', "!build road {}".format(edge_id))
+        self.assertEqual(self.alice.longest_road_length, 6)
+        self.assertTrue(self.alice.has_longest_road)
+        # A tail off the loop adds on: round the loop and out along it
+        tail, _ = road_path(self.game, tile.nodes[3], 2, avoid=tile.nodes)
+        for edge_id in tail:
+            command(self.game, 'alice', "!build road {}".format(edge_id))
+        self.assertEqual(self.alice.longest_road_length, 8)
+        self.assertConsistent()
+
+    def test_branch_counts_one_arm(self):
+        build_roads(self.game, 'alice', 0, 4)
+        path, nodes = road_path(self.game, 0, 4)
+        edge_nodes, node_edges = adjacency(self.game.board.hexmap)
+        middle = edge_nodes[path[1]][0] if edge_nodes[path[1]][0] in edge_nodes[path[2]] else edge_nodes[path[1]][1]
+        spur = [e for e in node_edges[middle] if e not in path][0]
+        command(self.game, 'alice', "!build road {}".format(spur))
+        self.assertEqual(len(self.alice.roads), 5)
+        self.assertEqual(self.alice.longest_road_length, 4)
+        self.assertFalse(self.alice.has_longest_road)
+
+    def test_settlement_cuts_a_road(self):
+        build_roads(self.game, 'alice', 0, 6)
+        path, _ = road_path(self.game, 0, 6)
+        edge_nodes = adjacency(self.game.board.hexmap)[0]
+        cut = (set(edge_nodes[path[2]]) & set(edge_nodes[path[3]])).pop()
+        self.assertTrue(self.alice.has_longest_road)
+        self.game.players['bob'].resources = new_hand([20] * 5)
+        self.game.current_turn_index = self.game.turn_order.index('bob')
+        before = snapshot.dumps(self.game)
+        responses, undo = self.game.make_move('bob', "!build settlement {}".format(cut))
+        self.assertEqual(responses, ["!built bob settlement {}".format(cut)])
+        self.assertEqual(self.alice.longest_road_length, 3)
+        self.assertFalse(self.alice.has_longest_road)  # Nobody has five now
+        self.assertEqual(self.alice.victory_points, 1)
+        self.assertConsistent()
+        self.game.unmake_move(undo)
+        self.assertEqual((self.alice.longest_road_length, self.alice.has_longest_road), (6, True))
+        self.assertEqual(snapshot.dumps(self.game), before)
+
+    def test_cut_hands_the_bonus_on(self):
+        used = build_roads(self.game, 'alice', 0, 6)
+        far = max(adjacency(self.game.board.hexmap)[1])
+        build_roads(self.game, 'bob', far, 5, avoid=used)
+        path, _ = road_path(self.game, 0, 6)
+        edge_nodes = adjacency(self.game.board.hexmap)[0]
+        cut = (set(edge_nodes[path[2]]) & set(edge_nodes[path[3]])).pop()
+        command(self.game, 'bob', "!build settlement {}".format(cut))
+        self.assertEqual(self.alice.longest_road_length, 3)
+        self.assertTrue(self.bob.has_longest_road)
+        self.assertEqual(self.bob.victory_points, 2 + LONGEST_ROAD_POINTS)
+        self.assertConsistent()
+
+    def test_snapshot_keeps_the_holder(self):
+        build_roads(self.game, 'alice', 0, 5)
+        copy = snapshot.loads(snapshot.dumps(self.game))
+        self.assertTrue(copy.players['alice'].has_longest_road)
+        self.assertEqual(copy.players['alice'].victory_points, self.alice.victory_points)
+
+
+class IncrementalScoreTest(unittest.TestCase):
+    def test_random_play_agrees_with_a_recount(self):
+        for seed in range(4):
+            game = started_game(('alice', 'bob', 'carol'), seed)
+            rng = random.Random(seed)
+            undo = []
+            for _ in range(400):
+                if not game.game_active:
+                    break
+                nick = game.current_player()
+                if game.state == 'awaiting_actions':
+                    game.players[nick].resources = new_hand([rng.randint(0, 8) for _ in range(5)])
+                responses, record = game.make_move(nick, rng.choice(legal_moves(game, nick)))
+                undo.append(record)
+                for p in game.players.values():
+                    self.assertEqual(p.victory_points, p.count_victory_points())
+                winner = game.check_winner()
+                if winner is not None:
+                    self.assertEqual(responses[-1], "!winner {}".format(winner))
+            self.assertEqual(len([p for p in game.players.values() if p.has_longest_road]) <= 1, True)
+            while undo:
+                game.unmake_move(undo.pop())
+            for p in game.players.values():
+                self.assertEqual((p.victory_points, p.has_longest_road, len(p.roads)), (0, False, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_snapshot.py - dumps()/loads() round trips and the format's limits
+
+import os
+import random
+import struct
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from support import seated_game, started_game
+
+import snapshot
+from bot import legal_moves
+from player import new_hand
+
+
+def played_game(seed, commands=60, players=('alice', 'bob', 'carol')):
+    """A game some way into random legal play, with builds and open trades."""
+    game = started_game(players, seed, state=None)
+    rng = random.Random(seed)
+    for _ in range(commands):
+        if not game.game_active:
+            break
+        nick = game.current_player()
+        if game.state == 'awaiting_actions':
+            game.players[nick].resources = new_hand([rng.randint(0, 6) for _ in range(5)])
+            if rng.random() < 0.3:
+                game.handle_command(nick, "!trade 2 wool 1 ore")
+                continue
+        game.handle_command(nick, rng.choice(legal_moves(game, nick)))
+    if game.game_active:
+        for nick in players:
+            game.trades.post(nick, 'wool', 2, 'ore', 1)  # Whoever's turn it is, so nothing matches
+    return game
+
+
+def described(game):
+    """Everything a snapshot should carry, in comparable form."""
+    players = dict((nick, (p.id, list(p.resources), sorted(p.roads), sorted(p.settlements),
+                           sorted(p.cities), p.victory_points, p.longest_road_length, p.has_longest_road))
+                   for nick, p in game.players.items())
+    board = game.board
+    return dict(
+        players=players, ready=sorted(game.ready_players), order=game.turn_order,
+        turn=game.current_turn_index, active=game.game_active, state=game.state,
+        robber=game.robber_tile, version=game.version, roll=game.last_roll,
+        pending=game.pending_rolls,
+        node_owners=board.node_owners, road_owners=board.hexmap.road_owners,
+        tile_buildings=board.tile_buildings,
+        board_players=sorted((i, p.nick) for i, p in board.players.items()),
+        offers=sorted((o.seq, o.nick) + o.terms() for mine in game.trades.by_nick.values() for o in mine),
+        trade_seq=game.trades.seq)
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_played_games_round_trip(self):
+        for seed, commands in [(seed, 60) for seed in range(6)] + [(6, 1000)]:
+            game = played_game(seed, commands)
+            data = snapshot.dumps(game)
+            copy = snapshot.loads(data)
+            self.assertEqual(described(copy), described(game))
+            self.assertEqual(snapshot.dumps(copy), data)
+            self.assertEqual(snapshot.checksum(copy), snapshot.checksum(game))
+            for nick, p in copy.players.items():
+                self.assertIs(copy.board.players[p.id], p)  # One record per player
+
+    def test_pieces_are_stored_once(self):
+        game = played_game(11, commands=300)
+        alice = game.players['alice']
+        size = len(snapshot.dumps(game))
+        for edge_id in sorted(game.board.hexmap.edge_to_tile)[:3]:
+            if edge_id not in game.board.hexmap.road_owners:
+                game.board.build_road(alice.id, edge_id)
+                size += 4  # One 32-bit id, in the game section only
+                self.assertEqual(len(snapshot.dumps(game)), size)
+
+    def test_restored_dice_continue(self):
+        game = played_game(7, commands=50)
+        copy = snapshot.loads(snapshot.dumps(game))
+        self.assertEqual([copy.roll_dice() for _ in range(20)], [game.roll_dice() for _ in range(20)])
+
+    def test_without_rng_or_trades(self):
+        game = played_game(8)
+        copy = snapshot.loads(snapshot.dumps(game, rng=False))
+        expected = described(game)
+        expected.update(offers=[], trade_seq=0)
+        self.assertEqual(described(copy), expected)
+
+    def test_more_than_255_pending_rolls(self):
+        game = seated_game(('alice',), seed=9)
+        game.pending_rolls = [2 + i % 11 for i in range(300)]
+        copy = snapshot.loads(snapshot.dumps(game))
+        self.assertEqual(copy.pending_rolls, game.pending_rolls)
+        self.assertEqual(copy.players['alice'].resources, game.players['alice'].resources)
+
+    def test_rejects_other_formats(self):
+        data = snapshot.dumps(played_game(10, commands=20))
+        magic, version, flags = struct.unpack_from("<4sBB", data)
+        older = struct.pack("<4sBB", magic, version - 1, flags) + data[6:]
+        self.assertRaises(ValueError, snapshot.loads, older)
+        self.assertRaises(ValueError, snapshot.loads, "XXXX" + data[4:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_spatial.py - HexMap's spatial queries against a scan of every tile
+
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from map import HexMap
+from topology import DIRECTIONS, cube_distance, cube_line, range_offsets, ring_offsets
+
+
+def default_map(radius):
+    hexmap = HexMap()
+    hexmap.generate_default_map(radius)
+    hexmap.build_nodes_and_edges()
+    return hexmap
+
+
+def irregular_map():
+    """A few tiles with no radius: the queries can't assume a hexagon."""
+    hexmap = HexMap()
+    for x, y, z, tile_type in [(0, 0, 0, 'land'), (1, -1, 0, 'land'), (2, -2, 0, 'sea'),
+                               (0, -2, 2, 'land'), (-3, 3, 0, 'sea')]:
+        hexmap.add_tile(x, y, z, tile_type)
+    hexmap.build_nodes_and_edges()
+    return hexmap
+
+
+def centres(hexmap, margin=2):
+    """Every tile, plus coords up to margin steps off the board."""
+    reach = max(cube_distance(c, (0, 0, 0)) for c in hexmap.tiles) + margin
+    return [(x, y, -x - y) for x in range(-reach, reach + 1) for y in range(-reach, reach + 1)
+            if abs(x + y) <= reach]
+
+
+def coords(tiles):
+    return [(t.x, t.y, t.z) for t in tiles]
+
+
+class OffsetTest(unittest.TestCase):
+    def test_rings(self):
+        for k in range(0, 8):
+            ring = ring_offsets(k)
+            self.assertEqual(len(ring), max(1, 6 * k))
+            self.assertEqual(len(set(ring)), len(ring))
+            for offset in ring:
+                self.assertEqual((sum(offset), cube_distance(offset, (0, 0, 0))), (0, k))
+            if k:
+                for a, b in zip(ring, ring[1:] + ring[:1]):
+                    self.assertEqual(cube_distance(a, b), 1)  # Walks round the ring
+        self.assertEqual(ring_offsets(0), [(0, 0, 0)])
+
+    def test_ranges(self):
+        for k in range(0, 8):
+            offsets = range_offsets(k)
+            self.assertEqual(len(offsets), 1 + 3 * k * (k + 1))
+            distances = [cube_distance(o, (0, 0, 0)) for o in offsets]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_lines(self):
+        points = [(x, y, -x - y) for x in range(-4, 5) for y in range(-4, 5)]
+        for a in points:
+            for b in points[::7]:
+                line = cube_line(a, b)
+                n = cube_distance(a, b)
+                self.assertEqual((line[0], line[-1], len(line)), (a, b, n + 1))
+                for i, c in enumerate(line):
+                    self.assertEqual(sum(c), 0)
+                    self.assertEqual((cube_distance(a, c), cube_distance(c, b)), (i, n - i))
+        # Along an axis the line is the axis itself
+        for dx, dy, dz in DIRECTIONS:
+            self.assertEqual(cube_line((0, 0, 0), (3 * dx, 3 * dy, 3 * dz)),
+                             [(i * dx, i * dy, i * dz) for i in range(4)])
+
+
+class QueryTest(unittest.TestCase):
+    def check_map(self, hexmap):
+        all_coords = sorted(hexmap.tiles)
+        for centre in centres(hexmap):
+            for k in range(0, 8):
+                scanned = [c for c in all_coords if cube_distance(c, centre) <= k]
+                within = coords(hexmap.tiles_within(centre, k))
+                self.assertEqual(sorted(within), scanned, (centre, k))
+                distances = [cube_distance(c, centre) for c in within]
+                self.assertEqual(distances, sorted(distances))  # Nearest first
+                ring = coords(hexmap.ring(centre, k))
+                self.assertEqual(sorted(ring), [c for c in all_coords if cube_distance(c, centre) == k])
+            for tile_type in ('land', 'sea', 'desert'):
+                matching = [c for c in all_coords if hexmap.tiles[c].tile_type == tile_type]
+                found = hexmap.nearest_tile(centre, tile_type)
+                if not matching:
+                    self.assertIsNone(found)
+                    continue
+                best = min(cube_distance(c, centre) for c in matching)
+                self.assertEqual(hexmap.tiles[(found.x, found.y, found.z)].tile_type, tile_type)
+                self.assertEqual(cube_distance((found.x, found.y, found.z), centre), best)
+                if best > 0:
+                    self.assertIsNone(hexmap.nearest_tile(centre, tile_type, best - 1))
+            for end in all_coords[::3]:
+                self.assertEqual(coords(hexmap.line(centre, end)),
+                                 [c for c in cube_line(centre, end) if c in hexmap.tiles])
+
+    def test_default_maps(self):
+        for radius in (0, 1, 3):
+            self.check_map(default_map(radius))
+
+    def test_irregular_map(self):
+        self.check_map(irregular_map())
+
+    def test_radius_zero(self):
+        hexmap = default_map(0)
+        self.assertEqual(coords(hexmap.tiles_within((0, 0, 0), 5)), [(0, 0, 0)])
+        self.assertEqual(coords(hexmap.ring((0, 0, 0), 0)), [(0, 0, 0)])
+        self.assertEqual(hexmap.ring((0, 0, 0), 1), [])
+        self.assertEqual(hexmap.nearest_tile((0, 0, 0), 'sea').tile_type, 'sea')
+        self.assertIsNone(hexmap.nearest_tile((0, 0, 0), 'land'))
+        self.assertEqual(coords(hexmap.ring((2, -2, 0), 2)), [(0, 0, 0)])
+
+    def test_edge_of_the_board(self):
+        hexmap = default_map(3)
+        corner = (3, -3, 0)
+        self.assertEqual(len(hexmap.tiles_within(corner, 1)), 4)  # Itself and three neighbours
+        far_side = coords(hexmap.ring(corner, 6))
+        self.assertEqual(len(far_side), 7)  # The two rim edges opposite, meeting at (-3, 3, 0)
+        self.assertTrue(all(x == -3 or y == 3 for x, y, _ in far_side))
+        self.assertEqual(hexmap.ring(corner, 7), [])
+        self.assertEqual(cube_distance(coords([hexmap.nearest_tile(corner, 'land')])[0], corner), 1)
+        off = (5, -5, 0)
+        self.assertEqual(hexmap.tiles_within(off, 1), [])
+        self.assertEqual(coords(hexmap.tiles_within(off, 2)), [corner])
+        self.assertEqual(coords(hexmap.line(off, (-3, 3, 0))), [(i, -i, 0) for i in range(3, -4, -1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_spectate.py - !board renders, their cache and the paced feed
+
+import gc
+import shutil
+import unittest
+
+from support import Event, ManualScheduler, join_game, new_host, seated_game
+
+from game import LONGEST_ROAD_POINTS
+from spectate import BOARD_VERB, BoardCache, BoardFeed, render_board
+
+
+class RenderTest(unittest.TestCase):
+    def test_shows_the_running_score(self):
+        game = seated_game()
+        alice = game.players['alice']
+        game.place_piece(alice, 'settlement', 0)
+        game.move_longest_road(None, alice)
+        line = [l for l in render_board(game) if l.startswith(BOARD_VERB + " alice:")][0]
+        self.assertIn(" {} VP,".format(1 + LONGEST_ROAD_POINTS), line)
+        self.assertTrue(all(l.startswith(BOARD_VERB + " ") for l in render_board(game)))
+
+
+class BoardCacheTest(unittest.TestCase):
+    def test_once_per_version(self):
+        game = seated_game()
+        cache = BoardCache()
+        first = cache.lines(game)
+        self.assertIs(cache.lines(game), first)
+        game.add_player('carol')
+        self.assertIsNot(cache.lines(game), first)
+        self.assertTrue(any("carol" in l for l in cache.lines(game)))
+
+    def test_new_game_at_the_same_version(self):
+        cache = BoardCache()
+        first = seated_game(seed=0)
+        cache.lines(first)
+        second = seated_game(seed=1)
+        second.players['alice'].victory_points = 5
+        self.assertEqual(second.version, first.version)
+        self.assertEqual(cache.lines(second), render_board(second))
+        self.assertNotEqual(cache.lines(second), render_board(first))
+
+    def test_holds_the_game_it_rendered(self):
+        # While the cache holds a game, no other game can be given its id()
+        cache = BoardCache()
+        game = seated_game(seed=0)
+        cache.lines(game)
+        self.assertIs(cache.game, game)
+        for seed in range(1, 10):
+            del game
+            gc.collect()
+            game = seated_game(seed=seed)
+            game.players['alice'].victory_points = seed
+            self.assertEqual(cache.lines(game), render_board(game))
+
+
+class BoardFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = ManualScheduler()
+        self.game = seated_game()
+        self.sent = []
+        self.feed = BoardFeed(lambda: self.game, lambda line: self.sent.append((self.scheduler.now, line)),
+                              self.scheduler.schedule, line_interval=0.5, min_interval=10.0,
+                              clock=self.scheduler.clock)
+
+    def test_requests_share_one_paced_send(self):
+        for nick in ('a', 'b', 'c', 'a'):
+            self.feed.request(nick)
+        self.scheduler.run_all()
+        lines = render_board(self.game)
+        self.assertEqual([l for _, l in self.sent], lines)
+        times = [t for t, _ in self.sent]
+        self.assertEqual(times, [0.5 * i for i in range(len(lines))])
+
+    def test_repeats_wait_for_min_interval(self):
+        self.feed.request('a')
+        self.scheduler.run_all()
+        end = self.sent[-1][0]
+        for _ in range(10):
+            self.feed.request('a')
+        self.scheduler.run_all()
+        self.assertEqual(len(self.sent), 2 * len(render_board(self.game)))
+        self.assertEqual(self.sent[len(self.sent) // 2][0], end + 10.0)
+
+
+class SpectatorTest(unittest.TestCase):
+    def setUp(self):
+        self.host, self.scheduler, self.connection = new_host('alice')
+        self.addCleanup(shutil.rmtree, self.host.state_dir, True)
+
+    def say(self, nick, msg):
+        self.host.on_pubmsg(None, Event('{0}!{0}@h'.format(nick), self.host.game_channel, msg))
+
+    def test_only_invited_nicks_are_seated(self):
+        join_game(self.host, 'alice')
+        join_game(self.host, 'bob')
+        self.host.on_join(None, Event('eve!eve@h', self.host.game_channel, ""))
+        self.assertEqual(sorted(self.host.game.players), ['alice', 'bob'])
+        self.assertEqual(self.connection.invites, [('alice', self.host.game_channel), ('bob', self.host.game_channel)])
+        self.say('eve', "!ready")
+        self.say('alice', "!ready")
+        self.say('bob', "!ready")
+        self.assertTrue(self.host.game.game_active)  # eve doesn't hold up the start
+        self.assertEqual(self.host.game.turn_order, ['alice', 'bob'])
+        self.assertIn("!join-first", self.connection.to(self.host.game_channel))
+        self.say('eve', BOARD_VERB)
+        self.scheduler.run_all()
+        self.assertEqual(self.connection.to(self.host.game_channel)[-len(render_board(self.host.game)):],
+                         render_board(self.host.game))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_topocheck.py - verify_topology() on big maps and on broken ones
+
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from map import HexMap
+from topocheck import verify_topology
+
+
+def built_map(radius):
+    hexmap = HexMap()
+    hexmap.generate_default_map(radius)
+    hexmap.build_nodes_and_edges()
+    return hexmap
+
+
+def neighbour_pairs(radius):
+    """Pairs of tiles sharing an edge in a hexagon of the given radius."""
+    return 3 * radius * (3 * radius + 1)
+
+
+class VerifyTopologyTest(unittest.TestCase):
+    def test_radius_100_passes(self):
+        hexmap = built_map(100)
+        report = verify_topology(hexmap)
+        self.assertTrue(report.ok, "\n".join(report.lines()))
+        self.assertEqual(report.tiles, 3 * 100 * 101 + 1)
+        self.assertEqual(report.pairs, neighbour_pairs(100))
+        self.assertEqual(report.nodes, hexmap.node_autoinc)
+        self.assertEqual(report.edges, hexmap.edge_autoinc)
+        self.assertEqual(report.lines()[0].split()[1], "ok:")
+
+    def test_small_maps_pass(self):
+        for radius in range(0, 6):
+            report = verify_topology(built_map(radius))
+            self.assertTrue(report.ok, "radius {}".format(radius))
+            self.assertEqual(report.pairs, neighbour_pairs(radius))
+
+    def test_bad_node_is_reported(self):
+        hexmap = built_map(3)
+        tile = hexmap.tiles[(0, 0, 0)]
+        tile.nodes[2] = hexmap.node_autoinc  # A node no neighbour knows about
+        report = verify_topology(hexmap)
+        self.assertFalse(report.ok)
+        self.assertEqual(report.edge_mismatches, [])
+        self.assertEqual(report.degenerate_edges, [])
+        # Node 2 ends edges 1 and 2, each shared with a neighbour
+        pairs = set()
+        for a, b, d in report.node_mismatches:
+            pairs.add(frozenset((a, b)))
+            self.assertIn((0, 0, 0), (a, b))
+        expected = set(frozenset(((0, 0, 0), (hexmap.directions[d][0], hexmap.directions[d][1],
+                                              hexmap.directions[d][2]))) for d in (1, 2))
+        self.assertEqual(pairs, expected)
+        self.assertEqual(report.lines()[0].split()[1], "BROKEN:")
+
+    def test_bad_edge_is_reported(self):
+        hexmap = built_map(3)
+        tile = hexmap.tiles[(0, 0, 0)]
+        tile.edges[4] = hexmap.edge_autoinc
+        report = verify_topology(hexmap)
+        self.assertEqual(report.node_mismatches, [])
+        self.assertEqual(report.degenerate_edges, [])
+        self.assertEqual(len(report.edge_mismatches), 1)
+        a, b, d = report.edge_mismatches[0]
+        dx, dy, dz = hexmap.directions[4]
+        self.assertEqual(set((a, b)), set([(0, 0, 0), (dx, dy, dz)]))
+        self.assertTrue(any("edge mismatch" in line for line in report.lines()))
+
+    def test_degenerate_edge_is_reported(self):
+        hexmap = built_map(2)
+        coord = (2, -2, 0)
+        tile = hexmap.tiles[coord]
+        tile.nodes[1] = tile.nodes[0]
+        report = verify_topology(hexmap)
+        self.assertFalse(report.ok)
+        self.assertIn((tile.edges[0], coord, 0), report.degenerate_edges)
+
+
+if __name__ == '__main__':
+    unittest.main()
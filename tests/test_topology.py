@@ -0,0 +1,112 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_topology.py - Closed-form node and edge ids against the enumeration
+# build_nodes_and_edges used before them
+
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from map import HexMap
+from topology import DIRECTIONS, HexTopology
+
+RADII = range(0, 13)
+
+
+def enumerated_ids(tiles, exact_corners=False):
+    """({coord: (edge ids, node ids)}, edges, nodes) the old way: shared
+    edges keyed by the sorted pair of tiles, corners by the frozenset of
+    tiles meeting there, and ids handed out in sorted tile order.
+
+    Off a full hexagon two tiles can share an edge with no third tile at
+    either end, and the old corner key then merges its two corners.
+    exact_corners keys a corner by the three hex positions around it,
+    present or not, which is what the closed form numbers.
+    """
+    def neighbour(coord, d):
+        dx, dy, dz = DIRECTIONS[d]
+        return (coord[0] + dx, coord[1] + dy, coord[2] + dz)
+
+    edge_ids, node_ids, ids = {}, {}, {}
+    for coord in sorted(tiles):
+        edges, nodes = [], []
+        for i in range(6):
+            other = neighbour(coord, i)
+            key = tuple(sorted([coord, other])) if other in tiles else (coord, i)
+            edges.append(edge_ids.setdefault(key, len(edge_ids)))
+        for i in range(6):
+            around = [coord, neighbour(coord, (i - 1) % 6), neighbour(coord, i)]
+            meeting = [t for t in around if t in tiles]
+            if exact_corners:
+                key = frozenset(around)
+            else:
+                key = (coord, i) if len(meeting) == 1 else frozenset(meeting)
+            nodes.append(node_ids.setdefault(key, len(node_ids)))
+        ids[coord] = (edges, nodes)
+    return ids, len(edge_ids), len(node_ids)
+
+
+def default_map(radius):
+    hexmap = HexMap()
+    hexmap.generate_default_map(radius)
+    hexmap.build_nodes_and_edges()
+    return hexmap
+
+
+class ClosedFormTest(unittest.TestCase):
+    def test_same_ids_as_the_enumeration(self):
+        for radius in RADII:
+            hexmap = default_map(radius)
+            expected, edges, nodes = enumerated_ids(hexmap.tiles)
+            self.assertEqual((hexmap.edge_autoinc, hexmap.node_autoinc), (edges, nodes), radius)
+            for coord, tile in hexmap.tiles.iteritems():
+                self.assertEqual((tile.edges, tile.nodes), expected[coord], (radius, coord))
+
+    def test_forward_and_inverse(self):
+        for radius in RADII:
+            hexmap = default_map(radius)
+            topology = HexTopology(radius)
+            self.assertEqual((topology.edge_count, topology.node_count),
+                             (hexmap.edge_autoinc, hexmap.node_autoinc))
+            for (x, y, z), tile in hexmap.tiles.iteritems():
+                for i in range(6):
+                    self.assertEqual(topology.edge_id(x, y, i), tile.edges[i])
+                    self.assertEqual(topology.node_id(x, y, i), tile.nodes[i])
+            for edge_id in range(topology.edge_count):
+                coord, i = topology.edge_tile(edge_id)
+                self.assertEqual(hexmap.tiles[coord].edges[i], edge_id)
+                self.assertEqual(hexmap.edge_to_tile[edge_id], (coord, i))
+                self.assertEqual(topology.edge_nodes(edge_id),
+                                 (hexmap.tiles[coord].nodes[i], hexmap.tiles[coord].nodes[(i + 1) % 6]))
+            for node_id in range(topology.node_count):
+                coord, i = topology.node_tile(node_id)
+                self.assertEqual(hexmap.tiles[coord].nodes[i], node_id)
+            self.assertEqual(list(hexmap.edge_to_tile), range(topology.edge_count))
+            self.assertNotIn(topology.edge_count, hexmap.edge_to_tile)
+            self.assertRaises(KeyError, topology.node_tile, topology.node_count)
+
+    def test_irregular_map_matches_the_enumeration(self):
+        hexmap = HexMap()
+        for x, y, z in [(0, 0, 0), (1, -1, 0), (1, 0, -1), (-1, 1, 0), (2, -1, -1), (0, 2, -2), (-3, 1, 2)]:
+            hexmap.add_tile(x, y, z)
+        hexmap.build_nodes_and_edges()
+        expected, edges, nodes = enumerated_ids(hexmap.tiles, exact_corners=True)
+        self.assertEqual((hexmap.edge_autoinc, hexmap.node_autoinc), (edges, nodes))
+        for coord, tile in hexmap.tiles.iteritems():
+            self.assertEqual((tile.edges, tile.nodes), expected[coord], coord)
+        # (0,0,0) and (-1,1,0) share an edge with no tile at either end
+        self.assertEqual(enumerated_ids(hexmap.tiles)[2], nodes - 1)
+
+    def test_exact_corners_agree_on_full_maps(self):
+        for radius in RADII:
+            tiles = default_map(radius).tiles
+            self.assertEqual(enumerated_ids(tiles, exact_corners=True), enumerated_ids(tiles))
+
+
+if __name__ == '__main__':
+    unittest.main()
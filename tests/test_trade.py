@@ -0,0 +1,150 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# test_trade.py - The trade book and !trade matching between players
+
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from support import started_game
+
+from player import RESOURCE_INDEX, new_hand
+from trade import BANK_RATIO, GENERIC_PORT_RATIO, PORT_RATIO, TradeBook, trade_ratios
+
+NICKS = ('alice', 'bob', 'carol')
+
+
+def hand(**counts):
+    return new_hand([counts.get(r, 0) for r in ('brick', 'lumber', 'wool', 'grain', 'ore')])
+
+
+class TradeBookTest(unittest.TestCase):
+    def test_match_takes_the_oldest_acceptable(self):
+        book = TradeBook()
+        first, _ = book.post('bob', 'wool', 2, 'ore', 1)
+        second, _ = book.post('carol', 'wool', 2, 'ore', 1)
+        terms = ('wool', 2, 'ore', 1)
+        self.assertIs(book.match(terms, lambda o: True), first)
+        self.assertIs(book.match(terms, lambda o: o.nick == 'carol'), second)
+        self.assertIsNone(book.match(('wool', 1, 'ore', 1), lambda o: True))
+
+    def test_per_player_limit_evicts_the_oldest(self):
+        book = TradeBook(max_per_player=2)
+        a, _ = book.post('bob', 'wool', 1, 'ore', 1)
+        b, _ = book.post('bob', 'wool', 2, 'ore', 1)
+        c, evicted = book.post('bob', 'wool', 3, 'ore', 1)
+        self.assertIs(evicted, a)
+        self.assertEqual(book.offers_of('bob'), [b, c])
+        self.assertIsNone(book.match(a.terms(), lambda o: True))
+        book.unpost(c, evicted)
+        self.assertEqual(book.offers_of('bob'), [a, b])
+        self.assertEqual(book.seq, 2)
+
+    def test_withdraw_and_restore_keep_order(self):
+        book = TradeBook()
+        offers = [book.post('bob', 'wool', 1, 'ore', 1)[0], book.post('carol', 'wool', 1, 'ore', 1)[0],
+                  book.post('bob', 'grain', 1, 'ore', 1)[0]]
+        book.withdraw(offers[0])
+        self.assertEqual(len(book), 2)
+        book.restore(offers[0])
+        self.assertEqual(book.by_terms[('wool', 1, 'ore', 1)], offers[:2])
+        self.assertEqual(book.offers_of('bob'), [offers[0], offers[2]])
+        for offer in offers:
+            book.withdraw(offer)
+        self.assertFalse(book)
+        self.assertEqual((book.by_terms, book.by_nick), ({}, {}))
+
+    def test_ratios(self):
+        ports = {1: None, 2: 'ore'}
+        resources = ['wool', 'ore']
+        self.assertEqual(trade_ratios([5], ports, resources), {'wool': BANK_RATIO, 'ore': BANK_RATIO})
+        self.assertEqual(trade_ratios([1], ports, resources), {'wool': GENERIC_PORT_RATIO, 'ore': GENERIC_PORT_RATIO})
+        self.assertEqual(trade_ratios([1, 2], ports, resources), {'wool': GENERIC_PORT_RATIO, 'ore': PORT_RATIO})
+
+
+class GameTradeTest(unittest.TestCase):
+    def setUp(self):
+        # alice on turn, everyone holding 3 of each
+        self.game = started_game(NICKS)
+        self.players = self.game.players
+        for p in self.players.values():
+            p.resources = new_hand([3] * 5)
+
+    def trade(self, nick, msg):
+        return self.game.handle_command(nick, msg)
+
+    def test_counter_offer_trades(self):
+        self.assertEqual(self.trade('bob', "!trade 2 wool 1 ore"), ["!trade-offer bob 2 wool 1 ore"])
+        self.assertEqual(self.trade('alice', "!trade 1 ore 2 wool"), ["!traded alice 1 ore bob 2 wool"])
+        self.assertEqual(list(self.players['alice'].resources), [3, 3, 5, 3, 2])
+        self.assertEqual(list(self.players['bob'].resources), [3, 3, 1, 3, 4])
+        self.assertFalse(self.game.trades)
+        self.assertEqual(self.game.take_deltas(),
+                         ["$:alice:3,3,5,3,2", "$:bob:3,3,1,3,4"])
+
+    def test_only_with_the_player_on_turn(self):
+        self.trade('bob', "!trade 2 wool 1 ore")
+        self.assertEqual(self.trade('carol', "!trade 1 ore 2 wool"), ["!trade-offer carol 1 ore 2 wool"])
+        self.assertEqual(len(self.game.trades), 2)
+        # alice's turn: her offer meets carol's standing one
+        self.assertEqual(self.trade('alice', "!trade 2 wool 1 ore"), ["!traded alice 2 wool carol 1 ore"])
+
+    def test_maker_must_still_afford_it(self):
+        self.trade('bob', "!trade 2 wool 1 ore")
+        self.players['bob'].resources = hand(ore=3)
+        self.assertEqual(self.trade('alice', "!trade 1 ore 2 wool"), ["!trade-offer alice 1 ore 2 wool"])
+        self.assertEqual(list(self.players['alice'].resources), [3] * 5)
+
+    def test_taker_must_afford_it(self):
+        self.players['bob'].resources = hand(wool=1)
+        self.assertEqual(self.trade('bob', "!trade 2 wool 1 ore"), ["!cannot-afford trade"])
+        self.assertFalse(self.game.trades)
+
+    def test_repeat_is_not_a_new_offer(self):
+        self.trade('bob', "!trade 2 wool 1 ore")
+        self.trade('bob', "!trade 2 wool 1 ore")
+        self.assertEqual(len(self.game.trades), 1)
+
+    def test_cancel_and_expiry(self):
+        self.trade('bob', "!trade 2 wool 1 ore")
+        self.trade('bob', "!trade 2 grain 1 ore")
+        self.assertEqual(self.trade('bob', "!trade cancel"), ["!trade-cancelled bob 2"])
+        self.trade('carol', "!trade 2 wool 1 ore")
+        self.trade('alice', "!pass")
+        self.assertFalse(self.game.trades)
+
+    def test_bank(self):
+        self.assertEqual(self.trade('bob', "!trade bank wool ore"), ["!not-your-turn bob"])
+        self.players['alice'].resources = hand(wool=BANK_RATIO)
+        self.assertEqual(self.trade('alice', "!trade bank wool ore"),
+                         ["!traded alice {} wool bank 1 ore".format(BANK_RATIO)])
+        self.assertEqual(list(self.players['alice'].resources), [0, 0, 0, 0, 1])
+        self.assertEqual(self.trade('alice', "!trade bank wool ore"), ["!cannot-afford trade"])
+
+    def test_harbour_ratio(self):
+        alice = self.players['alice']
+        self.game.ports = {20: 'wool'}
+        self.assertEqual(self.game.trade_ratio(alice, 'wool'), BANK_RATIO)
+        self.game.place_piece(alice, 'settlement', 20)  # Drops the cached ratios
+        self.assertEqual(self.game.trade_ratio(alice, 'wool'), PORT_RATIO)
+        alice.resources = hand(wool=PORT_RATIO)
+        self.assertEqual(self.trade('alice', "!trade bank wool ore")[0],
+                         "!traded alice {} wool bank 1 ore".format(PORT_RATIO))
+        self.assertEqual(alice.resources[RESOURCE_INDEX['ore']], 1)
+
+    def test_usage(self):
+        for msg in ("!trade 2 wool 1 wool", "!trade 0 wool 1 ore", "!trade 100 wool 1 ore",
+                    "!trade bank wool", "!trade 2 gold 1 ore"):
+            self.assertEqual(self.trade('alice', msg), ["!usage-trade"], msg)
+
+    def test_join_first(self):
+        self.assertEqual(self.trade('mallory', "!trade 2 wool 1 ore"), ["!join-first"])
+
+
+if __name__ == '__main__':
+    unittest.main()
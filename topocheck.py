@@ -0,0 +1,128 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# topocheck.py - Vectorized consistency checks of a built HexMap
+#
+# map.verify_node_id_consistency() and friends walk every tile pair in
+# Python and print to the curses terminal, which is fine for eyeballing a
+# map in draw_map() but far too slow and too chatty to run on a radius-100
+# map in a script or at host startup. verify_topology() runs the same three
+# checks as NumPy array comparisons over the tiles' node and edge tables and
+# returns a TopologyReport instead:
+#
+#   node_mismatches   neighbours whose shared edge has different end nodes
+#   edge_mismatches   neighbours that disagree on the id of their shared edge
+#   degenerate_edges  edges whose two end nodes are the same node
+#
+# NumPy is imported on first use so that nothing importing this module pays
+# for it at startup.
+
+import itertools
+
+
+class TopologyReport(object):
+    """What verify_topology() found; ok when every list is empty.
+
+    Mismatches are (tile coord, neighbour coord, edge index) with the
+    neighbour across that edge, each pair once. Degenerate edges are
+    (edge id, tile coord, edge index).
+    """
+
+    def __init__(self, tiles, edges, nodes, pairs):
+        self.tiles = tiles
+        self.edges = edges
+        self.nodes = nodes
+        self.pairs = pairs  # Neighbouring tile pairs checked
+        self.node_mismatches = []
+        self.edge_mismatches = []
+        self.degenerate_edges = []
+
+    @property
+    def ok(self):
+        return not (self.node_mismatches or self.edge_mismatches or self.degenerate_edges)
+
+    def lines(self, limit=10):
+        """A summary line and at most limit lines per kind of problem."""
+        lines = ["topology {}: {} tiles, {} edges, {} nodes, {} neighbour pairs".format(
+            "ok" if self.ok else "BROKEN", self.tiles, self.edges, self.nodes, self.pairs)]
+        for name, problems in (("node mismatch", self.node_mismatches),
+                               ("edge mismatch", self.edge_mismatches)):
+            for tile, neighbour, edge_idx in problems[:limit]:
+                lines.append("  {} between {} and {} at edge {}".format(name, tile, neighbour, edge_idx))
+        for edge_id, tile, edge_idx in self.degenerate_edges[:limit]:
+            lines.append("  degenerate edge {} on {} at index {}".format(edge_id, tile, edge_idx))
+        hidden = sum(max(0, len(p) - limit) for p in
+                     (self.node_mismatches, self.edge_mismatches, self.degenerate_edges))
+        if hidden:
+            lines.append("  ... and {} more".format(hidden))
+        return lines
+
+
+def topology_arrays(hexmap):
+    """(coords, nodes, edges, neighbours) of hexmap as arrays, one row per tile.
+
+    Rows follow hexmap.tiles' iteration order. neighbours[t, d] is the row
+    of the tile in direction d of tile t (across its edge d), or -1.
+    """
+    import numpy
+    count = len(hexmap.tiles)
+    order = hexmap.tiles.keys()
+    tiles = hexmap.tiles.values()
+
+    # fromiter over a flat stream is several times faster than array() of lists
+    def table(rows, width):
+        flat = itertools.chain.from_iterable(rows)
+        return numpy.fromiter(flat, dtype=numpy.int64, count=count * width).reshape(count, width)
+
+    coords = table(order, 3)
+    nodes = table((tile.nodes for tile in tiles), 6)
+    edges = table((tile.edges for tile in tiles), 6)
+
+    # Dense (x, y) grid of row numbers with a border of -1, so a step off
+    # the map lands on "no tile" instead of out of bounds
+    lo = coords[:, :2].min(axis=0) - 1
+    grid = numpy.full(coords[:, :2].max(axis=0) - lo + 2, -1, dtype=numpy.int64)
+    x = coords[:, 0] - lo[0]
+    y = coords[:, 1] - lo[1]
+    grid[x, y] = numpy.arange(len(tiles))
+    neighbours = numpy.empty((len(tiles), 6), dtype=numpy.int64)
+    for d, (dx, dy, _) in enumerate(hexmap.directions):
+        neighbours[:, d] = grid[x + dx, y + dy]
+    return coords, nodes, edges, neighbours
+
+
+def verify_topology(hexmap):
+    """Check a map built by build_nodes_and_edges; returns a TopologyReport."""
+    import numpy  # Slow to import; only pay for it when a map is checked
+    report = TopologyReport(len(hexmap.tiles), hexmap.edge_autoinc, hexmap.node_autoinc, 0)
+    if not hexmap.tiles:
+        return report
+    coords, nodes, edges, neighbours = topology_arrays(hexmap)
+
+    def coord(row):
+        return tuple(coords[row].tolist())
+
+    # Directions 0..2 see every neighbouring pair once; 3..5 are the same
+    # pairs from the other side
+    for d in range(3):
+        rows = numpy.nonzero(neighbours[:, d] >= 0)[0]
+        other = neighbours[rows, d]
+        opp = (d + 3) % 6
+        report.pairs += len(rows)
+
+        # Walking the shared edge from either tile meets its ends in opposite order
+        bad = ((nodes[rows, d] != nodes[other, (opp + 1) % 6]) |
+               (nodes[rows, (d + 1) % 6] != nodes[other, opp]))
+        for i in numpy.nonzero(bad)[0].tolist():
+            report.node_mismatches.append((coord(rows[i]), coord(other[i]), d))
+
+        bad = edges[rows, d] != edges[other, opp]
+        for i in numpy.nonzero(bad)[0].tolist():
+            report.edge_mismatches.append((coord(rows[i]), coord(other[i]), d))
+
+    # A shared edge shows up on both of its tiles; report it once, on the first
+    rows, idx = numpy.nonzero(nodes == numpy.roll(nodes, -1, axis=1))
+    ids, first = numpy.unique(edges[rows, idx], return_index=True)
+    for edge_id, i in zip(ids.tolist(), first.tolist()):
+        report.degenerate_edges.append((edge_id, coord(rows[i]), int(idx[i])))
+    return report
@@ -0,0 +1,310 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# topology.py - Closed-form node and edge ids for hexagonal maps
+#
+# Ids are handed out the way build_nodes_and_edges always has for edges:
+# walk the tiles in sorted (x, y, z) order, look at edges 0..5 (and corners
+# 0..5) of each, and give the next id to every one not seen on an earlier
+# tile. An edge or corner therefore belongs to the earliest tile touching
+# it, and only three directions lead to earlier tiles:
+#
+#   EDGE_SE (0,-1,+1)  EDGE_SW (-1,0,+1)  EDGE_W (-1,+1,0)
+#
+# EDGE_OWNER and NODE_OWNERS below say which neighbour, if present, owns a
+# tile's edge or corner and under which index. Everything else is owned by
+# the tile itself.
+#
+# On a hexagon of radius R the tiles a column (fixed x) owns follow a fixed
+# pattern: the first tile of the column owns a few extra pieces on the
+# rim, the ones in between own 3 edges and 2 corners, and the last one may
+# own one more. So the id of the first piece of any column, of any tile and
+# of any (tile, index) is arithmetic. HexTopology does that arithmetic:
+# node_id()/edge_id() are O(1) and need no tables, and
+# node_tile()/edge_tile() invert them with a binary search over the 2R+1
+# columns.
+#
+# The cube geometry HexMap's spatial queries are built on lives here too:
+# ring_offsets(k) and range_offsets(k) are computed once per k and shared,
+# so asking for the tiles around a coordinate costs what the answer costs.
+
+import collections
+
+# edge index -> (direction of the earlier neighbour that owns it, its edge index there)
+EDGE_OWNER = {2: (2, 5), 3: (3, 0), 4: (4, 1)}
+
+# corner index -> [(direction, corner index there), ...], earliest neighbour first
+NODE_OWNERS = {
+    0: [],
+    1: [],
+    2: [(2, 0)],
+    3: [(3, 1), (2, 5)],
+    4: [(3, 0), (4, 2)],
+    5: [(4, 1)],
+}
+
+DIRECTIONS = [(1, 0, -1), (1, -1, 0), (0, -1, 1), (-1, 0, 1), (-1, 1, 0), (0, 1, -1)]
+
+
+def cube_distance(a, b):
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]), abs(a[2] - b[2]))
+
+
+_rings = {0: [(0, 0, 0)]}
+_ranges = {}
+
+def ring_offsets(k):
+    """Offsets at distance exactly k, walking the ring from (-k, k, 0)."""
+    offsets = _rings.get(k)
+    if offsets is None:
+        x, y, z = -k, k, 0
+        offsets = []
+        for dx, dy, dz in DIRECTIONS:
+            for _ in xrange(k):
+                offsets.append((x, y, z))
+                x, y, z = x + dx, y + dy, z + dz
+        _rings[k] = offsets
+    return offsets
+
+
+def range_offsets(k):
+    """Offsets at distance 0..k, nearest rings first."""
+    offsets = _ranges.get(k)
+    if offsets is None:
+        offsets = []
+        for i in xrange(k + 1):
+            offsets.extend(ring_offsets(i))
+        _ranges[k] = offsets
+    return offsets
+
+
+def cube_line(a, b):
+    """Cube coordinates on the straight line from a to b, both included."""
+    n = cube_distance(a, b)
+    if n == 0:
+        return [tuple(a)]
+    # Nudged off the midpoints so ties between two hexes always break the same way
+    ax, ay, az = a[0] + 1e-6, a[1] + 2e-6, a[2] - 3e-6
+    bx, by, bz = b[0] + 1e-6, b[1] + 2e-6, b[2] - 3e-6
+    line = []
+    for i in xrange(n + 1):
+        t = float(i) / n
+        fx, fy, fz = ax + (bx - ax) * t, ay + (by - ay) * t, az + (bz - az) * t
+        rx, ry, rz = int(round(fx)), int(round(fy)), int(round(fz))
+        # Rounding can break x + y + z == 0; fix the coordinate that moved most
+        ex, ey, ez = abs(rx - fx), abs(ry - fy), abs(rz - fz)
+        if ex > ey and ex > ez:
+            rx = -ry - rz
+        elif ey > ez:
+            ry = -rx - rz
+        else:
+            rz = -rx - ry
+        line.append((rx, ry, rz))
+    return line
+
+
+def owned_edges(se_missing, sw_missing, w_missing):
+    """Edge indices a tile owns, given which earlier neighbours are missing."""
+    edges = [0, 1]
+    if se_missing:
+        edges.append(2)
+    if sw_missing:
+        edges.append(3)
+    if w_missing:
+        edges.append(4)
+    edges.append(5)
+    return edges
+
+
+def owned_nodes(se_missing, sw_missing, w_missing):
+    """Corner indices a tile owns, given which earlier neighbours are missing."""
+    nodes = [0, 1]
+    if se_missing:
+        nodes.append(2)
+        if sw_missing:
+            nodes.append(3)
+    if sw_missing and w_missing:
+        nodes.append(4)
+    if w_missing:
+        nodes.append(5)
+    return nodes
+
+
+class HexTopology(object):
+    """Node and edge ids of the default hexagonal map of one radius."""
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.tile_count = 3 * radius * (radius + 1) + 1
+        self.edge_count = self._edges_before(radius + 1)
+        self.node_count = self._nodes_before(radius + 1)
+
+    # --- Columns and tiles
+
+    def contains(self, x, y):
+        r = self.radius
+        return -r <= x <= r and -r <= y <= r and -r <= x + y <= r
+
+    def column(self, x):
+        """(lowest y, tile count) of column x."""
+        r = self.radius
+        if x < 0:
+            return -r - x, 2 * r + 1 + x
+        return -r, 2 * r + 1 - x
+
+    def _tiles_before(self, x):
+        r = self.radius
+        if x <= 0:
+            k = x + r
+            return k * (2 * r + 1) + k * (x - 1 - r) // 2
+        return self._tiles_before(0) + x * (2 * r + 1) - x * (x - 1) // 2
+
+    def missing(self, x, y):
+        """(SE, SW, W) neighbours of tile (x, y) that are off the map."""
+        r = self.radius
+        lo = -r - x if x < 0 else -r
+        if x == -r:
+            return y == lo, True, True
+        if x <= 0:
+            return y == lo, y == lo, y == r
+        return y == lo, False, False
+
+    # Tiles of a column: the first one, the ones after it, and column totals.
+    # The extra rim pieces are: column -R: 2R+3 edges and 2R+4 corners
+    # beyond 3 and 2 per tile; columns -R+1..0: 3 and 3; columns 1..R: 1 and 1.
+
+    def _extras_before(self, x, first_column):
+        r = self.radius
+        if x <= -r:
+            return 0
+        middle = max(0, min(x - 1, 0) + r)
+        right = max(0, x - 1)
+        return first_column + 3 * middle + right
+
+    def _edges_before(self, x):
+        return 3 * self._tiles_before(x) + self._extras_before(x, 2 * self.radius + 3)
+
+    def _nodes_before(self, x):
+        return 2 * self._tiles_before(x) + self._extras_before(x, 2 * self.radius + 4)
+
+    def _offset(self, x, row, owned):
+        """Pieces owned by the tiles above row in column x."""
+        if row == 0:
+            return 0
+        lo, _ = self.column(x)
+        first = len(owned(*self.missing(x, lo)))
+        inner = len(owned(*self.missing(x, lo + 1)))
+        return first + (row - 1) * inner
+
+    # --- Forward: (tile, index) -> id
+
+    def edge_id(self, x, y, edge_idx):
+        if edge_idx in EDGE_OWNER:
+            direction, owner_idx = EDGE_OWNER[edge_idx]
+            dx, dy, _ = DIRECTIONS[direction]
+            if self.contains(x + dx, y + dy):
+                x, y, edge_idx = x + dx, y + dy, owner_idx
+        lo, _ = self.column(x)
+        owned = owned_edges(*self.missing(x, y))
+        return self._edges_before(x) + self._offset(x, y - lo, owned_edges) + owned.index(edge_idx)
+
+    def node_id(self, x, y, corner):
+        for direction, owner_corner in NODE_OWNERS[corner]:
+            dx, dy, _ = DIRECTIONS[direction]
+            if self.contains(x + dx, y + dy):
+                x, y, corner = x + dx, y + dy, owner_corner
+                break
+        lo, _ = self.column(x)
+        owned = owned_nodes(*self.missing(x, y))
+        return self._nodes_before(x) + self._offset(x, y - lo, owned_nodes) + owned.index(corner)
+
+    # --- Inverse: id -> (owning tile, index)
+
+    def _locate(self, piece_id, before, owned):
+        lo_x, hi_x = -self.radius, self.radius
+        while lo_x < hi_x:
+            mid = (lo_x + hi_x + 1) // 2
+            if before(mid) <= piece_id:
+                lo_x = mid
+            else:
+                hi_x = mid - 1
+        x = lo_x
+        offset = piece_id - before(x)
+        lo, count = self.column(x)
+        first = len(owned(*self.missing(x, lo)))
+        if offset < first:
+            row = 0
+        else:
+            inner = len(owned(*self.missing(x, lo + 1)))
+            row = min(count - 1, 1 + (offset - first) // inner)
+        offset -= self._offset(x, row, owned)
+        y = lo + row
+        return (x, y, -x - y), owned(*self.missing(x, y))[offset]
+
+    def edge_tile(self, edge_id):
+        """(tile coord, edge index) of the tile that owns edge_id."""
+        if not 0 <= edge_id < self.edge_count:
+            raise KeyError(edge_id)
+        return self._locate(edge_id, self._edges_before, owned_edges)
+
+    def node_tile(self, node_id):
+        """(tile coord, corner index) of the tile that owns node_id."""
+        if not 0 <= node_id < self.node_count:
+            raise KeyError(node_id)
+        return self._locate(node_id, self._nodes_before, owned_nodes)
+
+    def iter_edges(self):
+        """(tile coord, edge index) of every edge's owner, in id order."""
+        r = self.radius
+        missing = self.missing
+        owned = {}  # Only a handful of (SE, SW, W) combinations occur
+        for x in xrange(-r, r + 1):
+            lo, count = self.column(x)
+            for y in xrange(lo, lo + count):
+                key = missing(x, y)
+                indices = owned.get(key)
+                if indices is None:
+                    indices = owned[key] = owned_edges(*key)
+                coord = (x, y, -x - y)
+                for edge_idx in indices:
+                    yield coord, edge_idx
+
+    def edge_nodes(self, edge_id):
+        """The two node ids at the ends of edge_id."""
+        (x, y, _), edge_idx = self.edge_tile(edge_id)
+        return self.node_id(x, y, edge_idx), self.node_id(x, y, (edge_idx + 1) % 6)
+
+
+class EdgeIndex(collections.Mapping):
+    """HexMap.edge_to_tile for a default map: edge id -> (tile coord, edge index),
+    answered by HexTopology instead of stored."""
+
+    def __init__(self, topology):
+        self.topology = topology
+
+    def __getitem__(self, edge_id):
+        if not isinstance(edge_id, (int, long)):
+            raise KeyError(edge_id)
+        return self.topology.edge_tile(edge_id)
+
+    def __contains__(self, edge_id):
+        return isinstance(edge_id, (int, long)) and 0 <= edge_id < self.topology.edge_count
+
+    def __iter__(self):
+        return iter(xrange(self.topology.edge_count))
+
+    def __len__(self):
+        return self.topology.edge_count
+
+    # Walk the columns instead of inverting every id
+    def iteritems(self):
+        return enumerate(self.topology.iter_edges())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def itervalues(self):
+        return self.topology.iter_edges()
+
+    def values(self):
+        return list(self.itervalues())
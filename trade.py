@@ -0,0 +1,129 @@
+# -*- coding: cp437 -*-
+# python 2.7 only
+
+# trade.py - Open trade offers between players for one turn
+#
+#   !trade 2 wool 1 ore      offer 2 wool for 1 ore, or take a matching offer
+#   !trade bank wool ore     trade wool for 1 ore at your bank/harbour ratio
+#   !trade cancel            withdraw your open offers
+#
+# Offers are filed under their exact terms (give, give n, want, want n), so
+# the counter-offer to a new offer is one dict lookup away, and under their
+# maker. Each player keeps at most MAX_OFFERS_PER_PLAYER open offers (a new
+# one pushes out their oldest) and repeating an open offer does nothing, so
+# a player spamming offers can't grow the book or slow down matching. The
+# whole book is dropped at the end of the turn.
+#
+# Every change is reversible (post/withdraw/restore) so GameState.make_move
+# can take trades back like any other move.
+
+MAX_OFFERS_PER_PLAYER = 5
+BANK_RATIO = 4
+GENERIC_PORT_RATIO = 3
+PORT_RATIO = 2
+
+
+class Offer(object):
+    __slots__ = ('seq', 'nick', 'give', 'give_n', 'want', 'want_n')
+
+    def __init__(self, seq, nick, give, give_n, want, want_n):
+        self.seq = seq
+        self.nick = nick
+        self.give = give
+        self.give_n = give_n
+        self.want = want
+        self.want_n = want_n
+
+    def terms(self):
+        return (self.give, self.give_n, self.want, self.want_n)
+
+    def describe(self):
+        return "{} {} {} {} {}".format(self.nick, self.give_n, self.give, self.want_n, self.want)
+
+
+def _insert_by_seq(offers, offer):
+    i = len(offers)
+    while i and offers[i - 1].seq > offer.seq:
+        i -= 1
+    offers.insert(i, offer)
+
+
+class TradeBook(object):
+    def __init__(self, max_per_player=MAX_OFFERS_PER_PLAYER):
+        self.max_per_player = max_per_player
+        self.by_terms = {}  # terms -> open offers on those terms, oldest first
+        self.by_nick = {}   # nick -> their open offers, oldest first
+        self.seq = 0
+
+    def __len__(self):
+        return sum(len(offers) for offers in self.by_nick.itervalues())
+
+    def __nonzero__(self):
+        return bool(self.by_nick)
+
+    def find(self, nick, terms):
+        for offer in self.by_nick.get(nick, ()):
+            if offer.terms() == terms:
+                return offer
+        return None
+
+    def match(self, terms, accept):
+        """Oldest open offer on terms that accept(offer) agrees to, or None."""
+        for offer in self.by_terms.get(terms, ()):
+            if accept(offer):
+                return offer
+        return None
+
+    def post(self, nick, give, give_n, want, want_n):
+        """File a new offer; returns (offer, the offer it pushed out or None)."""
+        self.seq += 1
+        offer = Offer(self.seq, nick, give, give_n, want, want_n)
+        evicted = None
+        mine = self.by_nick.get(nick)
+        if mine and len(mine) >= self.max_per_player:
+            evicted = mine[0]
+            self.withdraw(evicted)
+        self.restore(offer)
+        return offer, evicted
+
+    def unpost(self, offer, evicted):
+        """Take back the post() that returned (offer, evicted)."""
+        self.withdraw(offer)
+        if evicted is not None:
+            self.restore(evicted)
+        self.seq = offer.seq - 1
+
+    def withdraw(self, offer):
+        terms = offer.terms()
+        offers = self.by_terms[terms]
+        offers.remove(offer)
+        if not offers:
+            del self.by_terms[terms]
+        mine = self.by_nick[offer.nick]
+        mine.remove(offer)
+        if not mine:
+            del self.by_nick[offer.nick]
+
+    def restore(self, offer):
+        """Put a withdrawn offer back where its seq says it belongs."""
+        _insert_by_seq(self.by_terms.setdefault(offer.terms(), []), offer)
+        _insert_by_seq(self.by_nick.setdefault(offer.nick, []), offer)
+
+    def offers_of(self, nick):
+        return list(self.by_nick.get(nick, ()))
+
+
+def trade_ratios(settlement_nodes, ports, resources):
+    """{resource: how many of it the bank takes for one card} for a player
+    with buildings on settlement_nodes. ports maps a harbour node to the
+    resource it trades 2:1, or None for a 3:1 harbour."""
+    generic = BANK_RATIO
+    special = set()
+    for node in settlement_nodes:
+        if node in ports:
+            resource = ports[node]
+            if resource is None:
+                generic = GENERIC_PORT_RATIO
+            else:
+                special.add(resource)
+    return dict((r, PORT_RATIO if r in special else generic) for r in resources)
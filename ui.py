@@ -5,6 +5,8 @@
 
 
 import sys
+
+import metrics
 from terminal import Terminal
 
 class UI(object):
@@ -34,9 +36,11 @@ class UI(object):
         return responses
 
     def add_message(self, msg):
+        metrics.count('ui.messages')
         self.chat_history.append(msg)
         if len(self.chat_history) > self.max_history:
             self.chat_history.pop(0)
+        metrics.gauge('ui.chat_history', len(self.chat_history))
         if hasattr(self, 'terminal'):
             self.draw_chat()  # Only redraw chat when new message arrives
 
@@ -125,6 +129,10 @@ class UI(object):
         
     def draw_chat(self):
         """Draw only the chat area"""
+        with metrics.timer('ui.frame'):
+            self._draw_chat()
+
+    def _draw_chat(self):
         height, width = self.terminal.gettermsize()
         blank = " " * (width - 1)
         
@@ -149,6 +157,10 @@ class UI(object):
 
     def draw_prompt(self, input_buffer=""):
         """Draw only the input prompt line"""
+        with metrics.timer('ui.prompt_frame'):
+            self._draw_prompt(input_buffer)
+
+    def _draw_prompt(self, input_buffer):
         height, width = self.terminal.gettermsize()
         blank = " " * (width - 1)
         